@@ -0,0 +1,222 @@
+# admission.py
+# Admission control in front of call_rag_agent. Requests run in a fixed number
+# of slots per worker process; the rest wait in a fair queue so one user's
+# burst of weekly plans can't take every slot while other users' quick
+# questions wait behind it:
+# - each request is costed in LLM calls from its intent (a general question is
+#   1, a weekly meal plan 8); a request that turns out to be waiting for an
+#   identical in-flight plan gives its slot back and costs nothing
+# - a user has at most MAX_PER_USER requests running at once
+# - waiting requests are ordered by weighted fair queuing across users: each
+#   user's requests get finish tags that advance by their cost, and the
+#   smallest tag runs next, so a user who queued 30 calls of work is served
+#   after one who queued 1
+# - if a request's estimated wait is longer than its intent's deadline it is
+#   rejected at once (429 with Retry-After) instead of timing out later
+# The per-call time used for estimates is learned from finished requests that
+# made LLM calls.
+# Waiting requests hold a server thread, so gunicorn's thread count should be
+# above ADMISSION_SLOTS.
+import logging
+import math
+import os
+import threading
+import time
+from metrics import registry
+
+ADMISSION_ENABLED = os.environ.get('ADMISSION_CONTROL', 'on').lower() not in ('off', 'false', '0')
+ADMISSION_SLOTS = int(os.environ.get('ADMISSION_SLOTS', '4'))  # Requests running at once per process
+MAX_PER_USER = int(os.environ.get('ADMISSION_PER_USER', '2'))
+
+# Longest a request may wait in the queue, by intent (seconds)
+QUEUE_DEADLINES = {'general question': 20, 'generate meal plan': 120, 'generate workout plan': 120}
+DEFAULT_QUEUE_DEADLINE = 20
+SECONDS_PER_CALL = 4.0  # Initial estimate of one LLM call; replaced by an average of finished requests
+SMOOTHING = 0.2
+MAX_RETRY_AFTER = 120
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"server busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def request_cost(intent, is_weekly):
+    # LLM calls the request makes: meal plans add nutrient targets to one call
+    # per day (foods come from the vector store); general questions are one call
+    days = 7 if is_weekly else 1
+    if intent == 'generate meal plan':
+        return 1 + days
+    if intent == 'generate workout plan':
+        return days
+    return 1
+
+
+class Ticket:
+    def __init__(self, user_id, intent, cost, start_tag, finish_tag, previous_finish):
+        self.user_id = user_id
+        self.intent = intent
+        self.cost = cost
+        self.start_tag = start_tag
+        self.finish_tag = finish_tag
+        self.previous_finish = previous_finish
+        self.arrived = time.monotonic()
+        self.started = None
+        self.released = False
+
+
+class AdmissionController:
+    def __init__(self, slots=ADMISSION_SLOTS, per_user=MAX_PER_USER, deadlines=None,
+                 seconds_per_call=SECONDS_PER_CALL, enabled=ADMISSION_ENABLED):
+        self.slots = slots
+        self.per_user = per_user
+        self.deadlines = dict(QUEUE_DEADLINES if deadlines is None else deadlines)
+        self.seconds_per_call = seconds_per_call
+        self.enabled = enabled
+        self.condition = threading.Condition()
+        self.waiting = []
+        self.running = []
+        self.running_by_user = {}
+        self.virtual_time = 0.0
+        self.last_finish = {}  # user -> finish tag of their latest request
+
+    def admit(self, user_id, intent, is_weekly=False):
+        # Blocks until the request may run and returns its ticket (None when
+        # admission control is off); raises Overloaded if it shouldn't wait
+        if not self.enabled:
+            return None
+        cost = request_cost(intent, is_weekly)
+        deadline = self.deadlines.get(intent, DEFAULT_QUEUE_DEADLINE)
+        with self.condition:
+            previous = self.last_finish.get(user_id)
+            start_tag = max(self.virtual_time, previous or 0.0)
+            ticket = Ticket(user_id, intent, cost, start_tag, start_tag + cost, previous)
+            self.last_finish[user_id] = ticket.finish_tag
+            self.waiting.append(ticket)
+            self._dispatch()
+            if ticket.started is None:
+                wait = self._estimated_wait(ticket)
+                if wait > deadline:
+                    self._withdraw(ticket)
+                    raise self._rejected(intent, wait - deadline)
+                self._count(intent, 'queued')
+                end = ticket.arrived + deadline
+                while ticket.started is None:
+                    left = end - time.monotonic()
+                    if left <= 0:
+                        # The estimate was too low; give up rather than run past the deadline
+                        self._withdraw(ticket)
+                        raise self._rejected(intent, self._estimated_wait(None))
+                    self.condition.wait(left)
+            else:
+                self._count(intent, 'admitted')
+        registry.histogram('admission_wait_seconds', (('intent', intent),),
+                           'Time requests waited for an admission slot').observe(ticket.started - ticket.arrived)
+        return ticket
+
+    def release(self, ticket, llm_calls=None):
+        # llm_calls: calls the request actually made (default: its cost). Requests
+        # that made none (existing plans, coalesced or degraded answers) teach
+        # nothing about the per-call time.
+        if ticket is None:
+            return
+        with self.condition:
+            if ticket.released:
+                return
+            self._free(ticket)
+            llm_calls = ticket.cost if llm_calls is None else llm_calls
+            if llm_calls > 0:
+                per_call = (time.monotonic() - ticket.started) / llm_calls
+                self.seconds_per_call += SMOOTHING * (per_call - self.seconds_per_call)
+            self._dispatch()
+
+    def coalesced(self, ticket):
+        # The request is waiting for an identical one already running: it adds
+        # no LLM work, so its slot and its share of the user's queue position
+        # go back and it is charged nothing
+        if ticket is None:
+            return
+        with self.condition:
+            if ticket.released:
+                return
+            self._free(ticket)
+            if self.last_finish.get(ticket.user_id) == ticket.finish_tag:
+                self.last_finish[ticket.user_id] = ticket.start_tag
+            ticket.finish_tag = ticket.start_tag
+            ticket.cost = 0
+            self._count(ticket.intent, 'coalesced')
+            self._dispatch()
+
+    # Called with the condition held
+    def _free(self, ticket):
+        ticket.released = True
+        self.running.remove(ticket)
+        self.running_by_user[ticket.user_id] -= 1
+        if not self.running_by_user[ticket.user_id]:
+            del self.running_by_user[ticket.user_id]
+
+    def _dispatch(self):
+        started = False
+        while len(self.running) < self.slots:
+            eligible = [ticket for ticket in self.waiting
+                        if self.running_by_user.get(ticket.user_id, 0) < self.per_user]
+            if not eligible:
+                break
+            ticket = min(eligible, key=lambda t: (t.finish_tag, t.arrived))
+            self.waiting.remove(ticket)
+            self.running.append(ticket)
+            self.running_by_user[ticket.user_id] = self.running_by_user.get(ticket.user_id, 0) + 1
+            ticket.started = time.monotonic()
+            self.virtual_time = max(self.virtual_time, ticket.start_tag)
+            started = True
+        if started:
+            self.condition.notify_all()
+        if len(self.last_finish) > 10000:
+            # Users whose last finish tag has been passed are the same as new users
+            self.last_finish = {user: tag for user, tag in self.last_finish.items() if tag > self.virtual_time}
+
+    def _estimated_wait(self, ticket):
+        # Work left in the running requests plus the queued work that will be
+        # served first, spread over the slots
+        now = time.monotonic()
+        running = sum(max(t.cost * self.seconds_per_call - (now - t.started), 0) for t in self.running)
+        ahead = sum(t.cost for t in self.waiting
+                    if t is not ticket and (ticket is None or t.finish_tag < ticket.finish_tag))
+        return (running + ahead * self.seconds_per_call) / max(self.slots, 1)
+
+    def _withdraw(self, ticket):
+        self.waiting.remove(ticket)
+        if self.last_finish.get(ticket.user_id) == ticket.finish_tag:
+            if ticket.previous_finish is None:
+                del self.last_finish[ticket.user_id]
+            else:
+                self.last_finish[ticket.user_id] = ticket.previous_finish
+
+    def _rejected(self, intent, seconds):
+        self._count(intent, 'rejected')
+        retry_after = min(max(math.ceil(seconds), 1), MAX_RETRY_AFTER)
+        logging.info(f"Shedding '{intent}' request, retry after {retry_after}s")
+        return Overloaded(retry_after)
+
+    def _count(self, intent, outcome):
+        registry.increment('admission_total', (('intent', intent), ('outcome', outcome)),
+                           help_text='Requests by admission outcome')
+
+
+_lock = threading.Lock()
+_controller = None
+
+
+def get_admission_controller():
+    global _controller
+    if _controller is None:
+        with _lock:
+            if _controller is None:
+                _controller = AdmissionController()
+    return _controller
+
+
+def set_admission_controller(controller):
+    global _controller
+    _controller = controller
@@ -1,11 +1,74 @@
-from flask import Flask, request, jsonify
-from qa_agent import call_rag_agent
+import gc
+import logging
+import os
+import time
+from flask import Flask, Blueprint, request, jsonify, g, Response, stream_with_context
+from qa_agent import call_rag_agent, stream_rag_agent
+from intent import IntentUnavailable, classify_intent, get_intent_classifier, uses_sidecar
+from plan_storage import PLAN_VIEWS, get_plans
+from progress import GRANULARITIES, get_progress, record_day
+from voice import transcribe, voice_events
 from datetime import datetime
+from admission import Overloaded, get_admission_controller
+from resilience import count_llm_calls
+from audit_log import start_audit_request, finish_audit_request
+from metrics import (
+    start_request_trace, finish_request_trace, observe_request,
+    server_timing_header, render_prometheus, timed
+)
 
-app = Flask(__name__)
+SLOW_REQUEST_SECONDS = 10
+# Libraries that log every HTTP/gRPC call or model load at DEBUG/INFO
+NOISY_LOGGERS = (
+    'urllib3', 'httpx', 'httpcore', 'grpc', 'google', 'google_genai', 'transformers', 'sentence_transformers',
+    'chromadb', 'absl', 'filelock',
+)
+
+api = Blueprint('api', __name__)
+
+@api.before_app_request
+def start_timing():
+    g.request_start = time.perf_counter()
+    g.trace_token = start_request_trace()
+    g.audit_token = start_audit_request()
+
+@api.after_app_request
+def add_timing_header(response):
+    if 'trace_token' not in g:
+        return response
+    total = time.perf_counter() - g.request_start
+    trace = finish_request_trace(g.trace_token)
+    finish_audit_request(g.audit_token)
+    observe_request(request.endpoint or 'unknown', response.status_code, total)
+    response.headers['Server-Timing'] = server_timing_header(trace, total)
+    if total > SLOW_REQUEST_SECONDS:
+        logging.warning(f"Slow request {request.path} ({total:.2f}s): {response.headers['Server-Timing']}")
+    return response
+
+def busy_response(error):
+    response = jsonify({"error": "The server is busy. Please try again shortly.", "retry_after": error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
+INTENT_RETRY_AFTER = 5  # Seconds; the sidecar is normally restarted by its supervisor
+
+def classify_or_unavailable(user_query):
+    # (intent, None), or (None, 503 response) when the intent can't be classified
+    try:
+        with timed('intent_classification'):
+            return classify_intent(user_query), None
+    except IntentUnavailable:
+        response = jsonify({"error": "The service is temporarily unavailable. Please try again shortly."})
+        response.headers['Retry-After'] = str(INTENT_RETRY_AFTER)
+        return None, (response, 503)
+
+# Prometheus scrape endpoint (all workers, when METRICS_MULTIPROC_DIR is set)
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 # Define route for text query
-@app.route('/query', methods=['POST'])
+@api.route('/query', methods=['POST'])
 def query_rag():
     data = request.get_json()  # Get the JSON data from the request
     user_query = data.get('query', '')  # Extract the query
@@ -28,11 +91,169 @@ def query_rag():
     if not user_query or not user_id:
         return jsonify({"error": "Query, user_id, and isWeekly values are required"}), 400
 
-    # Call RAG agent with the user ID and start_date
-    response = call_rag_agent(user_query, user_id, user_isWeekly, start_date)
+    # The intent prices the request for admission control
+    intent, unavailable = classify_or_unavailable(user_query)
+    if unavailable:
+        return unavailable
+    controller = get_admission_controller()
+    try:
+        with timed('admission_queue'):
+            ticket = controller.admit(user_id, intent, user_isWeekly)
+    except Overloaded as e:
+        return busy_response(e)
+    llm_calls = count_llm_calls()
+    try:
+        # Call RAG agent with the user ID and start_date
+        response = call_rag_agent(user_query, user_id, user_isWeekly, start_date, intent=intent,
+                                  on_coalesced=lambda: controller.coalesced(ticket))
+    finally:
+        controller.release(ticket, llm_calls[0])
 
     return jsonify({"response": response}), 200
 
+# Voice query: uploaded audio in, NDJSON out (transcript, one synthesized
+# sentence per line as the answer is produced, then the full answer)
+@api.route('/voice', methods=['POST'])
+def voice_query():
+    upload = request.files.get('audio')
+    audio_bytes = upload.read() if upload else request.get_data()
+    fields = request.form if request.form else request.args
+    user_id = fields.get('user_id', '')
+    user_isWeekly = fields.get('isWeekly', 'false').lower() == 'true'
+    start_date = None
+    if fields.get('start_date'):
+        try:
+            start_date = datetime.strptime(fields['start_date'], '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({"error": "Invalid start_date format. Use YYYY-MM-DD."}), 400
+    if not audio_bytes or not user_id:
+        return jsonify({"error": "audio and user_id are required"}), 400
+
+    try:
+        user_query = transcribe(audio_bytes)
+    except Exception as e:
+        logging.error(f"Speech recognition failed: {e}")
+        return jsonify({"error": "Speech recognition failed"}), 502
+    if not user_query:
+        return jsonify({"error": "No speech recognized"}), 422
+
+    intent, unavailable = classify_or_unavailable(user_query)
+    if unavailable:
+        return unavailable
+    controller = get_admission_controller()
+    try:
+        with timed('admission_queue'):
+            ticket = controller.admit(user_id, intent, user_isWeekly)
+    except Overloaded as e:
+        return busy_response(e)
+
+    llm_calls = count_llm_calls()  # The answer is streamed in threads copied from this context
+    answer = stream_rag_agent(user_query, user_id, user_isWeekly, start_date, intent=intent,
+                              on_coalesced=lambda: controller.coalesced(ticket))
+    response = Response(stream_with_context(voice_events(user_query, answer)), mimetype='application/x-ndjson')
+    # The slot is held until the stream ends (or the client goes away)
+    response.call_on_close(lambda: controller.release(ticket, llm_calls[0]))
+    return response
+
+# Plans for a date range, projected to the fields a page needs
+@api.route('/plans', methods=['GET'])
+def plans():
+    user_id = request.args.get('user_id', '')
+    plan_type = request.args.get('type', 'meal')
+    view = request.args.get('view', 'day')
+    if not user_id:
+        return jsonify({"error": "user_id is required"}), 400
+    if view not in PLAN_VIEWS:
+        return jsonify({"error": f"view must be one of {', '.join(PLAN_VIEWS)}"}), 400
+    try:
+        start = datetime.strptime(request.args['start_date'], '%Y-%m-%d')
+        end = datetime.strptime(request.args.get('end_date', request.args['start_date']), '%Y-%m-%d')
+    except (KeyError, ValueError):
+        return jsonify({"error": "start_date (and optional end_date) required as YYYY-MM-DD."}), 400
+
+    end = end.replace(hour=23, minute=59, second=59)
+    return jsonify({"plans": get_plans(user_id, plan_type, start, end, view)}), 200
+
+# Pre-aggregated progress points (one read per week/month bucket)
+@api.route('/progress', methods=['GET'])
+def progress():
+    user_id = request.args.get('user_id', '')
+    granularity = request.args.get('granularity', 'day')
+    if not user_id:
+        return jsonify({"error": "user_id is required"}), 400
+    if granularity not in GRANULARITIES:
+        return jsonify({"error": f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+    try:
+        start = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date()
+        end = datetime.strptime(request.args.get('end_date', request.args['start_date']), '%Y-%m-%d').date()
+    except (KeyError, ValueError):
+        return jsonify({"error": "start_date (and optional end_date) required as YYYY-MM-DD."}), 400
+
+    return jsonify({"points": get_progress(user_id, start, end, granularity)}), 200
+
+# Called by the app after it saves a day's calories or exercise completions
+@api.route('/progress/events', methods=['POST'])
+def progress_event():
+    data = request.get_json() or {}
+    user_id = data.get('user_id', '')
+    try:
+        day = datetime.strptime(data.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({"error": "date required as YYYY-MM-DD."}), 400
+    if not user_id:
+        return jsonify({"error": "user_id is required"}), 400
+
+    record_day(user_id, day, data.get('calories_consumed'), data.get('completed_exercises'))
+    return jsonify({"status": "ok"}), 200
+
+
+def configure_logging():
+    # INFO by default (LOG_LEVEL to change it); prompts and responses go to the audit log instead
+    logging.basicConfig(
+        level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler()  # Outputs to console
+        ]
+    )
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+def warm_up():
+    # Load the intent classifier so the first request doesn't pay for it. Only the weights are
+    # loaded: running torch before a fork starts its thread pools, which the forked workers
+    # inherit in a broken state. warm_up_inference runs in each worker after the fork instead.
+    # Firestore and Gemini clients stay lazy: their gRPC channels must not be created before a fork.
+    if uses_sidecar():
+        return  # The model lives in the intent sidecar process
+    start = time.perf_counter()
+    get_intent_classifier()
+    logging.info(f"Warm-up finished in {time.perf_counter() - start:.1f}s")
+
+def warm_up_inference():
+    # One classification per worker process (gunicorn's post_fork hook)
+    if uses_sidecar():
+        return
+    start = time.perf_counter()
+    classify_intent("warm up")
+    logging.info(f"Worker warm-up inference finished in {time.perf_counter() - start:.1f}s")
+
+def create_app(warm=None):
+    configure_logging()
+    app = Flask(__name__)
+    app.register_blueprint(api)
+
+    if warm is None:
+        warm = os.environ.get('WARM_UP', 'false').lower() == 'true'
+    if warm:
+        warm_up()
+        # Keep warmed-up objects out of GC scans so forked workers share their pages copy-on-write
+        gc.freeze()
+    return app
+
+# Module-level app for `gunicorn app:app` and `flask run`
+app = create_app()
+
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,249 @@
+# audit_log.py
+# Audit records of LLM prompts, raw responses and parsed plans, kept off the
+# request path. A call site hands over the objects it already has; whether the
+# record is kept is decided by a per-step sampling rate before anything is
+# built, and sampled records are serialized, hashed and written by a
+# background thread. Files are gzip-compressed JSONL, rotated by size and age.
+# Prompt texts are stored once per file under their SHA-256 and records refer
+# to them by hash, so the seven identical day prompts of a weekly plan (and
+# repeated general prompts) cost one copy.
+#
+#   AUDIT_LOG=off                                  disable
+#   AUDIT_SAMPLE_RATES="general=0.1,meal_day=1"    per-step rates (0..1)
+#   zcat /tmp/rag_audit_logs/audit-*.jsonl.gz | jq .
+import atexit
+import contextvars
+import gzip
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from metrics import registry
+
+# Outside the working directory, so a run from the source tree doesn't write logs into it
+AUDIT_LOG_DIRECTORY = os.environ.get('AUDIT_LOG_DIR', os.path.join(tempfile.gettempdir(), 'rag_audit_logs'))
+AUDIT_ENABLED = os.environ.get('AUDIT_LOG', 'on').lower() not in ('off', 'false', '0')
+
+# Share of requests whose records are kept, by step; steps not listed use the default
+SAMPLE_RATES = {
+    'general': 0.05,
+    'nutrient_targets': 0.2,
+    'food_items': 0.2,
+    'meal_day': 0.2,
+    'workout_day': 0.2,
+}
+DEFAULT_SAMPLE_RATE = 0.1
+
+MAX_FILE_BYTES = 64 * 1024 * 1024  # Uncompressed bytes per file before rotating
+MAX_FILE_AGE_SECONDS = 24 * 3600
+KEEP_FILES = 30  # Oldest files beyond this are deleted on rotation
+QUEUE_SIZE = 10000  # Records waiting for the writer; more are dropped, never waited for
+FLUSH_SECONDS = 1.0  # Writer flushes after this long without new records
+DEDUP_FIELDS = ('prompt',)  # Fields stored by hash
+MAX_SEEN_HASHES = 100000
+
+_STOP = object()
+
+
+def parse_sample_rates(value):
+    # "general=0.1,meal_day=1" -> {'general': 0.1, 'meal_day': 1.0}
+    rates = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            step, rate = item.split('=', 1)
+            try:
+                rates[step.strip()] = min(max(float(rate), 0.0), 1.0)
+            except ValueError:
+                logging.warning(f"Ignoring audit sample rate {item!r}")
+    return rates
+
+
+# ---------------------- Request Sampling ----------------------
+# One draw per request, so a sampled request keeps all its records (every day
+# of a weekly plan, prompt and answer together); outside a request each record
+# is drawn on its own
+_request = contextvars.ContextVar('audit_request', default=None)
+
+
+def start_audit_request():
+    return _request.set((uuid.uuid4().hex[:16], random.random()))
+
+
+def finish_audit_request(token):
+    _request.reset(token)
+
+
+# ---------------------- Writer ----------------------
+class AuditLog:
+    def __init__(self, directory=AUDIT_LOG_DIRECTORY, sample_rates=None, default_rate=DEFAULT_SAMPLE_RATE,
+                 enabled=AUDIT_ENABLED, max_bytes=MAX_FILE_BYTES, max_age=MAX_FILE_AGE_SECONDS,
+                 keep_files=KEEP_FILES, queue_size=QUEUE_SIZE):
+        self.directory = directory
+        self.sample_rates = dict(SAMPLE_RATES if sample_rates is None else sample_rates)
+        self.default_rate = default_rate
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.keep_files = keep_files
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        # Writer-thread state
+        self.file = None
+        self.path = None
+        self.opened_at = 0.0
+        self.bytes_written = 0
+        self.seen = set()
+
+    def sampled(self, step):
+        rate = self.sample_rates.get(step, self.default_rate)
+        if rate <= 0:
+            return False
+        current = _request.get()
+        return (current[1] if current else random.random()) < rate
+
+    def record(self, step, fields):
+        # Called on the request path: no formatting, hashing or I/O here
+        if not self.enabled or not self.sampled(step):
+            return
+        current = _request.get()
+        item = (time.time(), step, current[0] if current else None, fields)
+        try:
+            self._queue().put_nowait(item)
+        except queue.Full:
+            registry.increment('audit_records_total', (('step', step), ('outcome', 'dropped')),
+                               help_text='Audit records by step and outcome')
+
+    def _queue(self):
+        # Started on first use, and again in a forked worker (threads don't survive fork)
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.queue = queue.Queue(maxsize=self.queue_size)
+                    self.file = None
+                    self.thread = threading.Thread(target=self._run, args=(self.queue,), name='audit-log',
+                                                   daemon=True)
+                    self.thread.start()
+                    self.pid = os.getpid()
+        return self.queue
+
+    def close(self, timeout=5.0):
+        # Writes out what is queued and closes the file (gzip trailer included)
+        if self.thread is not None and self.pid == os.getpid() and self.thread.is_alive():
+            try:
+                self.queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                return
+            self.thread.join(timeout)
+
+    def _run(self, records):
+        dirty = False
+        while True:
+            try:
+                item = records.get(timeout=FLUSH_SECONDS)
+            except queue.Empty:
+                if dirty:
+                    self.file.flush()
+                    dirty = False
+                continue
+            if item is _STOP:
+                break
+            try:
+                self._write(*item)
+                dirty = True
+            except Exception as e:
+                logging.warning(f"Could not write audit record for '{item[1]}': {e}")
+                registry.increment('audit_records_total', (('step', item[1]), ('outcome', 'error')),
+                                   help_text='Audit records by step and outcome')
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _write(self, timestamp, step, request_id, fields):
+        record = {'ts': datetime.fromtimestamp(timestamp).isoformat(timespec='milliseconds'), 'step': step}
+        if request_id:
+            record['request'] = request_id
+        texts = []
+        for name, value in fields.items():
+            if callable(value):
+                value = value()
+            if name in DEDUP_FIELDS and isinstance(value, str):
+                digest = hashlib.sha256(value.encode('utf-8')).hexdigest()
+                record[f"{name}_sha256"] = digest
+                texts.append((digest, value))
+            else:
+                record[name] = value
+        self._rotate_if_needed(timestamp)
+        lines = []
+        for digest, text in texts:
+            if digest not in self.seen:
+                if len(self.seen) >= MAX_SEEN_HASHES:
+                    self.seen.clear()
+                self.seen.add(digest)
+                lines.append(json.dumps({'type': 'text', 'sha256': digest, 'text': text}, ensure_ascii=False))
+        lines.append(json.dumps(record, ensure_ascii=False, default=str))
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+        self.file.write(data)
+        self.bytes_written += len(data)
+        registry.increment('audit_records_total', (('step', step), ('outcome', 'written')),
+                           help_text='Audit records by step and outcome')
+
+    def _rotate_if_needed(self, now):
+        if self.file is not None and self.bytes_written < self.max_bytes and now - self.opened_at < self.max_age:
+            return
+        if self.file is not None:
+            self.file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.fromtimestamp(now).strftime('%Y%m%d-%H%M%S')
+        self.path = os.path.join(self.directory, f"audit-{stamp}-{os.getpid()}.jsonl.gz")
+        self.file = gzip.open(self.path, 'ab', compresslevel=6)
+        self.opened_at = now
+        self.bytes_written = 0
+        self.seen = set()  # Each file carries the texts its records refer to
+        self._prune()
+
+    def _prune(self):
+        try:
+            names = [name for name in os.listdir(self.directory)
+                     if name.startswith('audit-') and name.endswith('.jsonl.gz')]
+            paths = sorted((os.path.join(self.directory, name) for name in names), key=os.path.getmtime)
+            for path in paths[:max(len(paths) - self.keep_files, 0)]:
+                if path != self.path:
+                    os.remove(path)
+        except OSError as e:
+            logging.warning(f"Could not prune audit logs: {e}")
+
+
+_lock = threading.Lock()
+_audit_log = None
+
+
+def get_audit_log():
+    global _audit_log
+    if _audit_log is None:
+        with _lock:
+            if _audit_log is None:
+                rates = dict(SAMPLE_RATES, **parse_sample_rates(os.environ.get('AUDIT_SAMPLE_RATES')))
+                _audit_log = AuditLog(sample_rates=rates)
+                atexit.register(_audit_log.close)
+    return _audit_log
+
+
+def set_audit_log(audit_log):
+    global _audit_log
+    _audit_log = audit_log
+
+
+def audit(step, **fields):
+    # Values are stored as passed (callables are called by the writer), so
+    # pass objects that won't be changed afterwards
+    get_audit_log().record(step, fields)
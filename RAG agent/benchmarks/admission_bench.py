@@ -0,0 +1,138 @@
+# benchmarks/admission_bench.py
+# Mixed traffic through /query with a stub pipeline in place of
+# call_rag_agent, which sleeps one --call-latency per LLM call the request
+# would make. One heavy user sends a steady stream of weekly meal/workout
+# plans while many light users ask general questions. Compares:
+# - no admission control, --slots server threads serving requests in arrival
+#   order (what gunicorn does today)
+# - admission.py with --slots slots and more threads than slots, so waiting
+#   requests sit in the fair queue instead of the server's accept queue
+# Queue deadlines are scaled with the call latency (seconds, not minutes).
+#
+#   python benchmarks/admission_bench.py --duration 20 --heavy-rps 5 --light-rps 10
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import admission
+import app as app_module
+import resilience
+from fakes import FakeFirestore, FakeLLM, StubIntentClassifier
+from load_test import QUERIES, install_fakes, percentile
+
+HEAVY_QUERIES = ["Generate a meal plan for me", "Generate a workout plan for me"]
+
+
+def stub_pipeline(call_latency, seed):
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def call_rag_agent(query, userId, isWeekly, start_date=None, intent=None, on_coalesced=None):
+        with lock:
+            jitter = rng.uniform(0.8, 1.2)
+        calls = admission.request_cost(intent, isWeekly)
+        for _ in range(calls):
+            resilience.note_llm_call()  # Admission control learns its per-call time from these
+        time.sleep(calls * call_latency * jitter)
+        return "ok"
+    return call_rag_agent
+
+
+def schedule(args):
+    # (send offset, class, payload), open loop: Poisson arrivals for both classes
+    rng = random.Random(args.seed)
+    requests = []
+    for label, rps in (('heavy', args.heavy_rps), ('light', args.light_rps)):
+        offset = 0.0
+        while True:
+            offset += rng.expovariate(rps)
+            if offset >= args.duration:
+                break
+            if label == 'heavy':
+                payload = {'query': rng.choice(HEAVY_QUERIES), 'user_id': 'heavy-user', 'isWeekly': 'true'}
+            else:
+                payload = {'query': rng.choice(QUERIES['general']),
+                           'user_id': f"light-user-{rng.randrange(args.light_users)}", 'isWeekly': 'false'}
+            requests.append((offset, label, payload))
+    return sorted(requests, key=lambda item: item[0])
+
+
+def run(flask_app, requests, threads):
+    results = []
+    lock = threading.Lock()
+    local = threading.local()
+
+    def send(scheduled, label, payload):
+        if not hasattr(local, 'client'):
+            local.client = flask_app.test_client()
+        response = local.client.post('/query', json=payload)
+        # Latency from the scheduled send time, so time spent waiting for a server thread counts
+        with lock:
+            results.append((label, response.status_code, time.perf_counter() - scheduled,
+                            int(response.headers.get('Retry-After', 0))))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for offset, label, payload in requests:
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, started + offset, label, payload)
+    return results, time.perf_counter() - started
+
+
+def report(name, results, elapsed, args):
+    print(f"\n{name} ({elapsed:.1f}s)")
+    print(f"{'':<8}{'sent':>6}{'ok':>6}{'429':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'Retry-After':>13}")
+    for label in ('light', 'heavy'):
+        rows = [row for row in results if row[0] == label]
+        ok = [seconds * 1000 for _, status, seconds, _ in rows if status == 200]
+        shed = [retry for _, status, _, retry in rows if status == 429]
+        retry = f"{percentile(shed, 50):.0f}s p50" if shed else '-'
+        print(f"{label:<8}{len(rows):>6}{len(ok):>6}{len(shed):>6}{percentile(ok, 50):>9.0f}"
+              f"{percentile(ok, 95):>9.0f}{percentile(ok, 99):>9.0f}{retry:>13}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Admission control and fair queuing under mixed load")
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--heavy-rps', type=float, default=5.0, help='Weekly plan requests per second from one user')
+    parser.add_argument('--light-rps', type=float, default=10.0, help='General questions per second')
+    parser.add_argument('--light-users', type=int, default=30)
+    parser.add_argument('--call-latency', type=float, default=0.1, help='Seconds per LLM call in the stub')
+    parser.add_argument('--slots', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=64, help='Server threads with admission control')
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    flask_app = install_fakes(FakeLLM(), FakeFirestore(), StubIntentClassifier())
+    app_module.call_rag_agent = stub_pipeline(args.call_latency, args.seed)
+    requests = schedule(args)
+    scale = args.call_latency / admission.SECONDS_PER_CALL
+    deadlines = {intent: seconds * scale for intent, seconds in admission.QUEUE_DEADLINES.items()}
+    capacity = args.slots / args.call_latency
+    demand = (args.heavy_rps * (admission.request_cost('generate meal plan', True)
+                                + admission.request_cost('generate workout plan', True)) / 2 + args.light_rps)
+    print(f"{len(requests)} requests over {args.duration:.0f}s; LLM-call demand {demand:.0f}/s "
+          f"vs capacity {capacity:.0f}/s ({args.slots} slots x {args.call_latency}s per call)")
+    print(f"Queue deadlines: " + ', '.join(f"{intent} {seconds:.1f}s" for intent, seconds in deadlines.items()))
+
+    admission.set_admission_controller(admission.AdmissionController(enabled=False))
+    report(f"No admission control, {args.slots} threads in arrival order", *run(flask_app, requests, args.slots), args)
+
+    admission.set_admission_controller(admission.AdmissionController(
+        slots=args.slots, deadlines=deadlines, seconds_per_call=args.call_latency, enabled=True
+    ))
+    report(f"Admission control, {args.slots} slots, {args.threads} threads",
+           *run(flask_app, requests, args.threads), args)
+
+
+if __name__ == '__main__':
+    main()
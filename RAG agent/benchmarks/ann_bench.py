@@ -0,0 +1,167 @@
+# benchmarks/ann_bench.py
+# Chroma versus the memory-mapped IVF index (mmap_index.py) over the same
+# record documents: size on disk, time for a fresh process to open the index
+# and answer its first query, per-query latency, and recall@k against an exact
+# float32 search. Uses synthetic USDA-shaped records and a hashing embedding,
+# so no API key or data file is needed.
+#
+#   python benchmarks/ann_bench.py --foods 20000
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import numpy as np
+from data_processing import food_document
+from fakes import HashingEmbeddings, synthetic_usda_records
+from load_test import percentile
+from mmap_index import MmapIndex, MmapRetriever, build_from_chroma, default_nprobe
+from retrieval_bench import QUERIES, build_store
+from vector_store import food_filter
+
+K = 5
+QUERY_COUNT = 200
+
+# Run in a fresh interpreter: open the index and answer one query
+COLD_START = '''
+import sys, time
+sys.path.insert(0, {root!r}); sys.path.insert(0, {bench!r})
+from fakes import HashingEmbeddings
+from langchain_chroma import Chroma
+from mmap_index import MmapIndex, MmapRetriever
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS')) / 1024
+
+embeddings = HashingEmbeddings()
+before = rss_mb()
+start = time.perf_counter()
+if {kind!r} == 'chroma':
+    store = Chroma(persist_directory={path!r}, embedding_function=embeddings)
+    store.similarity_search("chicken breast high protein", k={k})
+else:
+    MmapRetriever(index=MmapIndex({path!r}), embeddings=embeddings, k={k}).invoke("chicken breast high protein")
+print((time.perf_counter() - start) * 1000, rss_mb() - before)
+'''
+
+
+def disk_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def cold_start(kind, path):
+    # Import time is excluded; the timer starts after the modules are loaded
+    code = COLD_START.format(root=os.path.dirname(BENCH_DIR), bench=BENCH_DIR, kind=kind, path=path, k=K)
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    ms, rss_mb = output.strip().splitlines()[-1].split()
+    return float(ms), float(rss_mb)
+
+
+def sample_queries(records, count, seed=1):
+    rng = random.Random(seed)
+    queries = [query for query, *_ in QUERIES]
+    while len(queries) < count:
+        name = rng.choice(records)['name'].split(' (NDB')[0]
+        queries.append(rng.choice(["{}", "high protein {}", "{} for dinner", "low calorie {} snack"]).format(name))
+    return queries
+
+
+def recall(found, scores, threshold):
+    # Many synthetic foods tie on score, so a result counts if it scores as well
+    # as the exact k-th best rather than only if it is the same document
+    return sum(1 for name in found if scores[name] >= threshold - 1e-4) / K
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chroma vs memory-mapped IVF index")
+    parser.add_argument('--foods', type=int, default=20000)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[8, 16, 0],
+                        help='Lists probed per query; 0 is the default, scaled with nlist')
+    args = parser.parse_args()
+
+    records = synthetic_usda_records(args.foods)
+    documents = [food_document(record) for record in records]
+    embeddings = HashingEmbeddings()
+    queries = sample_queries(records, QUERY_COUNT)
+    query_vectors = np.asarray(embeddings.embed_documents(queries), dtype=np.float32)
+
+    workdir = tempfile.mkdtemp(prefix='ann_bench_')
+    try:
+        chroma_path = os.path.join(workdir, 'chroma')
+        store = build_store(chroma_path, documents, embeddings)
+
+        # Exact float32 search over the stored vectors is the reference
+        data = store.get(include=['embeddings', 'metadatas'])
+        names = [metadata['name'] for metadata in data['metadatas']]
+        matrix = np.asarray(data['embeddings'], dtype=np.float32)
+        truth = []
+        for vector in query_vectors:
+            scores = matrix @ (vector / np.linalg.norm(vector))
+            truth.append((dict(zip(names, scores)), np.sort(scores)[-K]))
+
+        indexes = {}
+        for dtype in ('int8', 'float16'):
+            path = os.path.join(workdir, f'mmap_{dtype}')
+            start = time.perf_counter()
+            build_from_chroma(store, path, dtype)
+            print(f"Built {dtype} index in {time.perf_counter() - start:.1f}s")
+            indexes[dtype] = (path, MmapIndex(path))
+
+        print(f"\n{args.foods} foods, {len(queries)} queries, k={K}")
+        print(f"{'index':<22}{'disk MB':>9}{'cold ms':>9}{'+RSS MB':>9}")
+        for label, kind, path in [('chroma', 'chroma', chroma_path)] + [
+            (f'mmap {dtype}', 'mmap', path) for dtype, (path, _) in indexes.items()
+        ]:
+            ms, rss = cold_start(kind, path)
+            print(f"{label:<22}{disk_size(path) / 1e6:>9.1f}{ms:>9.1f}{rss:>9.1f}")
+
+        print(f"\n{'search (by vector)':<22}{'p50 ms':>9}{'p95 ms':>9}{'recall@' + str(K):>10}")
+
+        def report(label, search):
+            latencies, recalls = [], []
+            for vector, (scores, threshold) in zip(query_vectors, truth):
+                start = time.perf_counter()
+                found = search(vector)
+                latencies.append((time.perf_counter() - start) * 1000)
+                recalls.append(recall(found, scores, threshold))
+            print(f"{label:<22}{percentile(latencies, 50):>9.2f}{percentile(latencies, 95):>9.2f}"
+                  f"{sum(recalls) / len(recalls):>10.3f}")
+
+        report('chroma hnsw', lambda vector: [
+            doc.metadata['name'] for doc in store.similarity_search_by_vector(vector.tolist(), k=K)])
+        for dtype, (_, index) in indexes.items():
+            for nprobe in args.nprobe:
+                label = f'nprobe={nprobe}' if nprobe else f'nprobe={default_nprobe(len(index.centroids))}*'
+                report(f'mmap {dtype} {label}', lambda vector: [
+                    index.record(row)['metadata']['name'] for _, row in index.search(vector, K, nprobe or None)])
+
+        # Filtered queries through the retriever interfaces, as qa_agent would call them
+        print(f"\n{'filtered retriever':<22}{'p50 ms':>9}{'filled':>9}")
+        index = indexes['int8'][1]
+        for label, make in (
+            ('chroma where', lambda where: store.as_retriever(search_kwargs={'k': K, 'filter': where})),
+            ('mmap int8 where', lambda where: MmapRetriever(index=index, embeddings=embeddings, k=K, filter=where)),
+        ):
+            latencies, filled = [], 0
+            for query, excluded, category, max_calories, min_protein in QUERIES:
+                retriever = make(food_filter(excluded, category, max_calories, min_protein))
+                for _ in range(10):
+                    start = time.perf_counter()
+                    results = retriever.invoke(query)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                filled += len(results)
+            print(f"{label:<22}{percentile(latencies, 50):>9.2f}{filled:>6}/{K * len(QUERIES)}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
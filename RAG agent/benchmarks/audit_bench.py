@@ -0,0 +1,105 @@
+# benchmarks/audit_bench.py
+# Per-request cost of prompt/response logging on /query: the old eager DEBUG
+# logging (f-strings formatted and written to the console on the request
+# thread) versus audit_log.py off, at its default sampling rates, and with
+# every record kept. Requests are sent one at a time against the fake LLM with
+# no added latency, so the differences are the logging itself. CPU is process
+# time per request, so the background writer's work is included.
+#
+#   python benchmarks/audit_bench.py --requests 600
+import argparse
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import audit_log
+from fakes import FakeFirestore, FakeLLM, StubIntentClassifier
+from load_test import DEFAULT_MIX, QUERIES, install_fakes, percentile, seed_users
+
+
+class EagerDebugLog:
+    # What the call sites did before: logging.debug(f"...") of every prompt,
+    # response and plan, built and written on the request thread
+    def record(self, step, fields):
+        for name, value in fields.items():
+            logging.debug(f"{step} {name}: {value() if callable(value) else value}\n\n\n")
+
+    def close(self):
+        pass
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def run(label, log, log_path, args, report=True):
+    llm = FakeLLM(seed=1)
+    db = FakeFirestore()
+    client = install_fakes(llm, db, StubIntentClassifier()).test_client()
+    user_ids = seed_users(db, 20)
+    rng = random.Random(args.seed)
+    kinds, weights = zip(*DEFAULT_MIX.items())
+    audit_log.set_audit_log(log)
+
+    latencies = []
+    cpu_start = time.process_time()
+    for i in range(args.requests):
+        kind = rng.choices(kinds, weights)[0]
+        start = time.perf_counter()
+        client.post('/query', json={
+            'query': rng.choice(QUERIES[kind]), 'user_id': rng.choice(user_ids),
+            'isWeekly': 'true' if kind != 'general' and rng.random() < args.weekly_ratio else 'false',
+        })
+        latencies.append(time.perf_counter() - start)
+    log.close()
+    cpu = time.process_time() - cpu_start
+    if not report:
+        return
+    written = directory_bytes(log_path) if os.path.isdir(log_path) else os.path.getsize(log_path)
+    print(f"{label:<28}{sum(latencies) / len(latencies) * 1000:>9.2f}{percentile(latencies, 99) * 1000:>9.2f}"
+          f"{cpu / args.requests * 1000:>10.2f}{written / args.requests / 1024:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt/response logging overhead per /query request")
+    parser.add_argument('--requests', type=int, default=600)
+    parser.add_argument('--weekly-ratio', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='audit_bench_')
+    root = logging.getLogger()
+    try:
+        console_path = os.path.join(work_dir, 'console.log')  # Stands in for the container's stderr
+        handler = logging.FileHandler(console_path)
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        root.handlers[:] = [handler]
+
+        run("warm-up", audit_log.AuditLog(work_dir, enabled=False), None, args, report=False)
+        print(f"{args.requests} sequential requests, mix {DEFAULT_MIX}, {args.weekly_ratio:.0%} of plans weekly")
+        print(f"{'':<28}{'mean ms':>9}{'p99 ms':>9}{'CPU ms':>10}{'KB/request':>12}")
+        modes = (
+            ("eager DEBUG (before)", logging.DEBUG, lambda path: EagerDebugLog(), console_path),
+            ("audit log off", logging.INFO, lambda path: audit_log.AuditLog(path, enabled=False), None),
+            ("audit log, default rates", logging.INFO, lambda path: audit_log.AuditLog(path, enabled=True), None),
+            ("audit log, every record", logging.INFO,
+             lambda path: audit_log.AuditLog(path, sample_rates={}, default_rate=1.0, enabled=True), None),
+        )
+        for label, level, make_log, log_path in modes:
+            path = log_path or tempfile.mkdtemp(dir=work_dir)
+            root.setLevel(level)
+            run(label, make_log(path), path, args)
+    finally:
+        root.handlers[:] = []
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,520 @@
+# benchmarks/fakes.py
+# Offline stand-ins for Gemini, Firestore, the intent classifier and the embedding model
+import copy
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+RECORDED_RESPONSES_PATH = os.path.join(os.path.dirname(__file__), 'recorded_responses.json')
+
+
+# ---------------------- Fake LLM ----------------------
+class FakeMessage:
+    def __init__(self, content):
+        self.content = content
+
+
+# Prompt marker -> recorded response key, checked in order
+RESPONSE_RULES = [
+    ("generate a meal plan in JSON", 'meal_day'),
+    ("generate a workout plan in JSON", 'workout_day'),
+    ("Calculate DAILY nutritional targets", 'nutrient_targets'),
+    ("Food items matching these DAILY targets", 'food_items'),
+    ("Update the running summary", 'summary'),
+]
+
+
+class FakeUpstreamError(RuntimeError):
+    pass
+
+
+class FakeLLM:
+    # spike_rate/spike_latency add occasional hangs and error_rate fails calls,
+    # to exercise the deadlines, hedging and circuit breaker in resilience.py
+    def __init__(self, responses=None, latency=0.0, jitter=0.0, stream_chunk_chars=64, seed=None,
+                 spike_rate=0.0, spike_latency=0.0, error_rate=0.0):
+        if responses is None:
+            with open(RECORDED_RESPONSES_PATH, 'r', encoding='utf-8') as f:
+                responses = json.load(f)
+        self.responses = responses
+        self.latency = latency
+        self.jitter = jitter
+        self.stream_chunk_chars = stream_chunk_chars
+        self.random = random.Random(seed)
+        self.spike_rate = spike_rate
+        self.spike_latency = spike_latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self.calls_by_kind = {}
+        self.lock = threading.Lock()
+
+    def bind(self, **kwargs):
+        return self
+
+    def response_for(self, prompt):
+        kind = next((key for marker, key in RESPONSE_RULES if marker in prompt), 'general')
+        with self.lock:
+            self.calls += 1
+            self.calls_by_kind[kind] = self.calls_by_kind.get(kind, 0) + 1
+            delay = max(self.latency + self.random.uniform(-self.jitter, self.jitter), 0)
+            if self.random.random() < self.spike_rate:
+                delay += self.spike_latency
+            failed = self.random.random() < self.error_rate
+        response = self.responses[kind]
+        return delay, response if isinstance(response, str) else json.dumps(response), failed
+
+    def invoke(self, prompt, **kwargs):
+        delay, text, failed = self.response_for(prompt)
+        time.sleep(delay)
+        if failed:
+            raise FakeUpstreamError("503 Service Unavailable")
+        return FakeMessage(text)
+
+    def stream(self, prompt, **kwargs):
+        delay, text, failed = self.response_for(prompt)
+        chunks = [text[i:i + self.stream_chunk_chars] for i in range(0, len(text), self.stream_chunk_chars)]
+        for i, chunk in enumerate(chunks):
+            time.sleep(delay / max(len(chunks), 1))
+            if failed and i == 0:
+                raise FakeUpstreamError("503 Service Unavailable")
+            yield FakeMessage(chunk)
+
+
+# ---------------------- Stub Intent Classifier ----------------------
+class StubIntentClassifier:
+    # latency is paid once per call and item_latency once per query, which
+    # mimics a model forward pass where batching amortizes the fixed cost
+    def __init__(self, latency=0.0, item_latency=0.0):
+        self.latency = latency
+        self.item_latency = item_latency
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, query, candidate_labels, **kwargs):
+        queries = query if isinstance(query, list) else [query]
+        with self.lock:
+            # A single model instance runs one forward pass at a time
+            self.calls += 1
+            time.sleep(self.latency + self.item_latency * len(queries))
+        results = [self._classify(text, candidate_labels) for text in queries]
+        return results if isinstance(query, list) else results[0]
+
+    def _classify(self, query, candidate_labels):
+        text = query.lower()
+        if 'meal' in text or 'diet' in text:
+            top = "generate meal plan"
+        elif 'workout' in text or 'exercise' in text:
+            top = "generate workout plan"
+        else:
+            top = "general question"
+        labels = [top] + [label for label in candidate_labels if label != top]
+        return {'sequence': query, 'labels': labels, 'scores': [0.9] + [0.1 / (len(labels) - 1)] * (len(labels) - 1)}
+
+
+# ---------------------- In-memory Firestore ----------------------
+def _resolve_transforms(data, existing=None):
+    resolved = {}
+    for key, value in data.items():
+        kind = type(value).__name__
+        if kind == 'Sentinel':  # firestore.SERVER_TIMESTAMP
+            resolved[key] = datetime.now(timezone.utc)
+        elif kind == 'Increment':
+            resolved[key] = (existing or {}).get(key, 0) + value.value
+        elif isinstance(value, dict):
+            resolved[key] = _resolve_transforms(value, (existing or {}).get(key))
+        else:
+            resolved[key] = copy.deepcopy(value)
+    return resolved
+
+
+def _deep_merge(target, updates):
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _deep_merge(target[key], value)
+        else:
+            target[key] = value
+
+
+def _field(data, path):
+    for part in path.split('.'):
+        if not isinstance(data, dict) or part not in data:
+            return None
+        data = data[part]
+    return data
+
+
+def _project(data, paths):
+    # Selected fields come back nested, as Firestore returns them
+    projected = {}
+    for path in paths:
+        value = _field(data, path)
+        if value is None:
+            continue
+        *parents, name = path.split('.')
+        target = projected
+        for part in parents:
+            target = target.setdefault(part, {})
+        target[name] = value
+    return projected
+
+
+_OPERATORS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a is not None and a < b,
+    '<=': lambda a, b: a is not None and a <= b,
+    '>': lambda a, b: a is not None and a > b,
+    '>=': lambda a, b: a is not None and a >= b,
+    'in': lambda a, b: a in b,
+    'array_contains': lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+class FakeFirestore:
+    def __init__(self, latency=0.0):
+        self.docs = {}  # 'users/u1/chat_history/abc' -> dict
+        self.latency = latency
+        self.ops = {'reads': 0, 'writes': 0, 'deletes': 0, 'batch_commits': 0}
+        self.lock = threading.RLock()
+        self._ids = itertools.count()
+
+    def _op(self, kind, count=1):
+        with self.lock:
+            self.ops[kind] += count
+        if self.latency:
+            time.sleep(self.latency)
+
+    def reset_ops(self):
+        with self.lock:
+            self.ops = {key: 0 for key in self.ops}
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def collection_group(self, name):
+        return FakeCollectionGroup(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def new_id(self):
+        return f"{next(self._ids):08d}{uuid.uuid4().hex[:12]}"
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return _field(self._data or {}, field)
+
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    @property
+    def parent(self):
+        return FakeCollection(self.db, self.path.rsplit('/', 1)[0])
+
+    def collection(self, name):
+        return FakeCollection(self.db, f"{self.path}/{name}")
+
+    def get(self, field_paths=None):
+        self.db._op('reads')
+        with self.db.lock:
+            return FakeSnapshot(self, copy.deepcopy(self.db.docs.get(self.path)))
+
+    def _set(self, data, merge=False):
+        with self.db.lock:
+            existing = self.db.docs.get(self.path)
+            resolved = _resolve_transforms(data, existing)
+            if merge and existing is not None:
+                _deep_merge(existing, resolved)
+            else:
+                self.db.docs[self.path] = resolved
+
+    def _update(self, data):
+        with self.db.lock:
+            if self.path not in self.db.docs:
+                raise KeyError(f"No document to update: {self.path}")
+            existing = self.db.docs[self.path]
+            for key, value in data.items():
+                parts = key.split('.')
+                target = existing
+                for part in parts[:-1]:
+                    target = target.setdefault(part, {})
+                target[parts[-1]] = _resolve_transforms({parts[-1]: value}, target)[parts[-1]]
+
+    def set(self, data, merge=False):
+        self.db._op('writes')
+        self._set(data, merge)
+
+    def update(self, data):
+        self.db._op('writes')
+        self._update(data)
+
+    def delete(self):
+        self.db._op('deletes')
+        with self.db.lock:
+            self.db.docs.pop(self.path, None)
+
+
+class FakeQuery:
+    def __init__(self, collection, filters=(), orders=(), limit_count=None, fields=None):
+        self.collection_ref = collection
+        self.filters = list(filters)
+        self.orders = list(orders)
+        self.limit_count = limit_count
+        self.fields = fields
+
+    def _copy(self, **changes):
+        params = dict(filters=self.filters, orders=self.orders, limit_count=self.limit_count, fields=self.fields)
+        params.update(changes)
+        return FakeQuery(self.collection_ref, **params)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self.filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        return self._copy(orders=self.orders + [(field_path, direction)])
+
+    def limit(self, count):
+        return self._copy(limit_count=count)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def stream(self):
+        db = self.collection_ref.db
+        with db.lock:
+            matches = [
+                (path, copy.deepcopy(data)) for path, data in db.docs.items()
+                if self.collection_ref.contains(path)
+            ]
+        for field_path, op_string, value in self.filters:
+            matches = [(p, d) for p, d in matches if _OPERATORS[op_string](_field(d, field_path), value)]
+        for field_path, direction in reversed(self.orders):
+            matches.sort(key=lambda item: (_field(item[1], field_path) is None, _field(item[1], field_path)),
+                         reverse=direction == 'DESCENDING')
+        if self.limit_count is not None:
+            matches = matches[:self.limit_count]
+        # Firestore bills one read per returned document (minimum one per query)
+        db._op('reads', max(len(matches), 1))
+        for path, data in matches:
+            if self.fields is not None:
+                data = _project(data, self.fields)
+            yield FakeSnapshot(FakeDocument(db, path), data)
+
+    def get(self):
+        return list(self.stream())
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        super().__init__(self)
+
+    @property
+    def parent(self):
+        return FakeDocument(self.db, self.path.rsplit('/', 1)[0]) if '/' in self.path else None
+
+    def contains(self, path):
+        prefix = self.path + '/'
+        return path.startswith(prefix) and '/' not in path[len(prefix):]
+
+    def document(self, document_id=None):
+        return FakeDocument(self.db, f"{self.path}/{document_id or self.db.new_id()}")
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return datetime.now(timezone.utc), ref
+
+
+class FakeCollectionGroup(FakeQuery):
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        super().__init__(self)
+
+    def contains(self, path):
+        parts = path.split('/')
+        return len(parts) >= 2 and len(parts) % 2 == 0 and parts[-2] == self.name
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+
+    def set(self, reference, data, merge=False):
+        self.ops.append(lambda: reference._set(data, merge))
+
+    def update(self, reference, data):
+        self.ops.append(lambda: reference._update(data))
+
+    def delete(self, reference):
+        self.ops.append(lambda: self.db.docs.pop(reference.path, None))
+
+    def commit(self):
+        with self.db.lock:
+            self.db.ops['batch_commits'] += 1
+        self.db._op('writes', len(self.ops))
+        with self.db.lock:
+            for op in self.ops:
+                op()
+        self.ops = []
+
+
+# ---------------------- Hashing Embeddings ----------------------
+class HashingEmbeddings:
+    # Deterministic bag-of-words embedding: each word and word bigram is hashed
+    # into `dim` buckets and the vector is L2-normalized. Implements the
+    # LangChain Embeddings interface (embed_documents / embed_query).
+    def __init__(self, dim=256):
+        self.dim = dim
+
+    def _embed(self, text):
+        words = re.findall(r'[a-z0-9]+', text.lower())
+        vector = [0.0] * self.dim
+        for token in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = hashlib.md5(token.encode('utf-8')).digest()
+            index = int.from_bytes(digest[:4], 'little') % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+# ---------------------- Synthetic USDA Records ----------------------
+BASE_FOODS = {
+    'Dairy and Egg Products': [
+        ('Milk, whole', 61, 3.2), ('Cheese, cheddar', 403, 25), ('Yogurt, Greek, plain', 59, 10),
+        ('Egg, whole, boiled', 155, 13), ('Cottage cheese, lowfat', 72, 12), ('Kefir, plain', 41, 3.8),
+    ],
+    'Poultry Products': [
+        ('Chicken breast, roasted', 165, 31), ('Turkey, ground, cooked', 203, 27), ('Chicken thigh, grilled', 209, 26),
+    ],
+    'Finfish and Shellfish Products': [
+        ('Salmon, Atlantic, baked', 206, 22), ('Tuna, canned in water', 116, 26), ('Cod, Pacific, cooked', 85, 19),
+        ('Shrimp, cooked', 99, 24), ('Crab, steamed', 97, 19), ('Sardines, canned in oil', 208, 25),
+    ],
+    'Legumes and Legume Products': [
+        ('Lentils, boiled', 116, 9), ('Chickpeas, canned', 139, 7), ('Tofu, firm', 144, 17),
+        ('Black beans, boiled', 132, 8.9), ('Peanut butter, smooth', 588, 25), ('Edamame, frozen', 121, 12),
+    ],
+    'Nut and Seed Products': [
+        ('Almonds, dry roasted', 598, 21), ('Walnuts, english', 654, 15), ('Cashews, raw', 553, 18),
+        ('Chia seeds', 486, 17), ('Pumpkin seeds, roasted', 574, 30),
+    ],
+    'Cereal Grains and Pasta': [
+        ('Oats, rolled', 379, 13), ('Quinoa, cooked', 120, 4.4), ('Brown rice, cooked', 123, 2.7),
+        ('Pasta, whole wheat, cooked', 149, 6), ('Barley, pearled, cooked', 123, 2.3), ('Couscous, cooked', 112, 3.8),
+    ],
+    'Vegetables and Vegetable Products': [
+        ('Broccoli, steamed', 35, 2.4), ('Spinach, raw', 23, 2.9), ('Sweet potato, baked', 90, 2),
+        ('Kale, raw', 49, 4.3), ('Carrots, raw', 41, 0.9), ('Eggplant, grilled', 35, 0.8),
+    ],
+    'Fruits and Fruit Juices': [
+        ('Banana, raw', 89, 1.1), ('Blueberries, raw', 57, 0.7), ('Apple, raw', 52, 0.3), ('Avocado, raw', 160, 2),
+    ],
+    'Baked Products': [
+        ('Bread, whole wheat', 252, 12), ('Crackers, whole grain', 443, 9), ('Bagel, plain', 257, 10),
+    ],
+}
+VARIANTS = ['', 'low sodium', 'organic', 'store brand', 'frozen', 'prepared', 'restaurant style', 'reduced fat']
+MICRONUTRIENTS = [
+    ('Water', 'G'), ('Ash', 'G'), ('Fiber, total dietary', 'G'), ('Sugars, total including NLEA', 'G'),
+    ('Calcium, Ca', 'MG'), ('Iron, Fe', 'MG'), ('Magnesium, Mg', 'MG'), ('Phosphorus, P', 'MG'),
+    ('Potassium, K', 'MG'), ('Sodium, Na', 'MG'), ('Zinc, Zn', 'MG'), ('Copper, Cu', 'MG'),
+    ('Manganese, Mn', 'MG'), ('Selenium, Se', 'UG'), ('Vitamin C, total ascorbic acid', 'MG'),
+    ('Thiamin', 'MG'), ('Riboflavin', 'MG'), ('Niacin', 'MG'), ('Pantothenic acid', 'MG'),
+    ('Vitamin B-6', 'MG'), ('Folate, total', 'UG'), ('Folic acid', 'UG'), ('Folate, food', 'UG'),
+    ('Folate, DFE', 'UG'), ('Choline, total', 'MG'), ('Vitamin B-12', 'UG'), ('Vitamin A, RAE', 'UG'),
+    ('Retinol', 'UG'), ('Carotene, beta', 'UG'), ('Carotene, alpha', 'UG'), ('Cryptoxanthin, beta', 'UG'),
+    ('Vitamin A, IU', 'IU'), ('Lycopene', 'UG'), ('Lutein + zeaxanthin', 'UG'),
+    ('Vitamin E (alpha-tocopherol)', 'MG'), ('Vitamin D (D2 + D3)', 'UG'), ('Vitamin K (phylloquinone)', 'UG'),
+    ('Fatty acids, total saturated', 'G'), ('Fatty acids, total monounsaturated', 'G'),
+    ('Fatty acids, total polyunsaturated', 'G'), ('Cholesterol', 'MG'), ('Tryptophan', 'G'),
+    ('Threonine', 'G'), ('Isoleucine', 'G'), ('Leucine', 'G'), ('Lysine', 'G'), ('Methionine', 'G'),
+    ('Cystine', 'G'), ('Phenylalanine', 'G'), ('Tyrosine', 'G'), ('Valine', 'G'), ('Arginine', 'G'),
+    ('Histidine', 'G'), ('Alanine', 'G'), ('Aspartic acid', 'G'), ('Glutamic acid', 'G'),
+]
+
+
+def synthetic_usda_records(count, seed=0):
+    # USDA-shaped records ({name, category, nutrients: [{name, amount, unit}]}) long
+    # enough that the old 1000-character splitter cuts most of them in two
+    rng = random.Random(seed)
+    foods = [(category, food) for category, items in BASE_FOODS.items() for food in items]
+    records = []
+    for i in range(count):
+        category, (name, calories, protein) = foods[i % len(foods)]
+        variant = VARIANTS[(i // len(foods)) % len(VARIANTS)]
+        scale = rng.uniform(0.7, 1.3)
+        kcal = round(calories * scale, 1)
+        protein_g = round(protein * rng.uniform(0.8, 1.2), 2)
+        fat_g = round(rng.uniform(0.1, 0.45) * kcal / 9, 2)
+        carbs_g = round(max(kcal - protein_g * 4 - fat_g * 9, 0) / 4, 2)
+        nutrients = [
+            {'name': 'Energy', 'amount': kcal, 'unit': 'KCAL'},
+            {'name': 'Energy', 'amount': round(kcal * 4.184, 1), 'unit': 'kJ'},
+            {'name': 'Protein', 'amount': protein_g, 'unit': 'G'},
+            {'name': 'Total lipid (fat)', 'amount': fat_g, 'unit': 'G'},
+            {'name': 'Carbohydrate, by difference', 'amount': carbs_g, 'unit': 'G'},
+        ]
+        micronutrients = [
+            {'name': nutrient, 'amount': round(rng.uniform(0, 50), 3), 'unit': unit}
+            for nutrient, unit in MICRONUTRIENTS
+        ]
+        # Real records don't always list the macros first
+        split = rng.randint(0, len(micronutrients))
+        nutrients = micronutrients[:split] + nutrients + micronutrients[split:]
+        full_name = f"{name}, {variant}" if variant else name
+        records.append({'name': f"{full_name} (NDB {10000 + i})", 'category': category, 'nutrients': nutrients})
+    return records
+
+
+_food_store = None
+_food_store_lock = threading.Lock()
+
+
+def synthetic_food_store(count=300):
+    # An in-memory Chroma collection of synthetic foods with the production
+    # metadata, built once per process (vector_store.set_food_store takes it)
+    global _food_store
+    with _food_store_lock:
+        if _food_store is None:
+            from langchain_chroma import Chroma
+            from data_processing import food_document
+            _food_store = Chroma(collection_name=f"foods-{uuid.uuid4().hex}", embedding_function=HashingEmbeddings())
+            _food_store.add_documents([food_document(record) for record in synthetic_usda_records(count)])
+        return _food_store
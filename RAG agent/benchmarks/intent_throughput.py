@@ -0,0 +1,102 @@
+# benchmarks/intent_throughput.py
+# Classification throughput at 1, 8 and 32 concurrent clients: the clients
+# sharing one in-process model that runs one query per forward pass (the
+# threads of one gunicorn worker) vs. the micro-batching sidecar.
+# With --stub the model is a sleep of a fixed cost per pass plus a cost per
+# query, run one pass at a time, so the sidecar's advantage there is exactly
+# the amortized fixed cost the stub assumes; only the real-model run measures
+# BART. --per-client-models gives each client its own stub instead (separate
+# workers with unlimited cores, the best case for per-worker models).
+#
+#   python benchmarks/intent_throughput.py            # real BART model
+#   python benchmarks/intent_throughput.py --stub     # stub model, no torch needed
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fakes import StubIntentClassifier
+from load_test import QUERIES, percentile
+from intent import INTENT_LABELS, get_intent_classifier
+from intent_service import IntentClient, serve
+
+ALL_QUERIES = [query for queries in QUERIES.values() for query in queries]
+
+
+def drive(classify, concurrency, requests_per_client):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(index):
+        for i in range(requests_per_client):
+            query = ALL_QUERIES[(index + i) % len(ALL_QUERIES)]
+            start = time.perf_counter()
+            classify(query)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        'concurrency': concurrency,
+        'throughput_qps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Intent classification throughput")
+    parser.add_argument('--stub', action='store_true', help="Use a stub model with fixed per-pass cost")
+    parser.add_argument('--stub-latency', type=float, default=0.04, help="Stub fixed cost per forward pass (s)")
+    parser.add_argument('--stub-item-latency', type=float, default=0.004, help="Stub cost per query in a pass (s)")
+    parser.add_argument('--requests', type=int, default=20, help="Requests per client")
+    parser.add_argument('--concurrency', type=str, default='1,8,32')
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    parser.add_argument('--per-client-models', action='store_true',
+                        help="With --stub, one model per client for the in-process baseline")
+    args = parser.parse_args()
+
+    if args.stub:
+        model = StubIntentClassifier(latency=args.stub_latency, item_latency=args.stub_item_latency)
+    else:
+        model = get_intent_classifier()
+    local = threading.local()
+
+    def in_process(query):
+        if not (args.stub and args.per_client_models):
+            return model(query, INTENT_LABELS)
+        if not hasattr(local, 'model'):
+            local.model = StubIntentClassifier(latency=args.stub_latency, item_latency=args.stub_item_latency)
+        return local.model(query, INTENT_LABELS)
+
+    socket_path = os.path.join(tempfile.mkdtemp(), 'intent.sock')
+    server = serve(socket_path, classifier=model, max_wait_ms=args.max_wait_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = IntentClient(socket_path)
+
+    report = []
+    for concurrency in [int(c) for c in args.concurrency.split(',')]:
+        baseline = drive(in_process, concurrency, args.requests)
+        sidecar = drive(client.classify, concurrency, args.requests)
+        report.append({'in_process': baseline, 'sidecar': sidecar})
+        print(f"{concurrency:>3} clients: in-process {baseline['throughput_qps']:>7} q/s "
+              f"(p95 {baseline['p95_ms']} ms) | sidecar {sidecar['throughput_qps']:>7} q/s "
+              f"(p95 {sidecar['p95_ms']} ms)")
+
+    server.shutdown()
+    print(json.dumps({'batches': server.batcher.batches, 'items': server.batcher.items, 'runs': report}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
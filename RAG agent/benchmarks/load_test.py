@@ -0,0 +1,218 @@
+# benchmarks/load_test.py
+# Offline end-to-end load test of /query with a fake LLM, in-memory Firestore
+# and a stub intent classifier.
+#
+#   python benchmarks/load_test.py --rps 20 --duration 30
+#   python benchmarks/load_test.py --save-baseline benchmarks/baseline.json
+#   python benchmarks/load_test.py --compare benchmarks/baseline.json
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fakes import FakeLLM, FakeFirestore, StubIntentClassifier
+
+QUERIES = {
+    'general': [
+        "How much protein should I eat after training?",
+        "Is intermittent fasting good for weight loss?",
+        "What are good sources of fiber?",
+    ],
+    'meal': [
+        "Generate a meal plan for me",
+        "Create a high protein meal plan",
+    ],
+    'workout': [
+        "Generate a workout plan for me",
+        "Create a beginner workout plan",
+    ],
+}
+DEFAULT_MIX = {'general': 0.6, 'meal': 0.2, 'workout': 0.2}
+USER_PROFILE = {
+    'name': 'Bench User',
+    'gender': 'Female',
+    'age': 29,
+    'height': 168,
+    'weight': 64,
+    'healthConditions': 'None',
+    'foodAllergies': 'Peanuts',
+    'preferenceFood': 'Asian',
+    'fitnessGoals': {'endurance': False, 'muscleGain': True, 'strength': False, 'weightLoss': True},
+    'workoutLevelString': 'Moderate',
+}
+REGRESSION_TOLERANCE = 0.10  # Fail --compare when latency/throughput is >10% worse
+
+
+def install_fakes(llm, db, classifier):
+    import config
+    import llm_setup
+    import intent
+    import vector_store
+    from app import create_app
+    from fakes import synthetic_food_store
+
+    config.set_db(db)
+    llm_setup.set_llms(llm=llm, summary_llm=llm, structured_llm=llm)
+    intent.set_intent_classifier(classifier)
+    vector_store.set_food_store(synthetic_food_store())
+    return create_app(warm=False)
+
+
+def seed_users(db, count):
+    user_ids = [f"bench-user-{i}" for i in range(count)]
+    for user_id in user_ids:
+        db.collection('users').document(user_id).set(dict(USER_PROFILE, name=f"Bench User {user_id}"))
+    db.reset_ops()
+    return user_ids
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(latencies):
+    return {
+        'count': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def run_load(app, user_ids, rps, duration, mix, weekly_ratio, seed, max_workers):
+    rng = random.Random(seed)
+    kinds, weights = zip(*mix.items())
+    total_requests = int(rps * duration)
+    schedule = []
+    for i in range(total_requests):
+        kind = rng.choices(kinds, weights)[0]
+        schedule.append((i / rps, kind, {
+            'query': rng.choice(QUERIES[kind]),
+            'user_id': rng.choice(user_ids),
+            'isWeekly': 'true' if kind != 'general' and rng.random() < weekly_ratio else 'false',
+        }))
+
+    results = []
+    lock = threading.Lock()
+    local = threading.local()
+
+    def send(kind, payload):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        start = time.perf_counter()
+        response = local.client.post('/query', json=payload)
+        elapsed = time.perf_counter() - start
+        with lock:
+            results.append((kind, elapsed, response.status_code))
+
+    # Open-loop: requests are sent on schedule whether or not earlier ones finished
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for offset, kind, payload in schedule:
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, kind, payload)
+    elapsed = time.perf_counter() - started
+    return results, elapsed
+
+
+def build_report(results, elapsed, rps, llm, db):
+    ok = [r for r in results if r[2] == 200]
+    report = {
+        'target_rps': rps,
+        'requests': len(results),
+        'errors': len(results) - len(ok),
+        'throughput_rps': round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        'latency': summarize([r[1] for r in ok]),
+        'by_kind': {
+            kind: summarize([r[1] for r in ok if r[0] == kind])
+            for kind in sorted({r[0] for r in results})
+        },
+        'firestore_ops': dict(db.ops),
+        'llm_calls': llm.calls,
+        'llm_calls_by_kind': dict(llm.calls_by_kind),
+    }
+    report['firestore_ops_per_request'] = {
+        key: round(value / max(len(results), 1), 2) for key, value in db.ops.items()
+    }
+    return report
+
+
+def compare(report, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = []
+    print(f"\nComparison against {baseline_path}:")
+    for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+        old, new = baseline['latency'][key], report['latency'][key]
+        change = (new - old) / old if old else 0.0
+        print(f"  latency {key}: {old} -> {new} ({change:+.1%})")
+        if change > REGRESSION_TOLERANCE:
+            regressions.append(key)
+    old, new = baseline['throughput_rps'], report['throughput_rps']
+    change = (new - old) / old if old else 0.0
+    print(f"  throughput_rps: {old} -> {new} ({change:+.1%})")
+    if change < -REGRESSION_TOLERANCE:
+        regressions.append('throughput_rps')
+    for key, new in report['firestore_ops_per_request'].items():
+        old = baseline.get('firestore_ops_per_request', {}).get(key)
+        print(f"  firestore {key}/request: {old} -> {new}")
+    print(f"  llm_calls: {baseline.get('llm_calls')} -> {report['llm_calls']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for /query")
+    parser.add_argument('--rps', type=float, default=10.0)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--users', type=int, default=25)
+    parser.add_argument('--mix', type=str, default=None,
+                        help="JSON mix of request kinds, e.g. '{\"general\": 0.5, \"meal\": 0.3, \"workout\": 0.2}'")
+    parser.add_argument('--weekly-ratio', type=float, default=0.5, help="Share of plan requests that are weekly")
+    parser.add_argument('--llm-latency', type=float, default=0.05, help="Mean fake LLM latency (seconds)")
+    parser.add_argument('--llm-jitter', type=float, default=0.02)
+    parser.add_argument('--firestore-latency', type=float, default=0.002)
+    parser.add_argument('--classifier-latency', type=float, default=0.01)
+    parser.add_argument('--max-workers', type=int, default=64, help="Concurrent in-flight requests")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--save-baseline', type=str, default=None)
+    parser.add_argument('--compare', type=str, default=None)
+    args = parser.parse_args()
+
+    llm = FakeLLM(latency=args.llm_latency, jitter=args.llm_jitter, seed=args.seed)
+    db = FakeFirestore(latency=args.firestore_latency)
+    classifier = StubIntentClassifier(latency=args.classifier_latency)
+    app = install_fakes(llm, db, classifier)
+    user_ids = seed_users(db, args.users)
+
+    mix = json.loads(args.mix) if args.mix else DEFAULT_MIX
+    results, elapsed = run_load(app, user_ids, args.rps, args.duration, mix,
+                                args.weekly_ratio, args.seed, args.max_workers)
+    report = build_report(results, elapsed, args.rps, llm, db)
+    print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.compare:
+        regressions = compare(report, args.compare)
+        if regressions:
+            print(f"Regressions beyond {REGRESSION_TOLERANCE:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# benchmarks/plan_diff_bench.py
+# LLM calls and Firestore writes for edits to an existing week: a full weekly
+# regeneration versus the plan-diff path, which regenerates only the days a
+# request or profile change affects and updates those documents in place.
+import logging
+import os
+import sys
+from datetime import date, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import config
+import llm_setup
+import vector_store
+from fakes import FakeFirestore, FakeLLM, synthetic_food_store
+from load_test import USER_PROFILE
+
+USER_ID = 'bench-user'
+WEEK_START = date(2025, 1, 6)  # A Monday
+DAY_CALLS = ('meal_day', 'workout_day')
+
+
+def setup():
+    db = FakeFirestore()
+    llm = FakeLLM(seed=1)
+    config.set_db(db)
+    llm_setup.set_llms(llm=llm, summary_llm=llm, structured_llm=llm)
+    vector_store.set_food_store(synthetic_food_store())
+    db.collection('users').document(USER_ID).set(dict(USER_PROFILE, foodAllergies='None'))
+    return db, llm
+
+
+def seed_week(db):
+    # A generated week; Wednesday and Saturday dinners use salmon, the others chicken
+    from qa_agent import generate_plans
+    generate_plans("Generate my weekly meal plan", USER_ID, True, WEEK_START, True, False)
+    generate_plans("Generate my weekly workout plan", USER_ID, True, WEEK_START, False, True)
+    for path, doc in db.docs.items():
+        if '/meal_plans/' in path:
+            fish = doc['target_date'].weekday() in (2, 5)
+            doc['content']['dinner']['food_items'][0] = 'Salmon, Atlantic, baked' if fish else 'Chicken thigh, roasted'
+            doc['metadata']['ingredients'] = [
+                item for meal in ('breakfast', 'lunch', 'dinner') for item in doc['content'][meal]['food_items']
+            ]
+
+
+def plan_docs(db, collection):
+    return {path: doc for path, doc in db.docs.items() if f'/{collection}/' in path}
+
+
+def measure(db, llm, name, query, is_meal, profile_update=None, is_weekly=True):
+    from qa_agent import generate_plans
+    if profile_update:
+        db.collection('users').document(USER_ID).update(profile_update)
+    collection = 'meal_plans' if is_meal else 'workout_plans'
+    before = {path: dict(doc) for path, doc in plan_docs(db, collection).items()}
+    llm.calls_by_kind.clear()
+    llm.calls = 0
+    db.reset_ops()
+    message = generate_plans(query, USER_ID, is_weekly, WEEK_START, is_meal, not is_meal)
+    after = plan_docs(db, collection)
+    # Regenerated documents get a new save timestamp (the fake LLM may return the same content)
+    changed = sum(1 for path, doc in after.items() if path in before and before[path]['date'] != doc['date'])
+    day_calls = sum(llm.calls_by_kind.get(kind, 0) for kind in DAY_CALLS)
+    print(f"{name:<38}{day_calls:>10}{llm.calls:>11}{db.ops['writes']:>12}{len(after) - len(before):>10}{changed:>9}")
+    return message, day_calls
+
+
+def main():
+    logging.disable(logging.WARNING)
+    print(f"{'request':<38}{'day calls':>10}{'llm calls':>11}{'doc writes':>12}{'new docs':>10}{'updated':>9}")
+
+    db, llm = setup()
+    seed_week(db)
+    _, calls = measure(db, llm, "full week (before: every request)", "Generate my weekly meal plan", True)
+    assert calls == 7
+
+    db, llm = setup()
+    seed_week(db)
+    _, calls = measure(db, llm, "new peanut allergy, no conflicts", "Update my weekly meal plan", True,
+                       {'foodAllergies': 'Peanuts'})
+    assert calls == 0
+    _, calls = measure(db, llm, "new fish allergy", "Update my weekly meal plan", True,
+                       {'foodAllergies': 'Peanuts, Fish'})
+    assert calls == 2  # Wednesday and Saturday
+    _, calls = measure(db, llm, "swap Tuesday's dinner", "Swap Tuesday's dinner for something lighter", True)
+    assert calls == 1
+    _, calls = measure(db, llm, "workout on Monday and Friday", "Change Monday and Friday's workout to easier ones", False)
+    assert calls == 2
+    _, calls = measure(db, llm, "new workout level", "Update my weekly workout plan", False,
+                       {'workoutLevelString': 'Very mild'})
+    assert calls == 7
+    _, calls = measure(db, llm, "daily update after weight change", "Update my meals plan", True,
+                       {'weight': 95}, is_weekly=False)
+    assert calls == 1
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# benchmarks/pregenerate_bench.py
+# Offline run of the batch pre-generation job with a fake LLM and in-memory
+# Firestore: serial vs concurrent workers under the shared rate limit, the
+# number of Firestore write commits, resuming an interrupted run, and the
+# users' own plan requests once their week has been pre-generated.
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import config
+import llm_setup
+import vector_store
+from fakes import FakeFirestore, FakeLLM, synthetic_food_store
+from load_test import USER_PROFILE
+
+ACTIVE_USERS = 12
+INACTIVE_USERS = 4
+LLM_LATENCY = 0.05
+RPM = 3000
+WEEK_START = date(2025, 1, 6)
+
+
+def setup():
+    db = FakeFirestore()
+    llm = FakeLLM(latency=LLM_LATENCY, seed=1)
+    config.set_db(db)
+    llm_setup.set_llms(llm=llm, summary_llm=llm, structured_llm=llm)
+    vector_store.set_food_store(synthetic_food_store())
+    now = datetime.now(timezone.utc)
+    for i in range(ACTIVE_USERS + INACTIVE_USERS):
+        user_ref = db.collection('users').document(f"user-{i:03d}")
+        user_ref.set(dict(USER_PROFILE, name=f"User {i}"))
+        last_seen = now - timedelta(days=2 if i < ACTIVE_USERS else 40)
+        user_ref.collection('chat_history').document().set({'user': 'hi', 'bot': 'hello', 'timestamp': last_seen})
+    db.reset_ops()
+    return db, llm
+
+
+def plan_docs(db):
+    return sum(1 for path in db.docs if '/meal_plans/' in path or '/workout_plans/' in path)
+
+
+def timed_run(workers, checkpoint_path, limit=None):
+    import pregenerate
+    start = time.perf_counter()
+    stats = pregenerate.run(WEEK_START, workers=workers, checkpoint_path=checkpoint_path, limit=limit)
+    return stats, time.perf_counter() - start
+
+
+def main():
+    logging.disable(logging.WARNING)
+    import pregenerate
+
+    print(f"{ACTIVE_USERS} active users, fake LLM {LLM_LATENCY * 1000:.0f} ms/call, {RPM} rpm limit")
+    print(f"{'workers':>8}{'seconds':>10}{'llm calls':>11}{'calls/min':>11}{'doc writes':>12}{'commits':>9}{'plan docs':>11}")
+    for workers in (1, 4, 8):
+        db, llm = setup()
+        pregenerate.limit_llm_rate(RPM)
+        with tempfile.TemporaryDirectory() as tmp:
+            stats, elapsed = timed_run(workers, os.path.join(tmp, 'checkpoint.json'))
+        print(f"{workers:>8}{elapsed:>10.2f}{llm.calls:>11}{llm.calls / elapsed * 60:>11.0f}"
+              f"{db.ops['writes']:>12}{db.ops['batch_commits']:>9}{plan_docs(db):>11}")
+
+    # Interrupted run, then resume from the checkpoint
+    db, llm = setup()
+    pregenerate.limit_llm_rate(RPM)
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint_path = os.path.join(tmp, 'checkpoint.json')
+        first, _ = timed_run(4, checkpoint_path, limit=5)
+        calls_first = llm.calls
+        second, _ = timed_run(4, checkpoint_path)
+        third, _ = timed_run(4, checkpoint_path)
+    print(f"Resume: first run {first['users']} users ({calls_first} LLM calls), "
+          f"resumed run {second['users']} users ({llm.calls - calls_first} LLM calls), "
+          f"re-run {third['users']} users; {plan_docs(db)} plan docs "
+          f"(expected {ACTIVE_USERS * 14})")
+    assert plan_docs(db) == ACTIVE_USERS * 14
+
+    # The users then tap the app's update buttons: the first tap of the week
+    # gets the pre-generated plans, a second tap a fresh week
+    from qa_agent import generate_plans
+    for tap in ('first', 'second'):
+        calls_before, docs_before = llm.calls, plan_docs(db)
+        for i in range(ACTIVE_USERS):
+            for query, is_meal in (("Update my meals plan", True), ("Update my workout plan", False)):
+                generate_plans(query, f"user-{i:03d}", True, WEEK_START, is_meal, not is_meal)
+        print(f"App {tap} tap: {ACTIVE_USERS * 2} requests, {llm.calls - calls_before} LLM calls, "
+              f"{plan_docs(db) - docs_before} new plan docs")
+        assert (llm.calls == calls_before) == (tap == 'first')
+
+
+if __name__ == '__main__':
+    main()
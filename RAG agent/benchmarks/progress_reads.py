@@ -0,0 +1,91 @@
+# benchmarks/progress_reads.py
+# Firestore reads needed to draw the progress charts: aggregating the raw
+# per-day event docs on the client (what progress_page.dart does) versus
+# reading the weekly/monthly rollups. Also checks both give the same numbers.
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import config
+from fakes import FakeFirestore
+from progress import compact_user, get_progress, record_day
+
+USER_ID = 'bench-user'
+HISTORY_DAYS = 365
+TODAY = date(2025, 12, 31)
+
+
+def seed_events(db, rng):
+    user_ref = db.collection('users').document(USER_ID)
+    events = {}
+    for offset in range(HISTORY_DAYS):
+        day = TODAY - timedelta(days=offset)
+        calories = rng.randint(1400, 2600)
+        exercises = {f"exercise {i}": rng.random() < 0.7 for i in range(rng.randint(3, 6))}
+        stamp = datetime.combine(day, datetime.min.time())
+        user_ref.collection('calories_consumed').document(day.isoformat()).set(
+            {'date': stamp, 'calories_consumed': calories, 'completed_meals': {}})
+        user_ref.collection('exercise_completions').document(day.isoformat()).set(
+            {'date': stamp, 'completed_exercises': exercises})
+        events[day] = (calories, exercises)
+    return events
+
+
+def client_side(db, start, end):
+    # progress_page.dart: query both event collections since the start date
+    user_ref = db.collection('users').document(USER_ID)
+    stamp = datetime.combine(start, datetime.min.time())
+    calories = {doc.id: doc.to_dict()['calories_consumed']
+                for doc in user_ref.collection('calories_consumed').where('date', '>=', stamp).stream()}
+    completion = {}
+    for doc in user_ref.collection('exercise_completions').where('date', '>=', stamp).stream():
+        done = doc.to_dict()['completed_exercises']
+        completion[doc.id] = round(sum(1 for v in done.values() if v) / len(done) * 100, 1) if done else 0.0
+    return calories, completion
+
+
+def reads(db, fn):
+    db.reset_ops()
+    result = fn()
+    return db.ops['reads'], result
+
+
+def main():
+    rng = random.Random(7)
+    db = FakeFirestore()
+    config.set_db(db)
+    events = seed_events(db, rng)
+
+    # Rollups are built on write; compaction over the whole history gives the same documents
+    for day, (calories, exercises) in events.items():
+        record_day(USER_ID, day, calories, exercises)
+    db.reset_ops()
+    compact_user(USER_ID, TODAY - timedelta(days=HISTORY_DAYS))
+    print(f"Full compaction of {HISTORY_DAYS} days: {db.ops['reads']} reads, {db.ops['writes']} writes")
+
+    views = [
+        ('last 7 days, daily', 'day', TODAY - timedelta(days=6)),
+        ('last 12 weeks, weekly', 'week', TODAY - timedelta(weeks=12) + timedelta(days=1)),
+        ('last 12 months, monthly', 'month', date(TODAY.year, 1, 1)),
+    ]
+    print(f"{'view':<26}{'client reads':>14}{'rollup reads':>14}")
+    for name, granularity, start in views:
+        client_reads, (calories, completion) = reads(db, lambda: client_side(db, start, TODAY))
+        rollup_reads, points = reads(db, lambda: get_progress(USER_ID, start, TODAY, granularity))
+        print(f"{name:<26}{client_reads:>14}{rollup_reads:>14}")
+
+        if granularity == 'day':
+            for point in points:
+                assert point['calories_consumed'] == calories.get(point['date'], 0.0), point
+                assert point['exercise_completion_pct'] == completion.get(point['date'], 0.0), point
+        else:
+            assert sum(point['calories_consumed'] for point in points) == sum(calories.values())
+    print("Rollup points match client-side aggregation")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+# benchmarks/resilience_bench.py
+# Exercises resilience.py with a fake LLM that injects latency spikes and
+# errors. Part 1 compares tail latency of bare llm.invoke with deadline +
+# hedged calls; part 2 sends /query traffic through a healthy phase, an outage
+# where every call hangs, and a recovery, and shows what users were served.
+# Timeouts are scaled down (seconds instead of tens of seconds) to keep the
+# run short.
+#
+#   python benchmarks/resilience_bench.py --calls 400 --spike-rate 0.03
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import resilience
+from fakes import FakeFirestore, FakeLLM, StubIntentClassifier
+from load_test import QUERIES, install_fakes, percentile, seed_users
+
+PROMPT = "What are good sources of fiber?"
+
+
+def timed_call(fn):
+    start = time.perf_counter()
+    try:
+        fn()
+        outcome = 'ok'
+    except resilience.DeadlineExceeded:
+        outcome = 'timeout'
+    except Exception:
+        outcome = 'error'
+    return time.perf_counter() - start, outcome
+
+
+def tail_latency(args):
+    print(f"Part 1: {args.calls} calls, base {args.latency}s, {args.spike_rate:.0%} spikes of +{args.spike_latency}s, "
+          f"{args.error_rate:.0%} errors, step timeout {resilience.STEP_TIMEOUTS['general']}s")
+    print(f"{'':<22}{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}{'max ms':>8}{'ok':>6}{'timeout':>9}{'error':>7}{'LLM calls':>11}")
+    for label, make_call in (
+        ("bare invoke", lambda llm: (lambda: llm.invoke(PROMPT))),
+        ("deadline + hedging", lambda llm: (lambda: resilience.resilient_invoke(llm, PROMPT))),
+    ):
+        llm = FakeLLM(latency=args.latency, jitter=args.latency / 4, seed=1, spike_rate=args.spike_rate,
+                      spike_latency=args.spike_latency, error_rate=args.error_rate)
+        resilience.reset_breakers()
+        fn = make_call(llm)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: timed_call(fn), range(args.calls)))
+        latencies = [seconds * 1000 for seconds, _ in results]
+        outcomes = [outcome for _, outcome in results]
+        print(f"{label:<22}{percentile(latencies, 50):>8.0f}{percentile(latencies, 95):>8.0f}"
+              f"{percentile(latencies, 99):>8.0f}{max(latencies):>8.0f}{outcomes.count('ok'):>6}"
+              f"{outcomes.count('timeout'):>9}{outcomes.count('error'):>7}{llm.calls:>11}")
+
+
+def served(answer):
+    if answer.endswith(resilience.DEGRADED_NOTICE):
+        return 'degraded (cached)'
+    if answer == resilience.UNAVAILABLE_MESSAGE:
+        return 'unavailable'
+    if answer.startswith("I apologize"):
+        return 'error'
+    return 'answered'
+
+
+def outage(args):
+    llm = FakeLLM(latency=args.latency, seed=2)
+    db = FakeFirestore()
+    client = install_fakes(llm, db, StubIntentClassifier()).test_client()
+    user_ids = seed_users(db, 4)
+    resilience.reset_breakers()
+    questions = QUERIES['general'] + ["Which vegetables are highest in iron?"]  # Last one is never answered before
+
+    print(f"\nPart 2: /query through an outage (each breaker opens after {resilience.BREAKER_FAILURES} "
+          f"failures, probes after {resilience.BREAKER_RESET_SECONDS}s)")
+    print(f"{'phase':<12}{'requests':>9}{'p50 ms':>8}{'max ms':>8}  served")
+    for phase, spike_rate, count in (('healthy', 0.0, 6), ('outage', 1.0, 16), ('recovery', 0.0, 6)):
+        llm.spike_rate, llm.spike_latency = spike_rate, 30.0
+        if phase == 'recovery':
+            time.sleep(resilience.BREAKER_RESET_SECONDS)
+        latencies, kinds = [], {}
+        for i in range(count):
+            index = i % (len(questions) - 1 if phase == 'healthy' else len(questions))
+            # Each question comes from the same user: degraded answers are only reused per user
+            start = time.perf_counter()
+            answer = client.post('/query', json={
+                'query': questions[index], 'user_id': user_ids[index % len(user_ids)], 'isWeekly': 'false'
+            }).get_json()['response']
+            latencies.append((time.perf_counter() - start) * 1000)
+            kinds[served(answer)] = kinds.get(served(answer), 0) + 1
+        summary = ', '.join(f"{kind} {n}" for kind, n in kinds.items())
+        print(f"{phase:<12}{count:>9}{percentile(latencies, 50):>8.0f}{max(latencies):>8.0f}  {summary}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deadlines, hedging and circuit breaker with injected faults")
+    parser.add_argument('--calls', type=int, default=400)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--spike-rate', type=float, default=0.03)
+    parser.add_argument('--spike-latency', type=float, default=5.0)
+    parser.add_argument('--error-rate', type=float, default=0.01)
+    parser.add_argument('--step-timeout', type=float, default=2.0)
+    args = parser.parse_args()
+
+    resilience.STEP_TIMEOUTS.update({'general': args.step_timeout, 'summary': args.step_timeout})
+    resilience.HEDGE_MIN_DELAY = args.latency
+    resilience.BREAKER_RESET_SECONDS = 2.0
+    tail_latency(args)
+    outage(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+# benchmarks/retrieval_bench.py
+# Old USDA pipeline (1000-char chunks, {"source": "USDA"} only, k=20 then
+# filter in Python) versus record-aware documents with typed metadata and the
+# filter pushed into the Chroma query (k=5). Uses synthetic USDA-shaped
+# records and a hashing embedding, so no API key or data file is needed.
+#
+#   python benchmarks/retrieval_bench.py --foods 5000
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_chroma import Chroma
+from data_processing import food_document, food_metadata
+from fakes import HashingEmbeddings, synthetic_usda_records
+from load_test import percentile
+from vector_store import food_filter, get_filtered_retriever
+
+RESULTS_WANTED = 5
+REPEATS = 20
+TRUTH = {}  # Food name -> metadata from the source record
+# (query, excluded allergen flags, category, max calories, min protein)
+QUERIES = [
+    ("high protein breakfast without dairy or eggs", ['contains_dairy', 'contains_egg'], None, 300, 10),
+    ("fish dinner, shellfish allergy", ['contains_shellfish'], 'Finfish and Shellfish Products', None, 15),
+    ("nut free snack", ['contains_peanut', 'contains_tree_nut'], None, 250, None),
+    ("plant protein legumes without soy", ['contains_soy'], 'Legumes and Legume Products', None, 5),
+    ("gluten free whole grain side", ['contains_gluten'], 'Cereal Grains and Pasta', 200, None),
+    ("low calorie vegetable", [], 'Vegetables and Vegetable Products', 60, None),
+]
+
+
+def legacy_documents(records):
+    # data_processing.process_json before record-aware chunking
+    documents = []
+    for item in records:
+        text_content = f"Food: {item.get('name', 'N/A')}\n"
+        if 'nutrients' in item:
+            nutrients_text = [
+                f"{nutrient.get('name', 'N/A')}: {nutrient.get('amount', 'N/A')} {nutrient.get('unit', '')}"
+                for nutrient in item['nutrients']
+            ]
+            text_content += "Nutrients:\n" + "\n".join(nutrients_text)
+        documents.append(Document(page_content=text_content, metadata={"source": "USDA"}))
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=20)
+    return splitter.split_documents(documents)
+
+
+def satisfies(metadata, excluded, category, max_calories, min_protein):
+    return (
+        not any(metadata[flag] for flag in excluded)
+        and (category is None or metadata['category'] == category)
+        and (max_calories is None or metadata['calories'] <= max_calories)
+        and (min_protein is None or metadata['protein_g'] >= min_protein)
+    )
+
+
+def legacy_post_filter(chunk, excluded, category, max_calories, min_protein):
+    # All the old pipeline can check is what survives in the chunk text
+    name = re.search(r'^Food: (.+)$', chunk.page_content, re.MULTILINE)
+    calories = re.search(r'^Energy: ([\d.]+) KCAL$', chunk.page_content, re.MULTILINE)
+    protein = re.search(r'^Protein: ([\d.]+) G$', chunk.page_content, re.MULTILINE)
+    if not name or (max_calories is not None and not calories) or (min_protein is not None and not protein):
+        return None
+    if category is not None:
+        return None  # Category isn't in the old documents at all
+    metadata = food_metadata({'name': name.group(1)})
+    metadata['calories'] = float(calories.group(1)) if calories else 0.0
+    metadata['protein_g'] = float(protein.group(1)) if protein else 0.0
+    return name.group(1) if satisfies(metadata, excluded, None, max_calories, min_protein) else None
+
+
+def build_store(path, documents, embeddings):
+    store = Chroma(persist_directory=path, embedding_function=embeddings)
+    for i in range(0, len(documents), 5000):
+        store.add_documents(documents[i:i + 5000])
+    return store
+
+
+def run_queries(search):
+    latencies, returned, correct = [], 0, 0
+    for query, excluded, category, max_calories, min_protein in QUERIES:
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            names = search(query, excluded, category, max_calories, min_protein)
+            latencies.append((time.perf_counter() - start) * 1000)
+        returned += len(names)
+        correct += sum(1 for name in names if TRUTH.get(name) and satisfies(
+            TRUTH[name], excluded, category, max_calories, min_protein))
+    return {
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'filled': f"{returned}/{RESULTS_WANTED * len(QUERIES)}",
+        'precision': round(correct / returned, 2) if returned else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval latency/quality: old chunks vs record-aware documents")
+    parser.add_argument('--foods', type=int, default=5000)
+    args = parser.parse_args()
+
+    records = synthetic_usda_records(args.foods)
+    TRUTH.update({record['name']: food_metadata(record) for record in records})
+    embeddings = HashingEmbeddings()
+    legacy_docs = legacy_documents(records)
+    record_docs = [food_document(record) for record in records]
+    print(f"{args.foods} foods -> {len(legacy_docs)} legacy chunks, {len(record_docs)} record documents")
+
+    workdir = tempfile.mkdtemp(prefix='retrieval_bench_')
+    try:
+        start = time.perf_counter()
+        legacy_store = build_store(os.path.join(workdir, 'legacy'), legacy_docs, embeddings)
+        record_store = build_store(os.path.join(workdir, 'records'), record_docs, embeddings)
+        print(f"Built both stores in {time.perf_counter() - start:.1f}s")
+        legacy_retriever = legacy_store.as_retriever(search_kwargs={"k": 20})
+
+        def legacy_unfiltered(query, *constraints):
+            names = []
+            for chunk in legacy_retriever.invoke(query):
+                name = re.search(r'^Food: (.+)$', chunk.page_content, re.MULTILINE)
+                if name and name.group(1) not in names:
+                    names.append(name.group(1))
+            return names[:RESULTS_WANTED]
+
+        def legacy_filtered(query, *constraints):
+            names = []
+            for chunk in legacy_retriever.invoke(query):
+                name = legacy_post_filter(chunk, *constraints)
+                if name and name not in names:
+                    names.append(name)
+            return names[:RESULTS_WANTED]
+
+        record_retriever = record_store.as_retriever(search_kwargs={"k": 20})
+
+        def records_unfiltered(query, *constraints):
+            return [doc.metadata['name'] for doc in record_retriever.invoke(query)][:RESULTS_WANTED]
+
+        def records_filtered(query, *constraints):
+            names = [doc.metadata['name'] for doc in record_retriever.invoke(query) if satisfies(doc.metadata, *constraints)]
+            return names[:RESULTS_WANTED]
+
+        def pushdown(query, excluded, category, max_calories, min_protein):
+            where = food_filter(excluded, category, max_calories, min_protein)
+            retriever = get_filtered_retriever(record_store, where, k=RESULTS_WANTED)
+            return [doc.metadata['name'] for doc in retriever.invoke(query)]
+
+        print(f"{'pipeline':<40}{'p50 ms':>8}{'p95 ms':>8}{'filled':>8}{'precision':>11}")
+        for name, search in (
+            ("old: k=20 chunks, no filter", legacy_unfiltered),
+            ("old: k=20 chunks, filter in Python", legacy_filtered),
+            ("records: k=20, no filter", records_unfiltered),
+            ("records: k=20, filter in Python", records_filtered),
+            ("records: where pushdown, k=5", pushdown),
+        ):
+            result = run_queries(search)
+            print(f"{name:<40}{result['p50_ms']:>8}{result['p95_ms']:>8}{result['filled']:>8}{result['precision']:>11}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
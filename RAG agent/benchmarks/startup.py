@@ -0,0 +1,54 @@
+# benchmarks/startup.py
+# Measures worker boot cost: time to import the app and build it with
+# create_app(), plus peak RSS, each in a fresh interpreter.
+#
+#   python benchmarks/startup.py            # lazy boot (default)
+#   python benchmarks/startup.py --warm-up  # boot + intent classifier warm-up
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, resource, sys, time
+start = time.perf_counter()
+import app as app_module
+imported = time.perf_counter()
+app_module.create_app(warm={warm})
+built = time.perf_counter()
+print(json.dumps({{
+    'import_s': round(imported - start, 3),
+    'create_app_s': round(built - imported, 3),
+    'total_s': round(built - start, 3),
+    'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    'heavy_modules_loaded': sorted(m for m in ('torch', 'transformers', 'firebase_admin', 'langchain_google_genai')
+                                   if m in sys.modules),
+}}))
+"""
+
+
+def measure(warm, runs):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE.format(warm=warm)],
+            cwd=APP_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    best = min(samples, key=lambda sample: sample['total_s'])
+    return dict(best, runs=runs, warm_up=warm)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app boot time and RSS")
+    parser.add_argument('--warm-up', action='store_true')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(measure(args.warm_up, args.runs), indent=2))
+
+
+if __name__ == '__main__':
+    main()
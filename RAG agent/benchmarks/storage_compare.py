@@ -0,0 +1,77 @@
+# benchmarks/storage_compare.py
+# Compares the legacy plan document (indented JSON string + empty metadata)
+# with native maps + precomputed metadata: stored bytes, bytes a page reads,
+# and read + client decode time for a week of plans.
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import config
+from fakes import FakeFirestore, RECORDED_RESPONSES_PATH
+from plan_storage import (
+    PLAN_VIEWS, build_plan_document, decode_plan, firestore_document_size, get_plans, plan_collection
+)
+
+USER_ID = 'bench-user'
+REPEATS = 200
+
+
+def legacy_document(plan_type, plan, target_date):
+    return {
+        'type': plan_type,
+        'content': json.dumps(plan, indent=2),
+        'date': datetime.now(),
+        'target_date': target_date,
+        'metadata': {'calories': None, 'exercises': [], 'ingredients': []},
+    }
+
+
+def seed(db, build):
+    with open(RECORDED_RESPONSES_PATH, 'r', encoding='utf-8') as f:
+        recorded = json.load(f)
+    plans = {'meal': json.loads(recorded['meal_day']), 'workout': json.loads(recorded['workout_day'])}
+    start = datetime(2025, 1, 6)
+    sizes = {}
+    for plan_type, plan in plans.items():
+        collection = db.collection('users').document(USER_ID).collection(plan_collection(plan_type))
+        for day in range(7):
+            ref = collection.document()
+            document = build(plan_type, plan, start + timedelta(days=day))
+            ref.set(document)
+            sizes.setdefault(plan_type, firestore_document_size(ref.path, document))
+    return start, sizes
+
+
+def timed_reads(db, plan_type, start, view):
+    end = start + timedelta(days=7)
+    payload = 0
+    begin = time.perf_counter()
+    for _ in range(REPEATS):
+        plans = get_plans(USER_ID, plan_type, start, end, view)
+    elapsed = (time.perf_counter() - begin) / REPEATS
+    payload = sum(len(json.dumps(plan, default=str)) for plan in plans)
+    return round(elapsed * 1000, 3), payload
+
+
+def main():
+    report = {}
+    for name, build in (('legacy', legacy_document),
+                        ('native', lambda t, p, d: build_plan_document(t, p, d, datetime.now()))):
+        db = FakeFirestore()
+        config.set_db(db)
+        start, sizes = seed(db, build)
+        report[name] = {'stored_bytes_per_doc': sizes}
+        for plan_type in ('meal', 'workout'):
+            for view in (['day'] if name == 'legacy' else ['day', 'summary']):
+                ms, payload = timed_reads(db, plan_type, start, view)
+                report[name][f'{plan_type}_{view}_week'] = {'read_decode_ms': ms, 'payload_bytes': payload}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+# benchmarks/tts_bench.py
+# The old speak_text (fixed 200-character slices, synthesize then play, spin on
+# get_busy) versus tts_pipeline.speak (sentence chunks, next chunk synthesized
+# while the current one plays, waiting on the mixer's end event, audio cache).
+# A stub synthesizer sleeps like a gTTS request and a stub mixer "plays" for a
+# duration proportional to the text, so the timings are reproducible offline.
+#
+#   python benchmarks/tts_bench.py --synth-ms 300 --play-ms-per-char 5
+import argparse
+import os
+import struct
+import sys
+import time
+from types import SimpleNamespace
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from tts_pipeline import AudioCache, MixerPlayer, speak
+
+ANSWER = (
+    "Great question! For muscle gain you should aim for about 1.6 to 2.2 grams of protein per kilogram of body "
+    "weight each day, spread across three or four meals. Good sources are chicken breast, Greek yogurt, lentils, "
+    "eggs and tofu. Since you mentioned a peanut allergy, skip peanut butter and use sunflower seed butter instead. "
+    "Pair your protein with complex carbohydrates such as oats, brown rice or sweet potatoes to fuel your training. "
+    "Don't forget vegetables: broccoli, spinach and kale add fiber, vitamins and minerals with very few calories. "
+    "Drink at least two to three liters of water a day, more on training days. Finally, remember that consistency "
+    "matters more than perfection; small daily habits add up to big results over a few months. "
+    "Would you like me to turn this into a weekly meal plan?"
+)
+
+
+class StubSynthesizer:
+    # Sleeps like a network TTS request and returns "audio" that encodes its playback length
+    def __init__(self, base_ms, per_char_ms, play_ms_per_char):
+        self.base = base_ms / 1000
+        self.per_char = per_char_ms / 1000
+        self.play_per_char = play_ms_per_char / 1000
+        self.calls = 0
+
+    def __call__(self, text, lang='en'):
+        self.calls += 1
+        time.sleep(self.base + self.per_char * len(text))
+        return struct.pack('d', len(text) * self.play_per_char) + text.encode('utf-8')
+
+
+class StubMusic:
+    # pygame.mixer.music stand-in; records when each clip started and ended
+    def __init__(self):
+        self.duration = 0.0
+        self.ends_at = 0.0
+        self.end_event = None
+        self.end_pending = False
+        self.clips = []
+
+    def set_endevent(self, event_type):
+        self.end_event = event_type
+
+    def load(self, source):
+        data = source.read() if hasattr(source, 'read') else source
+        self.duration = struct.unpack('d', data[:8])[0]
+
+    def play(self):
+        start = time.perf_counter()
+        self.ends_at = start + self.duration
+        self.end_pending = True
+        self.clips.append((start, self.ends_at))
+
+    def get_busy(self):
+        return time.perf_counter() < self.ends_at
+
+    def stop(self):
+        self.ends_at = time.perf_counter()
+
+
+class StubEvents:
+    # pygame.event stand-in: the music's end event arrives when its clip ends
+    NOEVENT = SimpleNamespace(type=0)
+
+    def __init__(self, music):
+        self.music = music
+
+    def clear(self, event_type):
+        if event_type == self.music.end_event:
+            self.music.end_pending = False
+
+    def wait(self, timeout_ms):
+        remaining = self.music.ends_at - time.perf_counter()
+        if remaining > timeout_ms / 1000:
+            time.sleep(timeout_ms / 1000)
+            return self.NOEVENT
+        time.sleep(max(remaining, 0))
+        if not self.music.end_pending:
+            return self.NOEVENT
+        self.music.end_pending = False
+        return SimpleNamespace(type=self.music.end_event)
+
+
+def legacy_speak_text(text, synthesize, music):
+    # nutrition_rag.speak_text before tts_pipeline, with the same stubs injected
+    cleaned_text = text.replace('\n', ' ').strip()
+    for chunk in [cleaned_text[i:i + 200] for i in range(0, len(cleaned_text), 200)]:
+        music.load(synthesize(chunk, 'en'))
+        music.play()
+        while music.get_busy():
+            pass
+
+
+def measure(label, run, music, synthesizer):
+    calls = synthesizer.calls
+    start, cpu_start = time.perf_counter(), time.process_time()
+    run()
+    wall, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+    clips = music.clips
+    gaps = [following[0] - previous[1] for previous, following in zip(clips, clips[1:])]
+    print(f"{label:<28}{len(clips):>7}{synthesizer.calls - calls:>7}{(clips[0][0] - start) * 1000:>12.0f}"
+          f"{sum(gaps) * 1000:>10.0f}{max(gaps, default=0) * 1000:>9.0f}{wall:>8.2f}{cpu:>8.2f}")
+    music.clips = []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="speak_text: old sequential/busy-wait vs pipelined TTS")
+    parser.add_argument('--synth-ms', type=float, default=300, help='Per-request synthesis latency')
+    parser.add_argument('--synth-ms-per-char', type=float, default=1.0)
+    parser.add_argument('--play-ms-per-char', type=float, default=5.0, help='Compressed playback time')
+    args = parser.parse_args()
+
+    synthesizer = StubSynthesizer(args.synth_ms, args.synth_ms_per_char, args.play_ms_per_char)
+    music = StubMusic()
+    player = MixerPlayer(music, StubEvents(music), end_event=1)
+    cache = AudioCache()
+    print(f"{len(ANSWER)}-character answer, synthesis {args.synth_ms:.0f} ms + {args.synth_ms_per_char} ms/char, "
+          f"playback {args.play_ms_per_char} ms/char")
+    print(f"{'':<28}{'clips':>7}{'synth':>7}{'first audio':>12}{'gaps ms':>10}{'max gap':>9}{'wall s':>8}{'cpu s':>8}")
+    measure("old: slices + busy wait", lambda: legacy_speak_text(ANSWER, synthesizer, music), music, synthesizer)
+    measure("pipeline", lambda: speak(ANSWER, synthesizer, player, cache), music, synthesizer)
+    measure("pipeline, cached", lambda: speak(ANSWER, synthesizer, player, cache), music, synthesizer)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/voice_bench.py
+# Time to first audio for a spoken question: /voice (answer streamed from the
+# LLM, each sentence synthesized as soon as it is complete) versus the
+# request/response path (/query for the whole answer, then synthesize it).
+# Stub STT/TTS backends, the fake LLM and fake Firestore keep it offline.
+#
+#   python benchmarks/voice_bench.py --llm-latency 2.0 --tts-latency 0.3
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import voice
+from fakes import FakeFirestore, FakeLLM, StubIntentClassifier
+from load_test import install_fakes, percentile, seed_users
+from tts_pipeline import split_sentences
+
+QUESTION = b"How much protein should I eat each day to build muscle?"
+
+
+def via_query(client, user_id, transcriber, synthesizer):
+    # Request/response: transcribe, wait for the full answer, then synthesize it sentence by sentence
+    start = time.perf_counter()
+    query = transcriber(QUESTION)
+    answer = client.post('/query', json={'query': query, 'user_id': user_id, 'isWeekly': 'false'}).get_json()
+    first_audio = None
+    for sentence in split_sentences(answer['response']):
+        synthesizer(sentence)
+        first_audio = first_audio or time.perf_counter() - start
+    return first_audio, time.perf_counter() - start
+
+
+def via_voice(client, user_id):
+    start = time.perf_counter()
+    response = client.post('/voice', data=QUESTION, query_string={'user_id': user_id}, buffered=False)
+    first_audio = None
+    for line in response.response:
+        event = json.loads(line)
+        if event['type'] == 'audio' and first_audio is None:
+            first_audio = time.perf_counter() - start
+    response.close()
+    return first_audio, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/voice time-to-first-audio vs /query + TTS")
+    parser.add_argument('--llm-latency', type=float, default=2.0, help='Seconds for a full LLM answer')
+    parser.add_argument('--stt-latency', type=float, default=0.3)
+    parser.add_argument('--tts-latency', type=float, default=0.3, help='Seconds per synthesized sentence')
+    parser.add_argument('--requests', type=int, default=5)
+    args = parser.parse_args()
+
+    llm = FakeLLM(latency=args.llm_latency, stream_chunk_chars=16)
+    db = FakeFirestore()
+    app = install_fakes(llm, db, StubIntentClassifier())
+    client = app.test_client()
+    user_ids = seed_users(db, args.requests * 3)
+    transcriber = voice.StubTranscriber(args.stt_latency)
+    synthesizer = voice.StubSynthesizer(args.tts_latency)
+    voice.set_transcriber(transcriber)
+    voice.set_synthesizer(synthesizer)
+
+    cache_dir = tempfile.mkdtemp(prefix='tts_cache_')
+    try:
+        print(f"LLM {args.llm_latency}s, STT {args.stt_latency}s, TTS {args.tts_latency}s per sentence, "
+              f"{args.requests} requests each")
+        print(f"{'path':<34}{'first audio p50':>16}{'all audio p50':>15}")
+        users = iter(user_ids)
+
+        def cold():
+            voice.set_audio_cache(voice.DiskAudioCache(tempfile.mkdtemp(dir=cache_dir)))
+            return via_voice(client, next(users))
+
+        for label, run in (
+            ("/query, then TTS", lambda: via_query(client, next(users), transcriber, synthesizer)),
+            ("/voice, cold TTS cache", cold),
+            ("/voice, warm TTS cache", lambda: via_voice(client, next(users))),  # Same answer as the last cold run
+        ):
+            results = [run() for _ in range(args.requests)]
+            first = percentile([first for first, _ in results], 50)
+            complete = percentile([complete for _, complete in results], 50)
+            print(f"{label:<34}{first * 1000:>13.0f} ms{complete * 1000:>12.0f} ms")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
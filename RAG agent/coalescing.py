@@ -0,0 +1,181 @@
+# coalescing.py
+# Single-flight coalescing of duplicate plan generations. A duplicate request
+# that arrives while the same plan is being generated waits for that run and
+# returns its result instead of starting another one. Threads of one worker
+# share a Future; workers on the same machine share a file lock + result file.
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from datetime import date
+from metrics import registry
+
+LOCK_DIR = os.environ.get('COALESCE_DIR', os.path.join(tempfile.gettempdir(), 'rag_coalesce'))
+WAIT_TIMEOUT = 300  # Longest a duplicate waits for the in-flight run (seconds)
+POLL_INTERVAL = 0.1
+RESULT_TTL = 600  # Result files older than this are cleaned up
+
+
+def normalize_query(query):
+    query = re.sub(r'[^\w\s]', ' ', query.lower())
+    return ' '.join(query.split())
+
+
+def coalesce_key(user_id, intent, is_weekly, start_date, query):
+    start_date = start_date or date.today()
+    raw = json.dumps([user_id, intent, bool(is_weekly), str(start_date), normalize_query(query)])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class SingleFlight:
+    def __init__(self, name, lock_dir=LOCK_DIR):
+        self.name = name
+        self.lock_dir = lock_dir
+        self.inflight = {}  # key -> Future of the leader in this process
+        self.lock = threading.Lock()
+        self.coalesced = 0
+        os.makedirs(lock_dir, exist_ok=True)
+
+    def do(self, key, fn, on_wait=None):
+        # on_wait is called once if this call has to wait for another run of
+        # the same key (e.g. to give up an admission slot while waiting)
+        with self.lock:
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+        if not leader:
+            self._record_coalesced('thread')
+            if on_wait is not None:
+                on_wait()
+            return future.result(timeout=WAIT_TIMEOUT)
+
+        try:
+            result = self._do_across_workers(key, fn, on_wait)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+
+    def _do_across_workers(self, key, fn, on_wait=None):
+        lock_path = os.path.join(self.lock_dir, f"{self.name}-{key}.lock")
+        result_path = os.path.join(self.lock_dir, f"{self.name}-{key}.json")
+        waiting_since = time.time()
+
+        lock_file, waited = self._lock(lock_path, on_wait)
+        try:
+            if waited:
+                # Another worker was generating this plan: reuse its result
+                result = self._read_result(result_path, newer_than=waiting_since)
+                if result is not None:
+                    self._record_coalesced('worker')
+                    return result
+                # The other run failed or timed out; run it ourselves
+            result = fn()
+            self._write_result(result_path, result)
+            return result
+        finally:
+            # Removed while still held, so lock files don't pile up; anyone
+            # waiting on this file sees it was unlinked and opens a new one
+            self._unlink(lock_path)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def _lock(self, lock_path, on_wait=None):
+        # Returns the locked file and whether another holder had to be waited for
+        waited = False
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while True:
+            lock_file = open(lock_path, 'a')
+            try:
+                while not self._try_lock(lock_file):
+                    if not waited and on_wait is not None:
+                        on_wait()
+                    waited = True
+                    if time.monotonic() > deadline:
+                        raise TimeoutError("Timed out waiting for in-flight plan generation")
+                    time.sleep(POLL_INTERVAL)
+                if self._is_current(lock_file, lock_path):
+                    return lock_file, waited
+            except BaseException:
+                lock_file.close()
+                raise
+            lock_file.close()  # Locked a file that was unlinked meanwhile
+
+    def _try_lock(self, lock_file):
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _is_current(self, lock_file, lock_path):
+        try:
+            return os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _unlink(self, path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def _read_result(self, result_path, newer_than):
+        try:
+            if os.path.getmtime(result_path) < newer_than:
+                return None  # Left over from an earlier, unrelated run
+            with open(result_path, 'r', encoding='utf-8') as f:
+                return json.load(f)['result']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_result(self, result_path, result):
+        tmp_path = f"{result_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'result': result}, f)
+        os.replace(tmp_path, result_path)
+        self._cleanup()
+
+    def _cleanup(self):
+        cutoff = time.time() - RESULT_TTL
+        try:
+            for entry in os.scandir(self.lock_dir):
+                if entry.stat().st_mtime >= cutoff:
+                    continue
+                if entry.name.endswith('.json'):
+                    os.unlink(entry.path)
+                elif entry.name.endswith('.lock'):
+                    self._remove_stale_lock(entry.path)
+        except OSError:
+            pass
+
+    def _remove_stale_lock(self, lock_path):
+        # Left by a worker that died mid-run; removed only if nobody holds it
+        with open(lock_path, 'a') as lock_file:
+            if self._try_lock(lock_file):
+                if self._is_current(lock_file, lock_path):
+                    self._unlink(lock_path)
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _record_coalesced(self, scope):
+        with self.lock:
+            self.coalesced += 1
+        registry.increment(
+            'rag_coalesced_requests_total', (('flight', self.name), ('scope', scope)),
+            help_text='Duplicate requests served from an in-flight run'
+        )
+        logging.info(f"Coalesced duplicate {self.name} request ({scope})")
+
+
+plan_flight = SingleFlight('plan')
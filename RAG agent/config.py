@@ -1,32 +1,61 @@
 # config.py
 import os
+import threading
 from dotenv import load_dotenv
 from datetime import date
-import firebase_admin
-from firebase_admin import credentials, firestore
-import google.generativeai as genai
 
-# ---------------------- Environment & Firebase Setup ----------------------
+# ---------------------- Environment ----------------------
 today = str(date.today())
 
 dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
 load_dotenv(dotenv_path)
 api_key = os.environ.get("GOOGLE_API_KEY")
-genai.configure(api_key=api_key)
 
 # Check if running on Render (secret file exists at this path)
 render_path = "/etc/secrets/serviceAccountKey.json"
 local_path = "serviceAccountKey.json"
 
-if os.path.exists(render_path):
-    cred = credentials.Certificate(render_path)
-else:
-    cred = credentials.Certificate(local_path)
+# ---------------------- Lazy Clients ----------------------
+# Firebase and genai are initialized on first use instead of at import, so
+# importing the app is cheap and gRPC clients are never created before a fork
+_lock = threading.Lock()
+_db = None
+_genai_configured = False
 
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+
+def get_db():
+    global _db
+    if _db is None:
+        with _lock:
+            if _db is None:
+                import firebase_admin
+                from firebase_admin import credentials, firestore
+
+                if not firebase_admin._apps:
+                    cred = credentials.Certificate(render_path if os.path.exists(render_path) else local_path)
+                    firebase_admin.initialize_app(cred)
+                _db = firestore.client()
+    return _db
+
+
+def set_db(client):
+    # Swap in another Firestore client (e.g. the benchmark's in-memory fake)
+    global _db
+    with _lock:
+        _db = client
+
+
+def configure_genai():
+    global _genai_configured
+    if not _genai_configured:
+        with _lock:
+            if not _genai_configured:
+                import google.generativeai as genai
+                genai.configure(api_key=api_key)
+                _genai_configured = True
 
 # ---------------------- Constants ----------------------
 PERSIST_DIRECTORY = 'db'
+MMAP_INDEX_DIRECTORY = 'db_mmap'  # Built from PERSIST_DIRECTORY by mmap_index.py
 BATCH_SIZE = 5000
 JSON_FILE_PATH = "Nutrition Data/usda_food_data.json"
@@ -1,6 +1,7 @@
 # data_processing.py
 import os
 import json
+import re
 from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader, DirectoryLoader
@@ -8,6 +9,94 @@ from config import JSON_FILE_PATH
 from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor
 
+# Key nutrients stored as typed metadata: USDA nutrient name prefix -> (metadata key, unit)
+KEY_NUTRIENTS = {
+    'Energy': ('calories', 'kcal'),
+    'Protein': ('protein_g', 'g'),
+    'Carbohydrate, by difference': ('carbs_g', 'g'),
+    'Total lipid (fat)': ('fat_g', 'g'),
+}
+
+# Allergen flag -> words in a food's name that indicate it. Matching is by whole word and
+# errs on the side of flagging (e.g. "peanut butter" is also dairy). Category names are
+# left out: "Finfish and Shellfish Products" would flag every fish as shellfish.
+ALLERGEN_KEYWORDS = {
+    'contains_dairy': ['milk', 'buttermilk', 'cheese', 'yogurt', 'butter', 'cream', 'whey', 'dairy', 'kefir'],
+    'contains_egg': ['egg'],
+    'contains_fish': ['fish', 'salmon', 'tuna', 'cod', 'tilapia', 'trout', 'sardine', 'mackerel', 'halibut', 'anchovy', 'anchovies'],
+    'contains_shellfish': ['shellfish', 'shrimp', 'prawn', 'crab', 'lobster', 'scallop', 'clam', 'mussel', 'oyster'],
+    'contains_peanut': ['peanut'],
+    'contains_tree_nut': ['almond', 'walnut', 'cashew', 'pecan', 'pistachio', 'hazelnut', 'macadamia', 'brazil nut'],
+    'contains_soy': ['soy', 'tofu', 'tempeh', 'edamame', 'miso'],
+    'contains_gluten': ['wheat', 'bread', 'pasta', 'barley', 'rye', 'couscous', 'seitan', 'cracker', 'flour'],
+}
+
+
+# Profile allergy words that name a flag without matching its keywords
+ALLERGY_ALIASES = {
+    'contains_dairy': ['lactose'],
+    'contains_tree_nut': ['nuts?'],  # "Nuts" on its own
+}
+
+
+def allergen_flags(allergies):
+    # Profile text such as "Peanuts, Shellfish" -> metadata flags to exclude
+    text = (', '.join(allergies) if isinstance(allergies, (list, tuple)) else str(allergies or '')).lower()
+    flags = []
+    for flag, keywords in ALLERGEN_KEYWORDS.items():
+        names = [flag[len('contains_'):].replace('_', ' ')] + keywords + ALLERGY_ALIASES.get(flag, [])
+        if any(re.search(rf'\b{name}', text) for name in names):
+            flags.append(flag)
+    return flags
+
+
+def food_category(item):
+    category = item.get('category') or item.get('foodCategory') or 'Unknown'
+    if isinstance(category, dict):  # FoodData Central: {"description": "..."}
+        category = category.get('description', 'Unknown')
+    return str(category)
+
+
+def food_metadata(item):
+    # Flat, typed metadata so Chroma can filter on it before the similarity search
+    metadata = {
+        'source': 'USDA',
+        'name': item.get('name', 'N/A'),
+        'category': food_category(item),
+        'calories': 0.0, 'protein_g': 0.0, 'carbs_g': 0.0, 'fat_g': 0.0,
+    }
+    for nutrient in item.get('nutrients', []):
+        name = nutrient.get('name', '')
+        for prefix, (key, unit) in KEY_NUTRIENTS.items():
+            if name.startswith(prefix) and str(nutrient.get('unit', unit)).lower() == unit:
+                try:
+                    metadata[key] = float(nutrient.get('amount', 0) or 0)
+                except (TypeError, ValueError):
+                    pass
+    text = metadata['name'].lower()
+    for flag, keywords in ALLERGEN_KEYWORDS.items():
+        metadata[flag] = any(re.search(rf'\b{keyword}(s|es)?\b', text) for keyword in keywords)
+    return metadata
+
+
+def food_document(item):
+    # One document per food: name, category and key nutrients first, then the rest
+    metadata = food_metadata(item)
+    text_content = (
+        f"Food: {metadata['name']}\n"
+        f"Category: {metadata['category']}\n"
+        f"Calories: {metadata['calories']:g} kcal, Protein: {metadata['protein_g']:g} g, "
+        f"Carbs: {metadata['carbs_g']:g} g, Fat: {metadata['fat_g']:g} g\n"
+    )
+    if 'nutrients' in item:
+        nutrients_text = [
+            f"{nutrient.get('name', 'N/A')}: {nutrient.get('amount', 'N/A')} {nutrient.get('unit', '')}"
+            for nutrient in item['nutrients']
+        ]
+        text_content += "Nutrients:\n" + "\n".join(nutrients_text)
+    return Document(page_content=text_content, metadata=metadata)
+
+
 def process_json():
     json_documents = []
     if os.path.exists(JSON_FILE_PATH):
@@ -16,20 +105,13 @@ def process_json():
         print(f"✅ JSON file loaded successfully! Total records: {len(json_data)}")
 
         for i, item in enumerate(json_data):
-            text_content = f"Food: {item.get('name', 'N/A')}\n"
-            if 'nutrients' in item:
-                nutrients_text = [
-                    f"{nutrient.get('name', 'N/A')}: {nutrient.get('amount', 'N/A')} {nutrient.get('unit', '')}"
-                    for nutrient in item['nutrients']
-                ]
-                text_content += "Nutrients:\n" + "\n".join(nutrients_text)
-            json_documents.append(Document(page_content=text_content, metadata={"source": "USDA"}))
+            json_documents.append(food_document(item))
 
             if i < 5:  # Debug print for first 5 items
-                print(f"🔎 JSON to Text [{i+1}]:\n{text_content}\n{'-'*40}")
+                print(f"🔎 JSON to Text [{i+1}]:\n{json_documents[-1].page_content}\n{'-'*40}")
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=20)
-    return splitter.split_documents(json_documents) if json_documents else []
+    # Not split: a food's nutrients stay in one document with its metadata
+    return json_documents
 
 def process_pdfs():
     loader = DirectoryLoader('Nutrition Data', glob='./*.pdf', loader_cls=PyPDFLoader)
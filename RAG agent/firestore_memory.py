@@ -1,37 +1,140 @@
 # firestore_memory.py
-from config import db
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import get_db
 from firebase_admin import firestore
+from llm_setup import get_summary_llm
+from metrics import timed
+from resilience import resilient_invoke
+
+RECENT_TURNS = 4  # Turns kept verbatim in prompts; older ones live in the rolling summary
+SUMMARY_MAX_WORDS = 150
+SUMMARY_EVERY_TURNS = 4  # Older turns are folded into the summary in batches of this many
+SUMMARY_THREADS = 2
+
+# Summaries are updated off the request path, one at a time per user
+_summary_lock = threading.Lock()
+_summary_executor = None
+_summarizing = set()
+
+
+def _get_summary_executor():
+    global _summary_executor
+    with _summary_lock:
+        if _summary_executor is None:
+            _summary_executor = ThreadPoolExecutor(max_workers=SUMMARY_THREADS, thread_name_prefix='summary')
+        return _summary_executor
 
 class FirestoreMemory:
     def __init__(self, user_id):
         self.user_id = user_id
+        db = get_db()
         self.history_ref = db.collection('users').document(self.user_id).collection('chat_history')
+        self.summary_ref = db.collection('users').document(self.user_id).collection('chat_summary').document('rolling')
         self.history = self.load_memory()
 
     def load_memory(self):
         try:
-            docs = self.history_ref.order_by('timestamp').stream()
+            with timed('history_read'):
+                docs = list(self.history_ref.order_by('timestamp').stream())
             return [{
+                'id': doc.id,
                 'user': doc.get('user_input'),
                 'bot': doc.get('bot_response'),
-                'timestamp': doc.get('timestamp')
+                'timestamp': doc.get('timestamp'),
+                'summarized': (doc.to_dict() or {}).get('summarized', False)
             } for doc in docs]
         except Exception as e:
             print(f"Error loading chat history: {e}")
             return []
 
     def append_to_history(self, user_input, bot_response):
-        # Keep only last 20 messages
-        if len(self.history) >= 20:
-            oldest = self.history_ref.order_by('timestamp').limit(1).get()
-            for doc in oldest:
-                doc.reference.delete()
-        self.history_ref.add({
-            'user_input': user_input,
-            'bot_response': bot_response,
-            'timestamp': firestore.SERVER_TIMESTAMP
-        })
+        with timed('firestore_write'):
+            # Keep only last 20 messages
+            if len(self.history) >= 20:
+                oldest = self.history_ref.order_by('timestamp').limit(1).get()
+                for doc in oldest:
+                    doc.reference.delete()
+                    self.history = [entry for entry in self.history if entry['id'] != doc.id]
+            self.history_ref.add({
+                'user_input': user_input,
+                'bot_response': bot_response,
+                'timestamp': firestore.SERVER_TIMESTAMP,
+                'summarized': False
+            })
+        with timed('summary_update'):
+            self.update_summary()
+
+    def update_summary(self):
+        # The new turn plus the last RECENT_TURNS - 1 loaded turns stay verbatim.
+        # Older turns not folded in yet go into the summary once there are
+        # SUMMARY_EVERY_TURNS of them, on a background thread so the request
+        # doesn't wait for the LLM; until then prompts include them verbatim.
+        older = self.history[:len(self.history) - (RECENT_TURNS - 1)]
+        pending = [entry for entry in older if not entry['summarized']]
+        if len(pending) < SUMMARY_EVERY_TURNS:
+            return
+        with _summary_lock:
+            if self.user_id in _summarizing:
+                return  # The next turn picks these up
+            _summarizing.add(self.user_id)
+        try:
+            _get_summary_executor().submit(self.fold_into_summary, pending)
+        except RuntimeError:  # Interpreter shutting down
+            with _summary_lock:
+                _summarizing.discard(self.user_id)
+
+    def fold_into_summary(self, pending):
+        try:
+            summary = summarize_turns(self.get_summary(), pending)
+            batch = get_db().batch()
+            batch.set(self.summary_ref, {
+                'summary': summary,
+                'updated': firestore.SERVER_TIMESTAMP
+            })
+            for entry in pending:
+                batch.update(self.history_ref.document(entry['id']), {'summarized': True})
+                entry['summarized'] = True
+            batch.commit()
+        except Exception as e:
+            print(f"Error updating conversation summary: {e}")
+        finally:
+            with _summary_lock:
+                _summarizing.discard(self.user_id)
+
+    def get_summary(self):
+        try:
+            doc = self.summary_ref.get()
+            return doc.get('summary') if doc.exists else ''
+        except Exception as e:
+            print(f"Error loading conversation summary: {e}")
+            return ''
+
+    def get_recent_history(self, turns=RECENT_TURNS):
+        # The last `turns` turns, plus older ones not folded into the summary yet
+        if not turns:
+            return ''
+        start = max(len(self.history) - turns, 0)
+        while start > 0 and not self.history[start - 1]['summarized']:
+            start -= 1
+        return format_turns(self.history[start:])
 
     def get_history(self):
         memory = self.load_memory()
-        return '\n'.join([f"User: {entry['user']}\nBot: {entry['bot']}" for entry in memory])
+        return format_turns(memory)
+
+
+def format_turns(entries):
+    return '\n'.join([f"User: {entry['user']}\nBot: {entry['bot']}" for entry in entries])
+
+
+def summarize_turns(previous_summary, entries):
+    prompt = (
+        "Update the running summary of a conversation between a user and a nutrition and fitness assistant.\n"
+        f"Keep it under {SUMMARY_MAX_WORDS} words. Keep facts about the user (goals, preferences, "
+        "restrictions, plans discussed) and drop greetings, formatting and emojis.\n\n"
+        f"Current summary:\n{previous_summary or 'None'}\n\n"
+        f"New conversation turns:\n{format_turns(entries)}\n\n"
+        "Updated summary:"
+    )
+    return resilient_invoke(get_summary_llm(), prompt, kind='summary').content.strip()
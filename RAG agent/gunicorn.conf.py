@@ -0,0 +1,30 @@
+# gunicorn.conf.py
+import os
+import shutil
+import tempfile
+
+bind = f":{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+# More threads than ADMISSION_SLOTS (4): the extra threads hold requests waiting in the fair queue
+threads = int(os.environ.get('GUNICORN_THREADS', '16'))
+timeout = 180  # Weekly plans make ~9 sequential LLM calls
+
+# Load the app (and the intent classifier's weights) once in the master process;
+# workers are forked afterwards and share the weights copy-on-write.
+preload_app = os.environ.get('PRELOAD_APP', 'true').lower() == 'true'
+if preload_app:
+    os.environ.setdefault('WARM_UP', 'true')
+
+# Workers' metrics are merged at /metrics through snapshot files here (one directory per master)
+os.environ.setdefault('METRICS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), f"rag_metrics_{os.getpid()}"))
+
+def post_fork(server, worker):
+    from metrics import start_snapshots
+    start_snapshots()
+    # The first inference runs here, in the worker, never in the master before the fork
+    if os.environ.get('WARM_UP', 'false').lower() == 'true':
+        from app import warm_up_inference
+        warm_up_inference()
+
+def on_exit(server):
+    shutil.rmtree(os.environ['METRICS_MULTIPROC_DIR'], ignore_errors=True)
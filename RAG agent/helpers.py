@@ -1,51 +1,70 @@
 # helpers.py
 import json
-import re
-from io import BytesIO
 from firebase_admin import firestore
-from config import db
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from google.api_core.exceptions import ResourceExhausted
-from llm_setup import llm
+from config import get_db
+from metrics import timed
+from plan_storage import build_plan_document, plan_collection
 
 
-def save_plan_to_firestore(user_id, plan_type, plan_content, target_date):
-    plan_data = json.loads(plan_content)
-    
-    # Determine the collection based on the plan type
-    if plan_type.lower() == 'meal':
-        collection_name = 'meal_plans'
-    elif plan_type.lower() == 'workout':
-        collection_name = 'workout_plans'
-    else:
-        collection_name = 'other_plans'  # Default collection for other plan types
+MAX_PLANS_KEPT = 42  # Plans for 6 weeks
 
-    plan_ref = db.collection('users').document(user_id).collection(collection_name).document()
-    plan_ref.set({
-        'type': plan_type.lower(),
-        'content': plan_content,
-        'date': firestore.SERVER_TIMESTAMP,
-        'target_date': target_date,
-        'metadata': {
-            'calories': None,
-            'exercises': [],
-            'ingredients': []
-        }
-    })
 
-    # Retrieve all plans and sort by date
-    plans_query = db.collection('users').document(user_id).collection(collection_name).order_by('date', direction=firestore.Query.DESCENDING)
-    plans = plans_query.stream()
-    plan_ids = [plan.id for plan in plans]
+def save_plans_to_firestore(user_id, plan_type, plans, profile_fingerprint=None, pregenerated=False):
+    # Write (content, target_date) pairs in one batch, then trim old plans once
+    collection_name = plan_collection(plan_type)
 
-    # Keep only the latest 42 plans (plans for 6 weeks)
-    if len(plan_ids) > 42:
-        for plan_id in plan_ids[42:]:
-            db.collection('users').document(user_id).collection(collection_name).document(plan_id).delete()
+    with timed('firestore_write'):
+        db = get_db()
+        plans_ref = db.collection('users').document(user_id).collection(collection_name)
+        batch = db.batch()
+        for plan_content, target_date in plans:
+            # Plans are stored as native maps/arrays; accept legacy JSON strings too
+            plan_data = json.loads(plan_content) if isinstance(plan_content, str) else plan_content
+            batch.set(plans_ref.document(), build_plan_document(
+                plan_type, plan_data, target_date, firestore.SERVER_TIMESTAMP, profile_fingerprint, pregenerated
+            ))
+        batch.commit()
+
+        # Retrieve all plans and sort by date
+        plans_query = plans_ref.order_by('date', direction=firestore.Query.DESCENDING)
+        plan_ids = [plan.id for plan in plans_query.select([]).stream()]  # IDs only
+
+        # Keep only the latest plans
+        if len(plan_ids) > MAX_PLANS_KEPT:
+            batch = db.batch()
+            for plan_id in plan_ids[MAX_PLANS_KEPT:]:
+                batch.delete(plans_ref.document(plan_id))
+            batch.commit()
+
+def update_plans_in_firestore(user_id, plan_type, plans, profile_fingerprint=None, refresh_ids=()):
+    # Overwrite existing plan documents in place from (doc_id, content, target_date) triples;
+    # documents in refresh_ids only get the new profile fingerprint
+    with timed('firestore_write'):
+        db = get_db()
+        plans_ref = db.collection('users').document(user_id).collection(plan_collection(plan_type))
+        batch = db.batch()
+        for doc_id, plan_content, target_date in plans:
+            batch.set(plans_ref.document(doc_id), build_plan_document(
+                plan_type, plan_content, target_date, firestore.SERVER_TIMESTAMP, profile_fingerprint
+            ))
+        for doc_id in refresh_ids:
+            batch.update(plans_ref.document(doc_id), {'profile_fingerprint': profile_fingerprint})
+        batch.commit()
+
+def clear_pregenerated(user_id, plan_type, doc_ids):
+    # Pre-generated plans are used for one request; the next one regenerates
+    with timed('firestore_write'):
+        db = get_db()
+        plans_ref = db.collection('users').document(user_id).collection(plan_collection(plan_type))
+        batch = db.batch()
+        for doc_id in doc_ids:
+            batch.update(plans_ref.document(doc_id), {'pregenerated': False})
+        batch.commit()
 
 def get_user_biometric_data(user_id):
     try:
-        user_doc = db.collection('users').document(user_id).get()
+        with timed('profile_read'):
+            user_doc = get_db().collection('users').document(user_id).get()
         if user_doc.exists:
             return user_doc.to_dict()  # Returns a dictionary of biometric data
         else:
@@ -53,32 +72,3 @@ def get_user_biometric_data(user_id):
     except Exception as e:
         print(f"Error fetching user data: {e}")
         return None
-
-@retry(
-    retry=retry_if_exception_type(ResourceExhausted),
-    wait=wait_exponential(multiplier=2, min=2, max=60),
-    stop=stop_after_attempt(5)
-)
-def invoke_llm_with_retry(prompt):
-    return llm.invoke(prompt).content.rstrip('\n')
-
-def extract_json_from_response(text):
-    try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        json_match = re.search(r'```(?:json)?\s*({.*?}|\[.*?])\s*```', text, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group(1).strip())
-        
-        # Fallback: extract from first {} or [] block
-        start = text.find('{')
-        end = text.rfind('}') + 1
-        if start != -1 and end != 0:
-            return json.loads(text[start:end])
-        
-        start = text.find('[')
-        end = text.rfind(']') + 1
-        if start != -1 and end != 0:
-            return json.loads(text[start:end])
-        
-        raise ValueError("No valid JSON found")
@@ -0,0 +1,73 @@
+# intent.py
+import logging
+import os
+import threading
+from metrics import registry
+
+INTENT_LABELS = ["generate meal plan", "generate workout plan", "general question"]
+
+# Unix socket of the shared intent sidecar (intent_service.py); unset = classify in-process
+INTENT_SOCKET = os.environ.get('INTENT_SOCKET')
+SIDECAR_ATTEMPTS = 2
+# While the sidecar is down, classify in this worker (loads the model on first
+# fallback); set to false to fail those requests with a 503 instead
+INPROCESS_FALLBACK = os.environ.get('INTENT_INPROCESS_FALLBACK', 'true').lower() == 'true'
+
+# The intent classification pipeline is loaded on first use (or by the app's warm-up hook)
+_classifier_lock = threading.Lock()
+_intent_classifier = None
+_client = None
+
+class IntentUnavailable(RuntimeError):
+    # The sidecar could not classify the query and in-process fallback is disabled
+    pass
+
+def get_intent_classifier():
+    global _intent_classifier
+    if _intent_classifier is None:
+        with _classifier_lock:
+            if _intent_classifier is None:
+                from transformers import pipeline
+                _intent_classifier = pipeline("zero-shot-classification", model="facebook/bart-large-mnli")
+    return _intent_classifier
+
+def set_intent_classifier(classifier):
+    # Swap in another classifier (e.g. the benchmark's stub)
+    global _intent_classifier
+    with _classifier_lock:
+        _intent_classifier = classifier
+
+def get_intent_client():
+    global _client
+    if _client is None and INTENT_SOCKET:
+        from intent_service import IntentClient
+        with _classifier_lock:
+            if _client is None:
+                _client = IntentClient(INTENT_SOCKET)
+    return _client
+
+def uses_sidecar():
+    return bool(INTENT_SOCKET)
+
+def classify_intent(query):
+    client = get_intent_client()
+    if client is None:
+        return get_intent_classifier()(query, INTENT_LABELS)['labels'][0]
+    # A dropped sidecar connection is retried once (it reconnects). If it is
+    # still down the query is classified in-process, or the request fails with
+    # IntentUnavailable when INTENT_INPROCESS_FALLBACK is off. Guessing an intent
+    # would answer a plan request as a general question.
+    for _ in range(SIDECAR_ATTEMPTS):
+        try:
+            return client.classify(query)['labels'][0]
+        except (TimeoutError, ValueError) as e:
+            error = e
+            break  # A hung sidecar or one that answered with an error isn't retried
+        except OSError as e:
+            error = e
+    registry.increment('intent_sidecar_failures_total', help_text='Intent classifications the sidecar could not serve')
+    if INPROCESS_FALLBACK:
+        logging.warning(f"Intent sidecar unavailable, classifying in-process: {error}")
+        return get_intent_classifier()(query, INTENT_LABELS)['labels'][0]
+    logging.error(f"Intent sidecar unavailable: {error}")
+    raise IntentUnavailable(f"Intent sidecar unavailable: {error}") from error
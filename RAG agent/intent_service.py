@@ -0,0 +1,182 @@
+# intent_service.py
+# Shared intent-classification sidecar. Hosts the zero-shot classifier once per
+# machine and micro-batches concurrent requests from all gunicorn workers.
+#
+#   python intent_service.py --socket /tmp/rag_intent.sock
+#   INTENT_SOCKET=/tmp/rag_intent.sock gunicorn -c gunicorn.conf.py app:app
+#
+# Protocol: one JSON object per line over a Unix stream socket.
+#   request  {"query": "..."}
+#   response {"labels": [...], "scores": [...]} or {"error": "..."}
+import argparse
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from intent import INTENT_LABELS, get_intent_classifier
+
+DEFAULT_SOCKET = '/tmp/rag_intent.sock'
+MAX_BATCH_SIZE = 32
+MAX_WAIT_MS = 5  # How long the first request of a batch waits for company
+CLIENT_TIMEOUT = 10
+
+
+# ---------------------- Micro-batching ----------------------
+class MicroBatcher:
+    def __init__(self, classifier, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.classifier = classifier
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.pending = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        threading.Thread(target=self._run, name='intent-batcher', daemon=True).start()
+
+    def submit(self, query):
+        future = Future()
+        self.pending.put((query, future))
+        return future
+
+    def _collect(self):
+        batch = [self.pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            queries = [query for query, _ in batch]
+            try:
+                # One forward pass over every (query, label) hypothesis in the batch
+                results = self.classifier(queries, INTENT_LABELS, batch_size=len(queries) * len(INTENT_LABELS))
+                if isinstance(results, dict):
+                    results = [results]
+                if len(results) != len(batch):
+                    raise ValueError(f"classifier returned {len(results)} results for {len(batch)} queries")
+                for (_, future), result in zip(batch, results):
+                    _resolve(future, result={'labels': result['labels'],
+                                             'scores': [float(s) for s in result['scores']]})
+            except Exception as e:
+                logging.error(f"Intent batch of {len(batch)} failed: {e}")
+                for _, future in batch:
+                    _resolve(future, error=e)
+            self.batches += 1
+            self.items += len(batch)
+
+
+def _resolve(future, result=None, error=None):
+    # Futures already resolved are left alone; setting them twice would raise
+    # InvalidStateError and stop the batcher thread
+    if future.done():
+        return
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+# ---------------------- Server ----------------------
+class IntentRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        # Connections are persistent: a worker thread sends one request per line
+        for line in self.rfile:
+            try:
+                query = json.loads(line)['query']
+                response = self.server.batcher.submit(query).result()
+            except Exception as e:
+                response = {'error': str(e)}
+            self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+class IntentServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128  # Every worker thread may connect at once
+
+    def __init__(self, socket_path, batcher):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.batcher = batcher
+        super().__init__(socket_path, IntentRequestHandler)
+
+
+def serve(socket_path, classifier=None, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+    batcher = MicroBatcher(classifier or get_intent_classifier(), max_batch_size, max_wait_ms)
+    server = IntentServer(socket_path, batcher)
+    logging.info(f"Intent sidecar listening on {socket_path} (batch<= {max_batch_size}, wait {max_wait_ms}ms)")
+    return server
+
+
+# ---------------------- Client ----------------------
+class IntentClient:
+    def __init__(self, socket_path, timeout=CLIENT_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.local = threading.local()  # One persistent connection per worker thread
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            conn = self.local.conn = (sock, sock.makefile('rb'))
+        return conn
+
+    def classify(self, query):
+        sock, reader = self._connection()
+        try:
+            sock.sendall((json.dumps({'query': query}) + '\n').encode('utf-8'))
+            line = reader.readline()
+            if not line:
+                raise ConnectionError("Intent sidecar closed the connection")
+        except OSError:
+            self.close()
+            raise
+        response = json.loads(line)
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response
+
+    def close(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn[1].close()
+            conn[0].close()
+            self.local.conn = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared intent classification sidecar")
+    parser.add_argument('--socket', default=os.environ.get('INTENT_SOCKET', DEFAULT_SOCKET))
+    parser.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    server = serve(args.socket, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,54 @@
 # llm_setup.py
-from langchain_google_genai import ChatGoogleGenerativeAI
+import threading
+from config import configure_genai
 
-# Initialize LLMs
-llm = ChatGoogleGenerativeAI(model='gemini-1.5-pro', temperature=0.3)
\ No newline at end of file
+# LLM clients are created on first use and shared by all threads of a worker
+_lock = threading.RLock()
+_llms = {}
+
+
+CLIENT_TIMEOUT = 120  # Seconds; bounds calls that resilience.py has already given up on
+
+
+def _chat_model(**kwargs):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    configure_genai()
+    return ChatGoogleGenerativeAI(timeout=CLIENT_TIMEOUT, **kwargs)
+
+
+_FACTORIES = {
+    'llm': lambda: _chat_model(model='gemini-1.5-pro', temperature=0.3),
+    'summary_llm': lambda: _chat_model(model='gemini-1.5-flash', temperature=0.2),  # Rolling chat summaries
+    # JSON mode for schema-constrained plan and target outputs
+    'structured_llm': lambda: get_llm().bind(generation_config={"response_mime_type": "application/json"}),
+}
+
+
+def _get(name):
+    client = _llms.get(name)
+    if client is None:
+        with _lock:
+            client = _llms.get(name)
+            if client is None:
+                client = _llms[name] = _FACTORIES[name]()
+    return client
+
+
+def get_llm():
+    return _get('llm')
+
+
+def get_summary_llm():
+    return _get('summary_llm')
+
+
+def get_structured_llm():
+    return _get('structured_llm')
+
+
+def set_llms(llm=None, summary_llm=None, structured_llm=None):
+    # Swap in other clients (e.g. the benchmark's fake LLM)
+    with _lock:
+        for name, client in (('llm', llm), ('summary_llm', summary_llm), ('structured_llm', structured_llm)):
+            if client is not None:
+                _llms[name] = client
@@ -0,0 +1,235 @@
+# metrics.py
+# In-process Prometheus metrics. Under gunicorn every worker has its own
+# registry and a scrape reaches one of them, so with METRICS_MULTIPROC_DIR set
+# each process also writes a snapshot of its registry there (every
+# SNAPSHOT_SECONDS, from a background thread) and /metrics merges the
+# snapshots of all processes. gunicorn.conf.py sets it to a fresh directory.
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Latency buckets in seconds, from Firestore reads up to weekly plan generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+MULTIPROC_DIRECTORY = os.environ.get('METRICS_MULTIPROC_DIR')
+SNAPSHOT_SECONDS = 1.0
+
+# Stage timings of the request being handled on this thread/context
+_request_trace = ContextVar('request_trace', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.counters = {}  # (name, labels) -> float
+        self.help = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, name, labels=(), help_text=''):
+        key = (name, tuple(labels))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+                self.help.setdefault(name, help_text)
+            return self.histograms[key]
+
+    def increment(self, name, labels=(), amount=1, help_text=''):
+        key = (name, tuple(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+            self.help.setdefault(name, help_text)
+
+    def snapshot(self):
+        # JSON-serializable copy of every metric
+        with self.lock:
+            histograms = list(self.histograms.items())
+            counters = list(self.counters.items())
+            help_texts = dict(self.help)
+        hists = []
+        for (name, labels), hist in histograms:
+            with hist.lock:
+                hists.append([name, labels, hist.buckets, list(hist.counts), hist.sum, hist.count])
+        return {'histograms': hists, 'counters': [[name, labels, value] for (name, labels), value in counters],
+                'help': help_texts}
+
+    def merge(self, snapshot):
+        # Add another process's snapshot to this registry
+        for name, labels, value in snapshot['counters']:
+            self.increment(name, tuple(tuple(label) for label in labels), value, snapshot['help'].get(name, ''))
+        for name, labels, buckets, counts, total, count in snapshot['histograms']:
+            key = (name, tuple(tuple(label) for label in labels))
+            with self.lock:
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(tuple(buckets))
+                    self.help.setdefault(name, snapshot['help'].get(name, ''))
+                hist = self.histograms[key]
+            with hist.lock:
+                hist.counts = [a + b for a, b in zip(hist.counts, counts)]
+                hist.sum += total
+                hist.count += count
+
+    def render(self):
+        lines = []
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        seen = set()
+        for (name, labels), hist in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {self.help.get(name, '')}")
+                lines.append(f"# TYPE {name} histogram")
+            with hist.lock:
+                counts, total, count = list(hist.counts), hist.sum, hist.count
+            for bound, bucket_count in zip(hist.buckets, counts):
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', repr(float(bound))),))} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {self.help.get(name, '')}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = [(key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in labels]
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+registry = MetricsRegistry()
+
+
+# ---------------------- Stage Timing ----------------------
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.histogram(
+            'rag_stage_duration_seconds', (('stage', stage),),
+            'Time spent in each stage of call_rag_agent'
+        ).observe(elapsed)
+        trace = _request_trace.get()
+        if trace is not None:
+            trace.append((stage, elapsed))
+
+
+def start_request_trace():
+    return _request_trace.set([])
+
+
+def finish_request_trace(token):
+    trace = _request_trace.get() or []
+    _request_trace.reset(token)
+    return trace
+
+
+def observe_request(endpoint, status, seconds):
+    registry.histogram(
+        'rag_request_duration_seconds', (('endpoint', endpoint), ('status', str(status))),
+        'End-to-end HTTP request latency'
+    ).observe(seconds)
+
+
+def server_timing_header(trace, total):
+    # Per-stage totals in milliseconds; repeated stages (per-day LLM calls) are summed
+    stages = {}
+    for stage, seconds in trace:
+        duration, count = stages.get(stage, (0.0, 0))
+        stages[stage] = (duration + seconds, count + 1)
+    parts = [
+        f'{stage};dur={duration * 1000:.1f}' + (f';desc="x{count}"' if count > 1 else '')
+        for stage, (duration, count) in stages.items()
+    ]
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+# ---------------------- Multi-process Export ----------------------
+_snapshot_lock = threading.Lock()
+_snapshot_pid = None
+
+
+def _snapshot_path(directory):
+    return os.path.join(directory, f"metrics-{os.getpid()}.json")
+
+
+def write_snapshot(directory=None):
+    directory = directory or MULTIPROC_DIRECTORY
+    path = _snapshot_path(directory)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(registry.snapshot(), f)
+        os.replace(f"{path}.tmp", path)
+    except OSError as e:
+        logging.warning(f"Could not write metrics snapshot: {e}")
+
+
+def start_snapshots():
+    # Once per process (gunicorn's post_fork hook; again after a fork)
+    global _snapshot_pid
+    if not MULTIPROC_DIRECTORY or _snapshot_pid == os.getpid():
+        return
+    with _snapshot_lock:
+        if _snapshot_pid == os.getpid():
+            return
+        _snapshot_pid = os.getpid()
+
+    directory = MULTIPROC_DIRECTORY
+
+    def run():
+        while True:
+            time.sleep(SNAPSHOT_SECONDS)
+            write_snapshot(directory)
+
+    threading.Thread(target=run, name='metrics-snapshot', daemon=True).start()
+
+
+def render_prometheus():
+    if not MULTIPROC_DIRECTORY:
+        return registry.render()
+    # This process's snapshot is written now; the others are at most SNAPSHOT_SECONDS old.
+    # Snapshots of workers that have exited are kept, so counters never go backwards.
+    start_snapshots()
+    write_snapshot()
+    merged = MetricsRegistry()
+    for path in sorted(glob.glob(os.path.join(MULTIPROC_DIRECTORY, 'metrics-*.json'))):
+        try:
+            with open(path) as f:
+                merged.merge(json.load(f))
+        except (OSError, ValueError) as e:
+            logging.warning(f"Skipping metrics snapshot {path}: {e}")
+    return merged.render()
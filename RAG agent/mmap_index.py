@@ -0,0 +1,248 @@
+# mmap_index.py
+# Read-only IVF index for the food corpus, stored as plain files that every
+# worker memory-maps, so they share one copy in the page cache and opening it
+# costs almost nothing:
+#   vectors.npy    quantized vectors (int8 or float16), grouped by IVF list
+#   scales.npy     per-vector float32 scale (int8 only)
+#   centroids.npy  IVF centroids (float32)
+#   lists.npy      row offset of each IVF list (nlist + 1)
+#   records.bin    packed {"text", "metadata"} JSON records
+#   offsets.npy    byte offset of each record (count + 1)
+#   index.json     dim, count, dtype, nlist, schema_version of the source store
+#
+#   python mmap_index.py --chroma db --out db_mmap
+import argparse
+import json
+import os
+import numpy as np
+from typing import Any, List, Optional
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+INDEX_VERSION = 1
+# Lists probed per query scale with nlist: a fixed count probes a shrinking
+# share of a growing corpus and recall falls with it
+NPROBE_FRACTION = 0.5
+MIN_NPROBE = 16
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE = 20000
+
+
+# ---------------------- Build ----------------------
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _kmeans(vectors, nlist, seed=0):
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), min(len(vectors), KMEANS_SAMPLE), replace=False)]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = np.argmax(sample @ centroids.T, axis=1)  # Spherical k-means on unit vectors
+        for i in range(nlist):
+            members = sample[assignment == i]
+            if len(members):
+                centroids[i] = members.mean(axis=0)
+        centroids = _normalize(centroids)
+    return centroids.astype(np.float32)
+
+
+def build_index(path, texts, metadatas, vectors, dtype='int8', nlist=None, schema_version=None):
+    vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+    count, dim = vectors.shape
+    nlist = nlist or max(1, min(int(np.sqrt(count)), 1024))
+    centroids = _kmeans(vectors, nlist)
+
+    # Store each IVF list contiguously so a probe reads one slice
+    assignment = np.argmax(vectors @ centroids.T, axis=1)
+    order = np.argsort(assignment, kind='stable')
+    lists = np.searchsorted(assignment[order], np.arange(nlist + 1)).astype(np.int64)
+    vectors = vectors[order]
+
+    os.makedirs(path, exist_ok=True)
+    if dtype == 'int8':
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+        np.save(os.path.join(path, 'scales.npy'), scales.astype(np.float32))
+    elif dtype == 'float16':
+        quantized = vectors.astype(np.float16)
+    else:
+        raise ValueError(f"Unsupported dtype: {dtype}")
+    np.save(os.path.join(path, 'vectors.npy'), quantized)
+    np.save(os.path.join(path, 'centroids.npy'), centroids)
+    np.save(os.path.join(path, 'lists.npy'), lists)
+
+    offsets = [0]
+    with open(os.path.join(path, 'records.bin'), 'wb') as f:
+        for row in order:
+            record = json.dumps({'text': texts[row], 'metadata': metadatas[row] or {}}).encode('utf-8')
+            f.write(record)
+            offsets.append(offsets[-1] + len(record))
+    np.save(os.path.join(path, 'offsets.npy'), np.asarray(offsets, dtype=np.int64))
+
+    with open(os.path.join(path, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump({'version': INDEX_VERSION, 'dim': dim, 'count': count, 'dtype': dtype, 'nlist': nlist,
+                   'schema_version': schema_version}, f)
+
+
+def build_from_chroma(vectordb, path, dtype='int8', nlist=None):
+    # Reuse the embeddings already stored in Chroma instead of embedding again
+    from vector_store import stored_schema_version
+    data = vectordb.get(include=['embeddings', 'documents', 'metadatas'])
+    build_index(path, data['documents'], data['metadatas'], data['embeddings'], dtype, nlist,
+                stored_schema_version(vectordb))
+
+
+# ---------------------- Search ----------------------
+def default_nprobe(nlist):
+    return min(nlist, max(MIN_NPROBE, int(np.ceil(nlist * NPROBE_FRACTION))))
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _compare(op, value, target):
+    if op == '$eq':
+        return value == target
+    if op == '$ne':
+        return value != target
+    # Ordering only between two numbers or two strings; missing or mixed
+    # metadata types don't match instead of raising TypeError
+    if not (_is_number(value) and _is_number(target)) and not (isinstance(value, str) and isinstance(target, str)):
+        return False
+    if op == '$lt':
+        return value < target
+    if op == '$lte':
+        return value <= target
+    if op == '$gt':
+        return value > target
+    if op == '$gte':
+        return value >= target
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+def _matches(metadata, where):
+    # The subset of Chroma's `where` syntax that vector_store.food_filter produces
+    if not where:
+        return True
+    if '$and' in where:
+        return all(_matches(metadata, clause) for clause in where['$and'])
+    for key, condition in where.items():
+        value = metadata.get(key)
+        if isinstance(condition, dict):
+            for op, target in condition.items():
+                if value is None or not _compare(op, value, target):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+class MmapIndex:
+    def __init__(self, path):
+        with open(os.path.join(path, 'index.json'), 'r', encoding='utf-8') as f:
+            self.info = json.load(f)
+        self.vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+        self.scales = (
+            np.load(os.path.join(path, 'scales.npy'), mmap_mode='r') if self.info['dtype'] == 'int8' else None
+        )
+        self.centroids = np.load(os.path.join(path, 'centroids.npy'))
+        self.lists = np.load(os.path.join(path, 'lists.npy'))
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+        self.records = np.memmap(os.path.join(path, 'records.bin'), dtype=np.uint8, mode='r')
+
+    def __len__(self):
+        return self.info['count']
+
+    def record(self, row):
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self.records[start:end].tobytes())
+
+    def _scan(self, probes, query):
+        rows, scores = [], []
+        for probe in probes:
+            start, end = int(self.lists[probe]), int(self.lists[probe + 1])
+            if start == end:
+                continue
+            block = self.vectors[start:end].astype(np.float32) @ query
+            if self.scales is not None:
+                block *= self.scales[start:end]
+            rows.append(np.arange(start, end))
+            scores.append(block)
+        return rows, scores
+
+    def search(self, query_vector, k=5, nprobe=None, where=None):
+        # Returns [(score, row)] best first
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)  # asarray may return the caller's array
+        nlist = len(self.centroids)
+        nprobe = min(nprobe or default_nprobe(nlist), nlist)
+        order = np.argsort(-(self.centroids @ query))
+        rows, scores = self._scan(order[:nprobe], query)
+
+        if not where:
+            if not rows:
+                return []
+            rows, scores = np.concatenate(rows), np.concatenate(scores)
+            return [(float(scores[i]), int(rows[i])) for i in np.argsort(-scores)[:k]]
+
+        # A selective filter can leave fewer than k matches in the probed
+        # lists, so keep doubling the probes until k match or every list is read
+        matched = {}  # row -> whether its metadata passes, so widening doesn't re-read records
+        while True:
+            results = []
+            if rows:
+                all_rows, all_scores = np.concatenate(rows), np.concatenate(scores)
+                for i in np.argsort(-all_scores):  # Filter in score order until k matches
+                    row = int(all_rows[i])
+                    if row not in matched:
+                        matched[row] = _matches(self.record(row)['metadata'], where)
+                    if matched[row]:
+                        results.append((float(all_scores[i]), row))
+                        if len(results) == k:
+                            return results
+            if nprobe >= nlist:
+                return results
+            wider = min(nprobe * 2, nlist)
+            more_rows, more_scores = self._scan(order[nprobe:wider], query)
+            rows += more_rows
+            scores += more_scores
+            nprobe = wider
+
+
+class MmapRetriever(BaseRetriever):
+    # LangChain retriever over an MmapIndex; search_kwargs mirror Chroma's (k, filter)
+    index: Any
+    embeddings: Any
+    k: int = 5
+    nprobe: Optional[int] = None  # None scales with the index's nlist
+    filter: Optional[dict] = None
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        query_vector = self.embeddings.embed_query(query)
+        documents = []
+        for score, row in self.index.search(query_vector, self.k, self.nprobe, self.filter):
+            record = self.index.record(row)
+            documents.append(Document(page_content=record['text'], metadata=dict(record['metadata'], score=score)))
+        return documents
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a memory-mapped index from an existing Chroma store')
+    parser.add_argument('--chroma', default='db', help='Chroma persist directory')
+    parser.add_argument('--out', default='db_mmap', help='Output directory')
+    parser.add_argument('--dtype', choices=['int8', 'float16'], default='int8')
+    parser.add_argument('--nlist', type=int, help='Number of IVF lists (default sqrt(count))')
+    args = parser.parse_args()
+
+    from langchain_chroma import Chroma
+    build_from_chroma(Chroma(persist_directory=args.chroma), args.out, args.dtype, args.nlist)
+    print(f"✅ Index written to {args.out}")
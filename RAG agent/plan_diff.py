@@ -0,0 +1,191 @@
+# plan_diff.py
+# Works out which days (and meals) of the current week a plan request really
+# touches, so "swap Tuesday's dinner" or a new allergy regenerates only those
+# days instead of the whole week. Days come from weekday/meal names in the
+# query, or from comparing the profile fingerprint stored on each plan. Only
+# requests with an edit verb are narrowed: "make me a weekly plan starting
+# Monday" or "a plan with a light dinner" are new plans. The first request
+# for a week the off-peak job pre-generated is answered from those plans if the
+# profile hasn't changed since.
+import hashlib
+import json
+import re
+from datetime import date, datetime, timedelta
+from data_processing import ALLERGEN_KEYWORDS, allergen_flags
+from plan_storage import MEAL_KEYS, get_plans
+
+WEEKDAY_PATTERNS = [
+    r'mon(day)?s?', r'tue(s|sday)?s?', r'wed(nesday)?s?', r'thu(r|rs|rsday)?s?',
+    r'fri(day)?s?', r'sat(urday)?s?', r'sun(day)?s?',
+]
+EDIT_VERBS = r'\b(swap|change|replace|update|edit|modify|switch|adjust|tweak|redo)\b'
+# "starting Monday", "from tomorrow": where a new plan starts, not a day to edit
+START_PHRASE = (
+    r'\b(starting|start|from|beginning|begin)\s+(on\s+)?(this\s+|next\s+)?'
+    r'(today|tomorrow|' + '|'.join(WEEKDAY_PATTERNS) + r')\b'
+)
+# Profile aspects a pre-generated plan of each type must still match to be used
+PLAN_ASPECTS = {'meal': ('nutrition', 'allergies'), 'workout': ('workout',)}
+MEAL_PATTERNS = {
+    'breakfast': r'breakfasts?',
+    'lunch': r'lunch(es)?',
+    'dinner': r'(dinners?|suppers?)',
+}
+
+# Profile fields each kind of plan depends on
+PROFILE_ASPECTS = {
+    'allergies': ('foodAllergies',),
+    'nutrition': ('weight', 'height', 'age', 'gender', 'fitnessGoals', 'preferenceFood', 'healthConditions'),
+    'workout': ('workoutLevelString', 'fitnessGoals', 'healthConditions', 'weight', 'age'),
+}
+
+NO_ALLERGIES = {'', 'none', 'no', 'n/a', 'nil'}
+
+
+# ---------------------- Profile Fingerprint ----------------------
+def profile_fingerprint(biometric_data):
+    biometric_data = biometric_data or {}
+    fingerprint = {}
+    for aspect, fields in PROFILE_ASPECTS.items():
+        values = json.dumps([biometric_data.get(field) for field in fields], sort_keys=True, default=str)
+        fingerprint[aspect] = hashlib.sha1(values.encode('utf-8')).hexdigest()[:12]
+    return fingerprint
+
+
+def allergen_terms(biometric_data):
+    # The allergies as written plus the food words data_processing flags each one by
+    allergies = (biometric_data or {}).get('foodAllergies') or ''
+    if isinstance(allergies, (list, tuple)):
+        allergies = ','.join(str(item) for item in allergies)
+    terms = []
+    for term in re.split(r',|;|/|\band\b', allergies.lower()):
+        term = term.strip()
+        if term in NO_ALLERGIES:
+            continue
+        terms.append(term[:-1] if term.endswith('s') else term)  # "peanuts" matches "Peanut butter"
+    for flag in allergen_flags(allergies):
+        terms.append(flag[len('contains_'):].replace('_', ' '))
+        terms.extend(ALLERGEN_KEYWORDS[flag])
+    return list(dict.fromkeys(terms))
+
+
+def conflicts_with_allergens(plan, terms):
+    # Whole words, matched the way food_metadata flags foods ("egg" isn't "eggplant")
+    ingredients = ' | '.join((plan.get('metadata') or {}).get('ingredients', [])).lower()
+    return any(re.search(rf'\b{re.escape(term)}(s|es)?\b', ingredients) for term in terms)
+
+
+# ---------------------- Request Parsing ----------------------
+def is_edit_request(query):
+    return re.search(EDIT_VERBS, query.lower()) is not None
+
+
+def requested_changes(query, week_start):
+    # Days (as dates inside the week) and meals named in the query
+    text = re.sub(START_PHRASE, ' ', query.lower())
+    days = set()
+    for weekday, pattern in enumerate(WEEKDAY_PATTERNS):
+        if re.search(rf'\b{pattern}\b', text):
+            days.add(week_start + timedelta(days=(weekday - week_start.weekday()) % 7))
+    if re.search(r'\btoday\b', text):
+        days.add(date.today())
+    if re.search(r'\btomorrow\b', text):
+        days.add(date.today() + timedelta(days=1))
+    meals = {meal for meal, pattern in MEAL_PATTERNS.items() if re.search(rf'\b{pattern}\b', text)}
+    return days, meals
+
+
+# ---------------------- Current Week ----------------------
+def load_week(user_id, plan_type, week_start):
+    # Latest plan document per day of the 7 days from week_start
+    start = datetime.combine(week_start, datetime.min.time())
+    end = start + timedelta(days=7) - timedelta(microseconds=1)
+    week = {}
+    for plan in get_plans(user_id, plan_type, start, end, view='full'):
+        day = datetime.fromisoformat(plan['target_date']).date()
+        if day not in week or str(plan.get('date', '')) > str(week[day].get('date', '')):
+            week[day] = plan
+    return week
+
+
+def plan_changes(plan_type, user_id, query, biometric_data, start_date=None, is_weekly=True):
+    # Returns (changes, refresh_ids). changes is None when there is no usable
+    # current week (generate as before), else {day: {'plan': current document,
+    # 'meals': set of meals or None for the whole day}}. refresh_ids are the
+    # unaffected documents whose stored fingerprint should be brought up to date.
+    # Days named in the query may be anywhere in the week; otherwise only the
+    # requested days (one for a daily request) are considered.
+    if not is_edit_request(query):
+        return None, []  # A new plan, never narrowed
+    week_start = start_date or date.today()
+    week = load_week(user_id, plan_type, week_start)
+    window = {week_start + timedelta(days=offset) for offset in range(7 if is_weekly else 1)}
+    current = {day: plan for day, plan in week.items() if day in window}
+    if not current:
+        return None, []
+
+    days, meals = requested_changes(query, week_start)
+    if plan_type != 'meal':
+        meals = set()
+    if days or meals:
+        targets = [day for day in days if day in week] if days else list(current)
+        if not targets:
+            return None, []
+        return {day: {'plan': week[day], 'meals': meals or None} for day in sorted(targets)}, []
+
+    fingerprint = profile_fingerprint(biometric_data)
+    stored = [plan.get('profile_fingerprint') for plan in current.values()]
+    if not all(stored):
+        return None, []  # Plans saved before fingerprints were stored
+
+    aspects = PLAN_ASPECTS[plan_type]
+    if all(fp.get(aspect) == fingerprint[aspect] for fp in stored for aspect in aspects):
+        return None, []  # Profile unchanged and nothing named: the user wants a new week
+
+    # Each day against its own stored fingerprint, so days already brought up to date are left alone
+    terms = allergen_terms(biometric_data)
+    affected = []
+    for day, plan in current.items():
+        fp = plan['profile_fingerprint']
+        if plan_type == 'meal':
+            if fp.get('nutrition') != fingerprint['nutrition'] or (
+                fp.get('allergies') != fingerprint['allergies'] and conflicts_with_allergens(plan, terms)
+            ):
+                affected.append(day)
+        elif fp.get('workout') != fingerprint['workout']:
+            affected.append(day)
+
+    changes = {day: {'plan': week[day], 'meals': None} for day in sorted(affected)}
+    # Days outside the request keep their old fingerprint, so a later request for them still sees the change
+    refresh_ids = [plan['id'] for day, plan in current.items() if day not in changes]
+    return changes, refresh_ids
+
+
+def pregenerated_plans(plan_type, user_id, biometric_data, start_date=None, is_weekly=True):
+    # IDs of the plans the off-peak job saved for every requested day, if they
+    # were made from the current profile; None when any day lacks one. The
+    # user's own requests always regenerate, so only these are ever reused.
+    week_start = start_date or date.today()
+    week = load_week(user_id, plan_type, week_start)
+    days = [week_start + timedelta(days=offset) for offset in range(7 if is_weekly else 1)]
+    if not all(day in week and week[day].get('pregenerated') for day in days):
+        return None
+    fingerprint = profile_fingerprint(biometric_data)
+    for day in days:
+        stored = week[day].get('profile_fingerprint') or {}
+        if any(stored.get(aspect) != fingerprint[aspect] for aspect in PLAN_ASPECTS[plan_type]):
+            return None
+    return [week[day]['id'] for day in days]
+
+
+def merge_meals(current, regenerated, meals):
+    # Take only the requested meals from the new day and recompute the totals
+    merged = dict(current)
+    for meal in meals:
+        if meal in regenerated:
+            merged[meal] = regenerated[meal]
+    merged['total_daily'] = {
+        key: sum(merged[meal].get(key, 0) for meal in MEAL_KEYS if isinstance(merged.get(meal), dict))
+        for key in ('calories', 'protein_g', 'carbs_g', 'fats_g')
+    }
+    return merged
@@ -0,0 +1,143 @@
+# plan_storage.py
+# Plans are stored as native Firestore maps (format_version 2) with nutrition
+# and exercise metadata computed at write time. Older documents keep their
+# content as an indented JSON string and are decoded on read.
+import json
+from datetime import datetime
+from config import get_db
+from metrics import timed
+
+PLAN_FORMAT_VERSION = 2
+MEAL_KEYS = ('breakfast', 'lunch', 'dinner')
+MACRO_KEYS = ('calories', 'protein_g', 'carbs_g', 'fats_g')
+
+# Fields each client view needs; None = the whole document
+PLAN_VIEWS = {
+    'full': None,
+    'day': ['type', 'content', 'target_date', 'metadata'],
+    'summary': ['type', 'target_date', 'metadata.calories', 'metadata.protein_g', 'metadata.carbs_g',
+                'metadata.fats_g', 'metadata.exercise_count', 'metadata.total_minutes'],
+}
+
+
+def plan_collection(plan_type):
+    # Determine the collection based on the plan type
+    if plan_type.lower() == 'meal':
+        return 'meal_plans'
+    elif plan_type.lower() == 'workout':
+        return 'workout_plans'
+    return 'other_plans'  # Default collection for other plan types
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _whole(value):
+    # Keep ints as ints so clients that cast to int keep working
+    return int(value) if float(value).is_integer() else round(value, 1)
+
+
+def compute_plan_metadata(plan_type, plan):
+    metadata = {'calories': None, 'exercises': [], 'ingredients': []}
+    if plan_type.lower() == 'meal' and isinstance(plan, dict):
+        meals = [plan[key] for key in MEAL_KEYS if isinstance(plan.get(key), dict)]
+        totals = plan.get('total_daily') if isinstance(plan.get('total_daily'), dict) else {}
+        for key in MACRO_KEYS:
+            # Recompute from the meals rather than trusting the model's own sums
+            summed = sum(_number(meal.get(key)) for meal in meals)
+            metadata[key] = _whole(summed if meals else _number(totals.get(key)))
+        ingredients = []
+        for meal in meals:
+            for item in meal.get('food_items', []):
+                if item not in ingredients:
+                    ingredients.append(item)
+        metadata['ingredients'] = ingredients
+    elif plan_type.lower() == 'workout' and isinstance(plan, list):
+        exercises = [item for item in plan if isinstance(item, dict)]
+        metadata['exercises'] = [item.get('exercise', '') for item in exercises]
+        metadata['exercise_count'] = len(exercises)
+        metadata['total_minutes'] = _whole(sum(_number(item.get('duration')) for item in exercises))
+    return metadata
+
+
+def build_plan_document(plan_type, plan, target_date, timestamp, profile_fingerprint=None, pregenerated=False):
+    document = {
+        'type': plan_type.lower(),
+        'content': plan,
+        'format_version': PLAN_FORMAT_VERSION,
+        'date': timestamp,
+        'target_date': target_date,
+        'metadata': compute_plan_metadata(plan_type, plan),
+    }
+    if profile_fingerprint:
+        # Lets a later request tell which profile changes affect this plan
+        document['profile_fingerprint'] = profile_fingerprint
+    if pregenerated:
+        # Saved by the off-peak job and not yet shown to the user; rewritten
+        # documents don't carry it
+        document['pregenerated'] = True
+    return document
+
+
+# ---------------------- Read Path ----------------------
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {key: _serialize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_serialize(item) for item in value]
+    return value
+
+
+def decode_plan(doc_id, data):
+    plan = dict(data, id=doc_id)
+    if isinstance(plan.get('content'), str):
+        # Legacy format: content is an indented JSON string
+        try:
+            plan['content'] = json.loads(plan['content'])
+        except ValueError:
+            pass
+    return _serialize(plan)
+
+
+def get_plans(user_id, plan_type, start_date, end_date, view='day'):
+    fields = PLAN_VIEWS[view]
+    query = (
+        get_db().collection('users').document(user_id).collection(plan_collection(plan_type))
+        .where('target_date', '>=', start_date)
+        .where('target_date', '<=', end_date)
+        .order_by('target_date')
+    )
+    if fields is not None:
+        # Server-side projection: only the fields the view needs are transferred
+        query = query.select(fields)
+    with timed('plans_read'):
+        docs = list(query.stream())
+    return [decode_plan(doc.id, doc.to_dict() or {}) for doc in docs]
+
+
+# ---------------------- Size Accounting ----------------------
+def firestore_value_size(value):
+    # Storage size rules from the Firestore docs
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode('utf-8')) + 1
+    if isinstance(value, dict):
+        return sum(len(key.encode('utf-8')) + 1 + firestore_value_size(item) for key, item in value.items())
+    if isinstance(value, list):
+        return sum(firestore_value_size(item) for item in value)
+    return 8  # Sentinels, timestamps from the client library
+
+
+def firestore_document_size(document_path, data):
+    # Document name size + fields + 32 bytes of overhead
+    name_size = sum(len(part.encode('utf-8')) + 1 for part in document_path.split('/')) + 16
+    return name_size + firestore_value_size(data) + 32
@@ -0,0 +1,197 @@
+# pregenerate.py
+# Off-peak batch job: generate next week's meal and workout plans for users
+# who chatted recently, so the Sunday evening spike finds plans already saved.
+# Runs the same plan path as /query with bounded concurrency and a shared LLM
+# rate limit, and checkpoints finished (user, plan) pairs so an interrupted
+# run can be resumed.
+#
+#   python pregenerate.py --workers 4 --rpm 60
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta, timezone
+from config import get_db
+from llm_setup import get_llm, get_structured_llm, get_summary_llm, set_llms
+from plan_storage import plan_collection
+from plan_generation import PLAN_FAILED
+from qa_agent import generate_plan_results
+
+ACTIVE_DAYS = 14  # Users with a chat turn in this window get plans
+DEFAULT_WORKERS = 4
+DEFAULT_RPM = 60  # LLM requests per minute shared by all workers
+CHECKPOINT_PATH = 'pregenerate_checkpoint.json'
+PLAN_QUERIES = {
+    'meal': "Generate my weekly meal plan for next week",
+    'workout': "Generate my weekly workout plan for next week",
+}
+
+
+# ---------------------- LLM Rate Limit ----------------------
+class RateLimiter:
+    # Token bucket: `rate` calls per second with bursts of up to `burst`
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimitedLLM:
+    def __init__(self, llm, limiter):
+        self.llm = llm
+        self.limiter = limiter
+
+    def bind(self, **kwargs):
+        return RateLimitedLLM(self.llm.bind(**kwargs), self.limiter)
+
+    def invoke(self, prompt, **kwargs):
+        self.limiter.acquire()
+        return self.llm.invoke(prompt, **kwargs)
+
+    def stream(self, prompt, **kwargs):
+        self.limiter.acquire()
+        return self.llm.stream(prompt, **kwargs)
+
+
+def limit_llm_rate(requests_per_minute):
+    limiter = RateLimiter(requests_per_minute / 60.0)
+    llm, summary_llm, structured_llm = get_llm(), get_summary_llm(), get_structured_llm()
+    set_llms(
+        llm=RateLimitedLLM(llm, limiter),
+        summary_llm=RateLimitedLLM(summary_llm, limiter),
+        structured_llm=RateLimitedLLM(structured_llm, limiter),
+    )
+    return limiter
+
+
+# ---------------------- Checkpoint ----------------------
+class Checkpoint:
+    def __init__(self, path, week_start):
+        self.path = path
+        self.week_start = week_start.isoformat()
+        self.done = set()
+        self.lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('week_start') == self.week_start:
+                self.done = {tuple(item) for item in data.get('done', [])}
+        except (OSError, ValueError):
+            pass  # No checkpoint yet, or one from another week
+
+    def is_done(self, user_id, plan_type):
+        return (user_id, plan_type) in self.done
+
+    def mark_done(self, user_id, plan_type):
+        with self.lock:
+            self.done.add((user_id, plan_type))
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'week_start': self.week_start, 'done': sorted(self.done)}, f)
+            os.replace(tmp_path, self.path)
+
+
+# ---------------------- Batch ----------------------
+def next_week_start(today=None):
+    today = today or date.today()
+    return today + timedelta(days=7 - today.weekday())  # Next Monday
+
+
+def active_users(days=ACTIVE_DAYS):
+    # One collection-group query over chat turns; needs a single-field index on timestamp
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    turns = get_db().collection_group('chat_history').where('timestamp', '>=', since).select([]).stream()
+    return sorted({turn.reference.parent.parent.id for turn in turns})
+
+
+def has_plans(user_id, plan_type, week_start):
+    # The user already generated this week on demand
+    start = datetime.combine(week_start, datetime.min.time())
+    plans = (
+        get_db().collection('users').document(user_id).collection(plan_collection(plan_type))
+        .where('target_date', '>=', start).where('target_date', '<', start + timedelta(days=7))
+        .select([]).limit(1).stream()
+    )
+    return any(True for _ in plans)
+
+
+def pregenerate_user(user_id, week_start, checkpoint):
+    generated = []
+    for plan_type, query in PLAN_QUERIES.items():
+        if checkpoint.is_done(user_id, plan_type):
+            continue
+        if has_plans(user_id, plan_type, week_start):
+            checkpoint.mark_done(user_id, plan_type)
+            continue
+        results = generate_plan_results(
+            query, user_id, True, week_start,
+            is_meal_plan=plan_type == 'meal', is_workout_plan=plan_type == 'workout', record_history=False,
+            pregenerate=True
+        )
+        failed = [result.message for result in results if result.status == PLAN_FAILED]
+        if failed:
+            # Left for the next run
+            logging.warning(f"Pre-generating {plan_type} plan for {user_id} failed: {' '.join(failed)}")
+            continue
+        checkpoint.mark_done(user_id, plan_type)
+        generated.append(plan_type)
+    return generated
+
+
+def run(week_start=None, workers=DEFAULT_WORKERS, active_days=ACTIVE_DAYS, checkpoint_path=CHECKPOINT_PATH,
+        limit=None):
+    week_start = week_start or next_week_start()
+    checkpoint = Checkpoint(checkpoint_path, week_start)
+    users = [
+        user_id for user_id in active_users(active_days)
+        if not all(checkpoint.is_done(user_id, plan_type) for plan_type in PLAN_QUERIES)
+    ]
+    if limit is not None:
+        users = users[:limit]  # Stop early, e.g. at the end of the off-peak window
+    logging.info(f"Pre-generating week of {week_start} for {len(users)} users "
+                 f"({len(checkpoint.done)} plans already done)")
+
+    stats = {'users': len(users), 'plans': 0, 'failed_users': 0}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(pregenerate_user, user_id, week_start, checkpoint): user_id for user_id in users}
+        for future in as_completed(futures):
+            try:
+                stats['plans'] += len(future.result())
+            except Exception as e:
+                stats['failed_users'] += 1
+                logging.error(f"Pre-generation failed for {futures[future]}: {e}")
+    logging.info(f"Pre-generation finished: {stats}")
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pre-generate next week's plans for recently active users")
+    parser.add_argument('--week-start', help='Monday of the week to generate (YYYY-MM-DD); default next Monday')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Users processed concurrently')
+    parser.add_argument('--rpm', type=float, default=DEFAULT_RPM, help='LLM requests per minute across workers')
+    parser.add_argument('--active-days', type=int, default=ACTIVE_DAYS, help='Chatted within this many days')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_PATH, help='Checkpoint file for resuming')
+    parser.add_argument('--limit', type=int, help='Process at most this many users in this run')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    week_start = datetime.strptime(args.week_start, '%Y-%m-%d').date() if args.week_start else None
+    limit_llm_rate(args.rpm)
+    run(week_start, args.workers, args.active_days, args.checkpoint, args.limit)
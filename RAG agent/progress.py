@@ -0,0 +1,207 @@
+# progress.py
+# Pre-aggregated progress for the progress page. The app writes one event doc
+# per day (calories_consumed/{yyyy-MM-dd}, exercise_completions/{yyyy-MM-dd});
+# here each day is folded into a weekly and a monthly rollup document under
+# users/{uid}/progress_rollups, so reading a range costs one read per bucket
+# instead of one per logged day. Daily points are served from the monthly
+# rollups, which keep the per-day values in a `days` map.
+import argparse
+import logging
+from datetime import date, datetime, timedelta
+from firebase_admin import firestore
+from config import get_db
+from metrics import timed
+
+ROLLUP_COLLECTION = 'progress_rollups'
+GRANULARITIES = ('day', 'week', 'month')
+COMPACTION_DAYS = 2  # Days the periodic job re-folds by default
+MAX_BATCH_WRITES = 500  # Firestore batch limit
+
+
+# ---------------------- Buckets ----------------------
+def _day(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())  # Monday
+
+
+def bucket_id(granularity, day):
+    if granularity == 'week':
+        return f"week-{week_start(day).isoformat()}"
+    return f"month-{day:%Y-%m}"
+
+
+def _buckets(granularity, start, end):
+    # First day of every week/month bucket that overlaps [start, end]
+    current = week_start(start) if granularity == 'week' else start.replace(day=1)
+    while current <= end:
+        yield current
+        if granularity == 'week':
+            current += timedelta(days=7)
+        else:
+            current = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _rollups(user_id):
+    return get_db().collection('users').document(user_id).collection(ROLLUP_COLLECTION)
+
+
+# ---------------------- Write Path ----------------------
+def day_entry(calories_consumed=None, completed_exercises=None):
+    # Only the fields given are written, so a meal save doesn't clear exercise data
+    entry = {}
+    if calories_consumed is not None:
+        entry['calories'] = float(calories_consumed)
+    if completed_exercises is not None:
+        entry['completed'] = sum(1 for done in completed_exercises.values() if done is True)
+        entry['total'] = len(completed_exercises)
+    return entry
+
+
+def _fold(user_id, entries):
+    # One merged write per week/month bucket touched; only the given days change
+    buckets = {}
+    for day, entry in entries.items():
+        for granularity in ('week', 'month'):
+            start = week_start(day) if granularity == 'week' else day.replace(day=1)
+            doc = buckets.setdefault(bucket_id(granularity, day), {
+                'period': granularity,
+                'start': start.isoformat(),
+                'days': {},
+                'updated_at': firestore.SERVER_TIMESTAMP,
+            })
+            doc['days'][day.isoformat()] = entry
+
+    db = get_db()
+    items = list(buckets.items())
+    for i in range(0, len(items), MAX_BATCH_WRITES):
+        batch = db.batch()
+        for doc_id, doc in items[i:i + MAX_BATCH_WRITES]:
+            batch.set(_rollups(user_id).document(doc_id), doc, merge=True)
+        batch.commit()
+
+
+def record_day(user_id, day, calories_consumed=None, completed_exercises=None):
+    # Called when the app saves a day: two merged writes, no reads
+    entry = day_entry(calories_consumed, completed_exercises)
+    if not entry:
+        return
+    with timed('progress_write'):
+        _fold(user_id, {_day(day): entry})
+
+
+def compact_user(user_id, since):
+    # Re-fold every event logged on or after `since` (catches writes that skipped record_day)
+    user_ref = get_db().collection('users').document(user_id)
+    since_ts = datetime.combine(_day(since), datetime.min.time())
+    days = {}
+    for collection, field in (('calories_consumed', 'calories_consumed'), ('exercise_completions', 'completed_exercises')):
+        docs = user_ref.collection(collection).where('date', '>=', since_ts).select(['date', field]).stream()
+        for doc in docs:
+            data = doc.to_dict() or {}
+            try:
+                day = _day(doc.id)  # Doc IDs are the app's local yyyy-MM-dd
+            except ValueError:
+                day = _day(data['date'])
+            value = data.get(field)
+            if field == 'calories_consumed':
+                days.setdefault(day, {}).update(day_entry(calories_consumed=value or 0))
+            else:
+                days.setdefault(day, {}).update(day_entry(completed_exercises=value or {}))
+
+    _fold(user_id, days)
+    return len(days)
+
+
+def compact_all(days=COMPACTION_DAYS):
+    since = date.today() - timedelta(days=days)
+    users = [doc.id for doc in get_db().collection('users').select([]).stream()]
+    folded = 0
+    for user_id in users:
+        try:
+            folded += compact_user(user_id, since)
+        except Exception as e:
+            logging.error(f"Progress compaction failed for {user_id}: {e}")
+    logging.info(f"Progress compaction folded {folded} days for {len(users)} users since {since}")
+    return folded
+
+
+# ---------------------- Read Path ----------------------
+def _completion_pct(entry):
+    total = entry.get('total', 0)
+    return round(entry.get('completed', 0) / total * 100, 1) if total else 0.0
+
+
+def _bucket_point(start, end, days):
+    logged = [entry for entry in days.values() if 'calories' in entry]
+    with_exercises = [entry for entry in days.values() if entry.get('total')]
+    calories = sum((entry['calories'] for entry in logged), 0.0)
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'calories_consumed': calories,
+        'avg_daily_calories': round(calories / len(logged), 1) if logged else 0.0,
+        'days_logged': len(logged),
+        # Mean of the daily percentages, as the progress page charts them
+        'exercise_completion_pct': (
+            round(sum(_completion_pct(entry) for entry in with_exercises) / len(with_exercises), 1)
+            if with_exercises else 0.0
+        ),
+    }
+
+
+def get_progress(user_id, start, end, granularity='day'):
+    start, end = _day(start), _day(end)
+    source = 'month' if granularity == 'day' else granularity
+    refs = [_rollups(user_id).document(bucket_id(source, first)) for first in _buckets(source, start, end)]
+    with timed('progress_read'):
+        rollups = {}
+        for ref in refs:
+            snapshot = ref.get()
+            if snapshot.exists:
+                rollups[ref.id] = (snapshot.to_dict() or {}).get('days', {})
+
+    points = []
+    if granularity == 'day':
+        # Every day in the range; days without data are zeros, as the chart expects
+        day = start
+        while day <= end:
+            entry = rollups.get(bucket_id('month', day), {}).get(day.isoformat(), {})
+            points.append({
+                'date': day.isoformat(),
+                'calories_consumed': entry.get('calories', 0.0),
+                'exercise_completion_pct': _completion_pct(entry),
+            })
+            day += timedelta(days=1)
+        return points
+
+    for first in _buckets(granularity, start, end):
+        if granularity == 'week':
+            last = first + timedelta(days=6)
+        else:
+            last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        days = {
+            key: entry for key, entry in rollups.get(bucket_id(granularity, first), {}).items()
+            if start.isoformat() <= key <= end.isoformat()
+        }
+        points.append(_bucket_point(first, last, days))
+    return points
+
+
+# Periodic compaction, e.g. from Cloud Scheduler or cron: python progress.py --days 2
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fold recent progress events into rollups')
+    parser.add_argument('--days', type=int, default=COMPACTION_DAYS, help='Re-fold events from the last N days')
+    parser.add_argument('--user', help='Only compact this user')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.user:
+        compact_user(args.user, date.today() - timedelta(days=args.days))
+    else:
+        compact_all(args.days)
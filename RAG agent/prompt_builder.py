@@ -0,0 +1,46 @@
+# prompt_builder.py
+
+# Rough Gemini tokenizer ratio for English text; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+# Token budget per prompt section
+SECTION_BUDGETS = {
+    'system': 300,
+    'user_info': 200,
+    'summary': 250,
+    'history': 900,
+    'query': 300,
+}
+TRUNCATION_MARK = ' …'
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text, budget, keep='head'):
+    if estimate_tokens(text) <= budget:
+        return text
+    max_chars = max(budget * CHARS_PER_TOKEN - len(TRUNCATION_MARK), 0)
+    if keep == 'tail':
+        # Keep the most recent part (e.g. conversation history)
+        return TRUNCATION_MARK.strip() + ' ' + text[-max_chars:].lstrip()
+    return text[:max_chars].rstrip() + TRUNCATION_MARK
+
+
+class PromptBuilder:
+    def __init__(self, budgets=None):
+        self.budgets = {**SECTION_BUDGETS, **(budgets or {})}
+        self.sections = []
+
+    def add(self, name, title, text, keep='head'):
+        if not text:
+            return self
+        budget = self.budgets.get(name)
+        if budget is not None:
+            text = truncate_to_tokens(text, budget, keep)
+        self.sections.append(f"{title}:\n{text}" if title else text)
+        return self
+
+    def build(self):
+        return '\n\n'.join(self.sections)
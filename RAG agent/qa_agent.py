@@ -1,22 +1,28 @@
-from firestore_memory import FirestoreMemory
-from helpers import extract_json_from_response, get_user_biometric_data
-from plan_generation import generate_and_save_meal_plan, generate_and_save_workout_plan
-from llm_setup import llm
+from audit_log import audit
+from firestore_memory import FirestoreMemory, format_turns
+from helpers import clear_pregenerated, get_user_biometric_data
+from intent import classify_intent
+from plan_generation import (
+    PLAN_EXISTING, PLAN_FAILED, PlanResult, generate_and_save_meal_plan, generate_and_save_workout_plan,
+    regenerate_meal_days, regenerate_workout_days
+)
+from plan_diff import plan_changes, pregenerated_plans, profile_fingerprint
+from llm_setup import get_llm
+from prompt_builder import PromptBuilder, estimate_tokens
+from schemas import NutrientTargets
+from structured_output import invoke_structured_with_retry
+from coalescing import coalesce_key, plan_flight
 from config import *
-import logging
-from transformers import pipeline
-
-# Configure logging to show DEBUG and higher-level messages
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()  # Outputs to console
-    ]
+from metrics import timed
+from resilience import (
+    GENERAL_DEADLINE_SECONDS, PLAN_DEADLINE_SECONDS, CircuitOpenError, DeadlineExceeded, deadline,
+    degraded_answer, remember_answer, resilient_invoke, resilient_stream
 )
+import logging
 
-# Initialize the intent classification pipeline
-intent_classifier = pipeline("zero-shot-classification", model="facebook/bart-large-mnli")
+FOOD_RESULTS = 10  # Foods retrieved per lookup
+MEALS_PER_DAY = 3  # No single food may exceed one meal's share of the daily calories
+PROTEIN_SOURCE_SHARE = 0.1  # Protein sources: per 100 g, at least this share of the daily protein target
 
 SYSTEM_PROMPT = """You are a knowledgeable AI assistant specializing in nutrition, fitness, and general health. 
 Your primary tasks are:
@@ -38,6 +44,13 @@ For personalized plans:
 
 Always prioritize accuracy and clarity in your responses."""
 
+# General questions don't need the plan-generation rules
+GENERAL_SYSTEM_PROMPT = """You are a knowledgeable AI assistant specializing in nutrition, fitness, and general health.
+Answer the user's question with accurate, evidence-based information:
+- Provide clear, concise answers and avoid speculative statements.
+- Use standard paragraph breaks, different text styles and lines instead of "*" for readability.
+- Use appropriate formatting and emojis to enhance readability."""
+
 def generate_nutrient_targets(biometric_data):
     nutrient_prompt = (
         f"Calculate DAILY nutritional targets considering:\n"
@@ -54,62 +67,103 @@ def generate_nutrient_targets(biometric_data):
         }'''
         "\nINCLUDE ONLY JSON!"
     )
+    raw = []
     try:
-        response = llm.invoke(nutrient_prompt).content
-        # DEBUG: Log raw LLM response for nutrient targets
-        logging.debug(f"Raw LLM response for nutrient targets: {response}\n\n")
-        parsed_targets = extract_json_from_response(response)
-        # DEBUG: Log parsed nutrient targets
-        logging.debug(f"Parsed nutrient targets: {parsed_targets}\n\n\n\n\n")
+        parsed_targets = invoke_structured_with_retry(nutrient_prompt, NutrientTargets, responses=raw)
+        audit('nutrient_targets', prompt=nutrient_prompt, raw=raw, targets=parsed_targets)
         return parsed_targets
     except Exception as e:
+        audit('nutrient_targets', prompt=nutrient_prompt, raw=raw, error=e)
         print(f"Error generating nutrient targets: {e}")
         return None
 
-def classify_intent(query):
-    candidate_labels = ["generate meal plan", "generate workout plan", "general question"]
-    result = intent_classifier(query, candidate_labels)
-    return result['labels'][0]
+def retrieve_food_items(biometric_data, nutrient_targets):
+    # USDA foods for the meal plan, filtered inside the vector store query:
+    # the profile's allergens are excluded, and protein sources get their own
+    # lookup so they aren't crowded out by everything else
+    # Imported here: Chroma is only loaded once a meal plan needs it
+    from data_processing import allergen_flags
+    from vector_store import food_filter, get_filtered_retriever, get_food_store
+    preference = biometric_data.get('preferenceFood') or None
+    excluded = allergen_flags(biometric_data.get('foodAllergies'))
+    max_calories = nutrient_targets['calories'] / MEALS_PER_DAY
+    min_protein = nutrient_targets['protein_g']['target'] * PROTEIN_SOURCE_SHARE
+    store = get_food_store()
+    documents = {}
+    for text, protein in (("whole food ingredients", None), ("complete protein sources", min_protein)):
+        text = f"{preference} {text}" if preference else text
+        found = []
+        # The preference is only a filter when it names a food category (e.g. "Vegetables and
+        # Vegetable Products"); a cuisine such as "Asian" matches none, so it only steers the query
+        for category in ((preference, None) if preference else (None,)):
+            where = food_filter(excluded, category, max_calories, protein)
+            found = get_filtered_retriever(store, where, k=FOOD_RESULTS).invoke(text)
+            if len(found) >= FOOD_RESULTS:
+                break
+        for document in found:
+            documents.setdefault(document.metadata.get('name', document.page_content), document.page_content)
+    return "\n\n".join(documents.values())
 
-def call_rag_agent(query, userId, isWeekly, start_date=None):
-    intent = classify_intent(query)
-    
-    is_meal_plan = intent == "generate meal plan"
-    is_workout_plan = intent == "generate workout plan"
+def generate_plans(query, userId, isWeekly, start_date, is_meal_plan, is_workout_plan, record_history=True):
+    # The reply for the user; generate_plan_results has the status of each plan
+    results = generate_plan_results(query, userId, isWeekly, start_date, is_meal_plan, is_workout_plan, record_history)
+    return "\n".join(result.message for result in results)
+
+def generate_plan_results(query, userId, isWeekly, start_date, is_meal_plan, is_workout_plan, record_history=True,
+                          pregenerate=False):
+    # pregenerate: called by the off-peak job, whose plans are marked so the
+    # user's first request for the week can use them
+    biometric_data = get_user_biometric_data(userId)
+    results = []
     
-    if is_meal_plan or is_workout_plan:
-        memory = FirestoreMemory(userId)
-        biometric_data = get_user_biometric_data(userId)
-        messages = []
-        
-        if biometric_data:
-            biometric_info = (
-                f"User's Biometric Data:\n"
-                f"- Name: {biometric_data.get('name', 'N/A')}\n"
-                f"- Gender: {biometric_data.get('gender', 'N/A')}\n"
-                f"- Age: {biometric_data.get('age', 'N/A')} years\n"
-                f"- Height: {biometric_data.get('height', 'N/A')} cm\n"
-                f"- Weight: {biometric_data.get('weight', 'N/A')} kg\n"
-                f"- Heart Conditions: {biometric_data.get('healthConditions', 'None')}\n"
-                f"- Food Allergies: {biometric_data.get('foodAllergies', 'None')}\n"
-                f"- Preference Food: {biometric_data.get('preferenceFood', 'None')}\n"
-                f"- Fitness Goals: Endurance({biometric_data.get('fitnessGoals', {}).get('endurance', False)}), "
-                f"Muscle Gain({biometric_data.get('fitnessGoals', {}).get('muscleGain', False)}), "
-                f"Strength({biometric_data.get('fitnessGoals', {}).get('strength', False)}), "
-                f"Weight Loss({biometric_data.get('fitnessGoals', {}).get('weightLoss', False)})\n"
-                f"- Workout level: {biometric_data.get('workoutLevelString', 'N/A')}\n"
-                f"- Last Updated: {biometric_data.get('last_updated', 'N/A')}\n"
-            )
-        else:
-            biometric_info = "No biometric data available for this user.\n"
+    if biometric_data:
+        biometric_info = (
+            f"User's Biometric Data:\n"
+            f"- Name: {biometric_data.get('name', 'N/A')}\n"
+            f"- Gender: {biometric_data.get('gender', 'N/A')}\n"
+            f"- Age: {biometric_data.get('age', 'N/A')} years\n"
+            f"- Height: {biometric_data.get('height', 'N/A')} cm\n"
+            f"- Weight: {biometric_data.get('weight', 'N/A')} kg\n"
+            f"- Heart Conditions: {biometric_data.get('healthConditions', 'None')}\n"
+            f"- Food Allergies: {biometric_data.get('foodAllergies', 'None')}\n"
+            f"- Preference Food: {biometric_data.get('preferenceFood', 'None')}\n"
+            f"- Fitness Goals: Endurance({biometric_data.get('fitnessGoals', {}).get('endurance', False)}), "
+            f"Muscle Gain({biometric_data.get('fitnessGoals', {}).get('muscleGain', False)}), "
+            f"Strength({biometric_data.get('fitnessGoals', {}).get('strength', False)}), "
+            f"Weight Loss({biometric_data.get('fitnessGoals', {}).get('weightLoss', False)})\n"
+            f"- Workout level: {biometric_data.get('workoutLevelString', 'N/A')}\n"
+            f"- Last Updated: {biometric_data.get('last_updated', 'N/A')}\n"
+        )
+    else:
+        biometric_info = "No biometric data available for this user.\n"
 
-        # Handle meal plan with nutrient-based retrieval
-        if is_meal_plan:
+    # Stored on each plan so a later request can tell which profile changes affect it
+    fingerprint = profile_fingerprint(biometric_data)
+
+    # Handle meal plan with nutrient-based retrieval
+    if is_meal_plan:
+        # Days of the current week the request or a profile change affects (None = a whole new plan)
+        changes, refresh_ids = plan_changes('meal', userId, query, biometric_data, start_date, isWeekly)
+        reuse_ids = None if changes is not None or pregenerate else pregenerated_plans(
+            'meal', userId, biometric_data, start_date, isWeekly
+        )
+        if reuse_ids:
+            clear_pregenerated(userId, 'meal', reuse_ids)
+            results.append(PlanResult(
+                PLAN_EXISTING, "Your meal plan for this week is ready! 🥗 Check the 'Meals Plan' page to view it."
+            ))
+        elif changes == {}:
+            # Nothing to regenerate, so skip the targets and food retrieval calls too
+            results.append(regenerate_meal_days(
+                userId, query, SYSTEM_PROMPT, biometric_info, None, changes, fingerprint, refresh_ids
+            ))
+        else:
             # Generate nutrient targets
-            nutrient_targets = generate_nutrient_targets(biometric_data)
+            with timed('nutrient_targets'):
+                nutrient_targets = generate_nutrient_targets(biometric_data)
             if not nutrient_targets:
-                return "Error generating nutritional targets. Please try again."
-            
+                return [PlanResult(PLAN_FAILED, "Error generating nutritional targets. Please try again.")]
+        
             # Create nutrient-based query
             nutrient_query = (
                 f"Food items matching these DAILY targets:\n"
@@ -123,17 +177,18 @@ def call_rag_agent(query, userId, isWeekly, start_date=None):
                 f"- Whole food ingredients\n"
                 f"- Low processed options"
             )
-            
-            # DEBUG: Log nutrient query sent to retriever
-            logging.debug(f"Nutrient query for retrieval: {nutrient_query}\n\n")
-            
-            # Retrieve relevant food items
+        
+            # Retrieve relevant food items from the USDA store; the LLM only
+            # suggests foods when the store can't be read
             try:
-                food_items = llm.invoke(nutrient_query).content
-                
-                # DEBUG: Log retrieved food items from vector store
-                logging.debug(f"Retrieved food items for nutrient query: {food_items}\n\n\n\n\n")
-                
+                with timed('food_retrieval'):
+                    try:
+                        food_items, source = retrieve_food_items(biometric_data, nutrient_targets), 'store'
+                    except Exception as e:
+                        logging.error(f"Food store retrieval failed, asking the LLM instead: {e}")
+                        food_items, source = resilient_invoke(get_llm(), nutrient_query).content, 'llm'
+                audit('food_items', prompt=nutrient_query, source=source, raw=food_items)
+            
                 food_menu = (
                     "Food Items:\n" + 
                     f"{food_items}\n" + 
@@ -143,65 +198,162 @@ def call_rag_agent(query, userId, isWeekly, start_date=None):
                 print(f"Food items generation error: {e}")
                 food_menu = "Failed to generate food items."
 
-            messages.append(generate_and_save_meal_plan(
-                userId, query, SYSTEM_PROMPT, biometric_info, food_menu, isWeekly, start_date
-            ))
+            if changes is None:
+                results.append(generate_and_save_meal_plan(
+                    userId, query, SYSTEM_PROMPT, biometric_info, food_menu, isWeekly, start_date, fingerprint, pregenerate
+                ))
+            else:
+                results.append(regenerate_meal_days(
+                    userId, query, SYSTEM_PROMPT, biometric_info, food_menu, changes, fingerprint, refresh_ids
+                ))
 
-        # Handle workout plan with original retrieval
-        if is_workout_plan:
-            messages.append(generate_and_save_workout_plan(
-                userId, query, SYSTEM_PROMPT, biometric_info, isWeekly, start_date
+    # Handle workout plan with original retrieval
+    if is_workout_plan:
+        changes, refresh_ids = plan_changes('workout', userId, query, biometric_data, start_date, isWeekly)
+        reuse_ids = None if changes is not None or pregenerate else pregenerated_plans(
+            'workout', userId, biometric_data, start_date, isWeekly
+        )
+        if reuse_ids:
+            clear_pregenerated(userId, 'workout', reuse_ids)
+            results.append(PlanResult(
+                PLAN_EXISTING, "Your workout plan for this week is ready! 💪 Check the 'Workout Plan' page to view it."
+            ))
+        elif changes is None:
+            results.append(generate_and_save_workout_plan(
+                userId, query, SYSTEM_PROMPT, biometric_info, isWeekly, start_date, fingerprint, pregenerate
             ))
+        else:
+            results.append(regenerate_workout_days(
+                userId, query, SYSTEM_PROMPT, biometric_info, changes, fingerprint, refresh_ids
+            ))
+
+    if record_history:  # Batch pre-generation isn't part of the conversation
+        FirestoreMemory(userId).append_to_history(query, "\n".join(result.message for result in results))
+    return results
+
+def general_prompt(query, userId):
+    # Prompt for a general question, with the memory it was built from
+    memory = FirestoreMemory(userId)
+    biometric_data = get_user_biometric_data(userId)
 
-        final_message = "\n".join(messages)
-        memory.append_to_history(query, final_message)
-        return final_message
+    if biometric_data:
+        biometric_info = (
+            f"User's Biometric Data:\n"
+            f"- Name: {biometric_data.get('name', 'N/A')}\n"
+            f"- Gender: {biometric_data.get('gender', 'N/A')}\n"
+            f"- Age: {biometric_data.get('age', 'N/A')} years\n"
+            f"- Height: {biometric_data.get('height', 'N/A')} cm\n"
+            f"- Weight: {biometric_data.get('weight', 'N/A')} kg\n"
+            f"- Heart Conditions: {biometric_data.get('healthConditions', 'None')}\n"
+            f"- Food Allergies: {biometric_data.get('foodAllergies', 'None')}\n"
+            f"- Preference Food: {biometric_data.get('preferenceFood', 'None')}\n"
+            f"- Fitness Goals: Endurance({biometric_data.get('fitnessGoals', {}).get('endurance', False)}), "
+            f"Muscle Gain({biometric_data.get('fitnessGoals', {}).get('muscleGain', False)}), "
+            f"Strength({biometric_data.get('fitnessGoals', {}).get('strength', False)}), "
+            f"Weight Loss({biometric_data.get('fitnessGoals', {}).get('weightLoss', False)})\n"
+            f"- Last Updated: {biometric_data.get('last_updated', 'N/A')}\n"
+        )
+    else:
+        biometric_info = "No biometric data available for this user.\n"
+
+    prompt = (
+        PromptBuilder()
+        .add('system', "System Instructions", GENERAL_SYSTEM_PROMPT)
+        .add('user_info', "User Information", biometric_info)
+        .add('summary', "Earlier Conversation Summary", memory.get_summary())
+        .add('history', "Recent Conversation", memory.get_recent_history(), keep='tail')
+        .add('query', "User Query", query)
+        .add(None, None,
+             "Provide a clear, concise, and evidence-based response using your training knowledge.\n"
+             "Use some related emojis to make the response more engaging and human-like.")
+        .build()
+    )
+    legacy_tokens = estimate_tokens(SYSTEM_PROMPT + biometric_info + format_turns(memory.history) + query)
+    logging.info(f"General prompt tokens (estimated): {legacy_tokens} before -> {estimate_tokens(prompt)} after")
+    return memory, prompt
+
+def call_rag_agent(query, userId, isWeekly, start_date=None, intent=None, on_coalesced=None):
+    # intent may be passed in when the caller has already classified the query;
+    # on_coalesced is called if the request waits for an identical plan run
+    if intent is None:
+        with timed('intent_classification'):
+            intent = classify_intent(query)
+    
+    is_meal_plan = intent == "generate meal plan"
+    is_workout_plan = intent == "generate workout plan"
+    
+    if is_meal_plan or is_workout_plan:
+        # Duplicate taps on "generate" attach to the run already in flight
+        key = coalesce_key(userId, intent, isWeekly, start_date, query)
+        with deadline(PLAN_DEADLINE_SECONDS):
+            return plan_flight.do(key, lambda: generate_plans(
+                query, userId, isWeekly, start_date, is_meal_plan, is_workout_plan
+            ), on_wait=on_coalesced)
     else:
         try:
-            memory = FirestoreMemory(userId)
-            conversation_history = memory.get_history()
-            biometric_data = get_user_biometric_data(userId)
-            
             # Handle general questions
-            if biometric_data:
-                biometric_info = (
-                    f"User's Biometric Data:\n"
-                    f"- Name: {biometric_data.get('name', 'N/A')}\n"
-                    f"- Gender: {biometric_data.get('gender', 'N/A')}\n"
-                    f"- Age: {biometric_data.get('age', 'N/A')} years\n"
-                    f"- Height: {biometric_data.get('height', 'N/A')} cm\n"
-                    f"- Weight: {biometric_data.get('weight', 'N/A')} kg\n"
-                    f"- Heart Conditions: {biometric_data.get('healthConditions', 'None')}\n"
-                    f"- Food Allergies: {biometric_data.get('foodAllergies', 'None')}\n"
-                    f"- Preference Food: {biometric_data.get('preferenceFood', 'None')}\n"
-                    f"- Fitness Goals: Endurance({biometric_data.get('fitnessGoals', {}).get('endurance', False)}), "
-                    f"Muscle Gain({biometric_data.get('fitnessGoals', {}).get('muscleGain', False)}), "
-                    f"Strength({biometric_data.get('fitnessGoals', {}).get('strength', False)}), "
-                    f"Weight Loss({biometric_data.get('fitnessGoals', {}).get('weightLoss', False)})\n"
-                    f"- Last Updated: {biometric_data.get('last_updated', 'N/A')}\n"
-                )
-            else:
-                biometric_info = "No biometric data available for this user.\n"
-        
-            prompt = (
-                f"System Instructions:\n{SYSTEM_PROMPT}\n\n"
-                f"User Information:\n{biometric_info}\n"
-                f"Conversation History:\n{conversation_history}\n\n"
-                f"User Query: {query}\n\n"
-                "Provide a clear, concise, and evidence-based response using your training knowledge.\n\n"
-                "Use some related emojis to make the response more engaging and human-like.\n"
-            )
-            
-            # DEBUG: Log prompt for general question
-            logging.debug(f"Prompt for general question: {prompt}")
-            
-            response = llm.invoke(prompt).content
-            
-            # DEBUG: Log raw LLM response for general question
-            logging.debug(f"Raw LLM response for general question: {response}")
+            with deadline(GENERAL_DEADLINE_SECONDS):
+                memory, prompt = general_prompt(query, userId)
+
+                with timed('llm_general'):
+                    response = resilient_invoke(get_llm(), prompt).content
+            audit('general', prompt=prompt, raw=response)
             final_response = response.rstrip('\n')
+            remember_answer(userId, query, final_response)
             memory.append_to_history(query, final_response)
             return final_response
+        except (CircuitOpenError, DeadlineExceeded) as e:
+            logging.warning(f"Serving degraded answer: {e}")
+            return degraded_answer(userId, query)
         except Exception as e:
             print(f"Error during QA chain execution: {e}")
-            return "I apologize, but I encountered an error processing your request. Please try again."
\ No newline at end of file
+            return "I apologize, but I encountered an error processing your request. Please try again."
+
+def stream_rag_agent(query, userId, isWeekly, start_date=None, intent=None, on_coalesced=None):
+    # call_rag_agent as a generator of text pieces: general answers are streamed
+    # from the LLM as they are produced (for /voice); plan requests yield their
+    # summary message once generation finishes
+    if intent is None:
+        with timed('intent_classification'):
+            intent = classify_intent(query)
+
+    if intent in ("generate meal plan", "generate workout plan"):
+        key = coalesce_key(userId, intent, isWeekly, start_date, query)
+        with deadline(PLAN_DEADLINE_SECONDS):
+            message = plan_flight.do(key, lambda: generate_plans(
+                query, userId, isWeekly, start_date, intent == "generate meal plan", intent == "generate workout plan"
+            ), on_wait=on_coalesced)
+        yield message
+        return
+
+    pieces = []
+    try:
+        # Same whole-request budget as call_rag_agent
+        with deadline(GENERAL_DEADLINE_SECONDS):
+            memory, prompt = general_prompt(query, userId)
+            with timed('llm_general'):
+                # Closed explicitly, so a consumer that stops early (a /voice
+                # client going away) also ends the LLM stream; the history
+                # write below is then skipped
+                stream = resilient_stream(get_llm(), prompt)
+                try:
+                    for chunk in stream:
+                        if chunk.content:
+                            pieces.append(chunk.content)
+                            yield chunk.content
+                finally:
+                    stream.close()
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        logging.warning(f"Serving degraded answer: {e}")
+        if not pieces:
+            yield degraded_answer(userId, query)
+        return
+    except Exception as e:
+        print(f"Error during QA chain execution: {e}")
+        if not pieces:
+            yield "I apologize, but I encountered an error processing your request. Please try again."
+        return
+    answer = ''.join(pieces).rstrip('\n')
+    audit('general', prompt=prompt, raw=answer, streamed=True)
+    remember_answer(userId, query, answer)
+    memory.append_to_history(query, answer)
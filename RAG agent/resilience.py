@@ -0,0 +1,388 @@
+# resilience.py
+# Guards around every Gemini call so one hung request can't hold a worker:
+# - a request deadline in a ContextVar that every step inside it respects
+#   (per-step timeouts are capped by what is left of the deadline)
+# - hedging: if a call is still running after the observed p95 latency for its
+#   kind, a duplicate is sent and whichever finishes first wins
+# - a circuit breaker per call kind that fails fast while Gemini keeps failing
+#   for that kind, so callers can serve a degraded answer instead of queueing
+#   behind timeouts (a failing structured model doesn't open chat's circuit)
+# Calls run on a shared thread pool because a blocking client call can't be
+# cancelled; a call that times out finishes (or hits the client timeout) there.
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from metrics import registry
+
+# Seconds a single LLM step may take, by kind
+STEP_TIMEOUTS = {'general': 45, 'structured': 60, 'summary': 20}
+DEFAULT_STEP_TIMEOUT = 60
+# Whole-request budgets set by qa_agent
+GENERAL_DEADLINE_SECONDS = 60
+PLAN_DEADLINE_SECONDS = 600
+
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20  # No hedging until the latency window has this many calls
+HEDGE_MIN_DELAY = 1.0
+HEDGE_MAX_FRACTION = 0.1  # Hedges allowed per call, so hedging adds at most ~10% load
+LATENCY_WINDOW = 200
+
+BREAKER_FAILURES = 5  # Consecutive upstream failures that open the circuit
+BREAKER_RESET_SECONDS = 30  # Open time before one probe call is let through
+
+LLM_THREADS = 32
+DEGRADED_ANSWERS = 1024  # Recent general answers (per user) kept for degraded mode
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+# ---------------------- Deadlines ----------------------
+_deadline = contextvars.ContextVar('llm_deadline', default=None)
+
+
+@contextmanager
+def deadline(seconds):
+    # Nested deadlines can only shorten the one already in effect
+    end = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(end if current is None else min(current, end))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+# LLM calls made by the current request, for admission control's per-call estimate
+_llm_calls = contextvars.ContextVar('llm_calls', default=None)
+
+
+def count_llm_calls():
+    # Starts a counter for this context (and the threads copied from it) and
+    # returns it; counter[0] is the number of LLM calls made so far
+    counter = [0]
+    _llm_calls.set(counter)
+    return counter
+
+
+def note_llm_call():
+    counter = _llm_calls.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def remaining():
+    end = _deadline.get()
+    return None if end is None else end - time.monotonic()
+
+
+def stop_at_deadline(retry_state):
+    # tenacity stop condition: no further attempts once the deadline has passed
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def wait_within_deadline(wait_strategy):
+    # tenacity wait wrapper: never back off past the deadline
+    def _wait(retry_state):
+        seconds = wait_strategy(retry_state)
+        left = remaining()
+        return seconds if left is None else max(0.0, min(seconds, left))
+    return _wait
+
+
+# ---------------------- Circuit Breaker ----------------------
+PROBE = 'probe'
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def _transition(self, state):
+        if state != self.state:
+            logging.warning(f"Circuit '{self.name}' {self.state} -> {state}")
+            registry.increment('llm_circuit_transitions_total', (('breaker', self.name), ('to', state)),
+                               help_text='Circuit breaker state changes')
+            self.state = state
+
+    def allow(self):
+        # False to fail fast, True to call, or PROBE for the one call let
+        # through to test a half-open circuit
+        with self.lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self._transition('half_open')
+                return PROBE
+            return False
+
+    def release_probe(self):
+        # Called when a probe ends; if it recorded no outcome (deadline passed,
+        # caller closed the stream) the circuit reopens and the next call probes
+        with self.lock:
+            if self.state == 'half_open':
+                self.opened_at = time.monotonic() - self.reset_seconds
+                self._transition('open')
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self._transition('closed')
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._transition('open')
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(kind):
+    # One circuit per call kind (general, summary, structured), created on first use
+    with _breakers_lock:
+        if kind not in _breakers:
+            _breakers[kind] = CircuitBreaker(f'gemini-{kind}', BREAKER_FAILURES, BREAKER_RESET_SECONDS)
+        return _breakers[kind]
+
+
+def reset_breakers():
+    # Forget every circuit (benchmarks and tests start from closed circuits)
+    with _breakers_lock:
+        _breakers.clear()
+
+
+# ---------------------- Hedged Calls ----------------------
+class LatencyWindow:
+    def __init__(self, size=LATENCY_WINDOW):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, pct):
+        with self.lock:
+            if len(self.samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+_executor = ThreadPoolExecutor(max_workers=LLM_THREADS, thread_name_prefix='llm')
+_windows = {}
+_counts = {'calls': 0, 'hedges': 0}
+_lock = threading.Lock()
+
+
+def _window(kind):
+    with _lock:
+        return _windows.setdefault(kind, LatencyWindow())
+
+
+def _hedge_allowed():
+    with _lock:
+        if _counts['hedges'] + 1 > _counts['calls'] * HEDGE_MAX_FRACTION:
+            return False
+        _counts['hedges'] += 1
+        return True
+
+
+def _step_end(kind):
+    timeout = STEP_TIMEOUTS.get(kind, DEFAULT_STEP_TIMEOUT)
+    left = remaining()
+    if left is not None:
+        if left <= 0:
+            raise DeadlineExceeded("request deadline already passed")
+        timeout = min(timeout, left)
+    return time.monotonic() + timeout
+
+
+def _count(kind, outcome):
+    registry.increment('llm_calls_total', (('kind', kind), ('outcome', outcome)),
+                       help_text='LLM calls by kind and outcome')
+
+
+def _upstream_failed(error):
+    # ValueErrors (off-schema JSON, validation) mean Gemini did answer
+    return not isinstance(error, ValueError)
+
+
+def resilient_call(kind, fn, hedge=True):
+    # fn() once, or twice if the first is slower than the kind's p95; returns
+    # the first successful result
+    end = _step_end(kind)
+    breaker = get_breaker(kind)
+    permit = breaker.allow()
+    if not permit:
+        _count(kind, 'circuit_open')
+        raise CircuitOpenError(f"LLM circuit for {kind} calls is open")
+    note_llm_call()
+    try:
+        return _hedged_call(kind, fn, hedge, end, breaker)
+    finally:
+        if permit == PROBE:
+            breaker.release_probe()
+
+
+def _hedged_call(kind, fn, hedge, end, breaker):
+    window = _window(kind)
+    hedge_after = window.percentile(HEDGE_PERCENTILE) if hedge else None
+    if hedge_after is not None:
+        hedge_after = max(hedge_after, HEDGE_MIN_DELAY)
+    with _lock:
+        _counts['calls'] += 1
+
+    def attempt():
+        start = time.monotonic()
+        result = fn()
+        window.observe(time.monotonic() - start)
+        return result
+
+    started = time.monotonic()
+    pending = {_executor.submit(contextvars.copy_context().run, attempt)}
+    hedged = False
+    error = None
+    while pending:
+        now = time.monotonic()
+        timeout = end - now
+        if hedge_after is not None:
+            timeout = min(timeout, started + hedge_after - now)
+        done, pending = wait(pending, timeout=max(timeout, 0), return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                breaker.record_success()
+                _count(kind, 'hedged_ok' if hedged else 'ok')
+                return future.result()
+            error = future.exception()
+            if not _upstream_failed(error):
+                breaker.record_success()
+                raise error
+        if not pending:
+            break
+        if time.monotonic() >= end:
+            error = DeadlineExceeded(f"{kind} LLM call exceeded its deadline")
+            break
+        if hedge_after is not None and time.monotonic() >= started + hedge_after:
+            hedge_after = None  # One hedge at most
+            if _hedge_allowed():
+                hedged = True
+                pending.add(_executor.submit(contextvars.copy_context().run, attempt))
+                _count(kind, 'hedge_sent')
+
+    breaker.record_failure()
+    _count(kind, 'timeout' if isinstance(error, DeadlineExceeded) else 'error')
+    raise error
+
+
+def resilient_invoke(llm, prompt, kind='general'):
+    return resilient_call(kind, lambda: llm.invoke(prompt))
+
+
+_END = object()
+
+
+def resilient_stream(llm, prompt, kind='general'):
+    # Streamed chunks with the same breaker and deadline (not hedged: the
+    # caller is already consuming the first stream)
+    end = _step_end(kind)
+    breaker = get_breaker(kind)
+    permit = breaker.allow()
+    if not permit:
+        _count(kind, 'circuit_open')
+        raise CircuitOpenError(f"LLM circuit for {kind} calls is open")
+    note_llm_call()
+    try:
+        yield from _stream_chunks(kind, llm, prompt, end, breaker)
+    finally:
+        if permit == PROBE:
+            breaker.release_probe()
+
+
+def _stream_chunks(kind, llm, prompt, end, breaker):
+    chunks = None
+
+    def next_chunk():
+        nonlocal chunks
+        if chunks is None:
+            chunks = iter(llm.stream(prompt))
+        return next(chunks, _END)
+
+    future = None
+    try:
+        while True:
+            future = _executor.submit(contextvars.copy_context().run, next_chunk)
+            try:
+                chunk = future.result(timeout=max(end - time.monotonic(), 0))
+            except Exception as e:
+                if not future.done():
+                    breaker.record_failure()
+                    _count(kind, 'timeout')
+                    raise DeadlineExceeded(f"{kind} LLM stream exceeded its deadline")
+                if _upstream_failed(e):
+                    breaker.record_failure()
+                    _count(kind, 'error')
+                raise
+            if chunk is _END:
+                breaker.record_success()
+                _count(kind, 'ok')
+                return
+            yield chunk
+    finally:
+        # Closed early (e.g. the client went away): end the upstream stream
+        # too, unless a read is still in flight on the executor
+        close = getattr(chunks, 'close', None)
+        if close is not None and (future is None or future.done()):
+            close()
+
+
+# ---------------------- Degraded Answers ----------------------
+_answers = OrderedDict()
+DEGRADED_NOTICE = (
+    "\n\n(I'm having trouble reaching my AI service right now, so this is an earlier answer to the same question.)"
+)
+UNAVAILABLE_MESSAGE = "I'm having trouble reaching my AI service right now. Please try again in a minute."
+
+
+def _answer_key(user_id, query):
+    # Per user: general answers are personalized (profile, allergies, history)
+    return user_id, re.sub(r'[^a-z0-9 ]', '', re.sub(r'\s+', ' ', query.lower())).strip()
+
+
+def remember_answer(user_id, query, answer):
+    key = _answer_key(user_id, query)
+    with _lock:
+        _answers[key] = answer
+        _answers.move_to_end(key)
+        while len(_answers) > DEGRADED_ANSWERS:
+            _answers.popitem(last=False)
+
+
+def degraded_answer(user_id, query):
+    # The user's earlier answer to the same general question, or a short apology
+    with _lock:
+        answer = _answers.get(_answer_key(user_id, query))
+    registry.increment('llm_degraded_answers_total', (('cached', str(answer is not None).lower()),),
+                       help_text='Answers served while the LLM was unavailable')
+    return answer + DEGRADED_NOTICE if answer else UNAVAILABLE_MESSAGE
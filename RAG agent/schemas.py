@@ -0,0 +1,65 @@
+# schemas.py
+from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field, RootModel
+
+
+# ---------------------- Meal Plan (one day) ----------------------
+class MealNutrition(BaseModel):
+    food_items: List[str] = Field(min_length=1)
+    calories: float
+    protein_g: float
+    carbs_g: float
+    fats_g: float
+
+
+class DailyTotals(BaseModel):
+    calories: float
+    protein_g: float
+    carbs_g: float
+    fats_g: float
+
+
+class MealVerification(BaseModel):
+    max_serving_check: bool
+    vegetable_inclusion: bool
+    protein_variety_check: bool
+
+
+class MealDay(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+
+    breakfast: MealNutrition
+    lunch: MealNutrition
+    dinner: MealNutrition
+    total_daily: DailyTotals
+    verification: Optional[MealVerification] = None
+
+
+# ---------------------- Workout Plan (one day) ----------------------
+class WorkoutExercise(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+
+    exercise: str
+    duration: float
+    intensity: str
+
+
+class WorkoutList(RootModel[List[WorkoutExercise]]):
+    pass
+
+
+# ---------------------- Nutrient Targets ----------------------
+class NutrientRange(BaseModel):
+    min: float
+    target: float
+    max: float
+
+
+class NutrientTargets(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+
+    calories: float
+    protein_g: NutrientRange
+    carbs_g: NutrientRange
+    fats_g: NutrientRange
+    rationale: Optional[str] = None
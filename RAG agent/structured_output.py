@@ -0,0 +1,255 @@
+# structured_output.py
+import json
+import logging
+import re
+from pydantic import RootModel, TypeAdapter, ValidationError
+from tenacity import retry, stop_after_attempt, stop_any, wait_exponential, retry_if_exception_type
+from google.api_core.exceptions import ResourceExhausted
+from llm_setup import get_structured_llm
+from metrics import timed
+from resilience import resilient_call, stop_at_deadline, wait_within_deadline
+
+MAX_REASKS = 1
+MAX_PREAMBLE_CHARS = 200  # Prose allowed before the JSON root starts
+
+
+class OffSchemaError(ValueError):
+    pass
+
+
+def _is_list_schema(schema):
+    return issubclass(schema, RootModel)
+
+
+def _item_adapter(schema):
+    # RootModel[List[Item]] -> TypeAdapter(Item)
+    item_type = schema.model_fields['root'].annotation.__args__[0]
+    return TypeAdapter(item_type)
+
+
+def schema_instructions(schema):
+    return (
+        "Respond with JSON that validates against this JSON Schema:\n"
+        f"{json.dumps(schema.model_json_schema(), separators=(',', ':'))}\n"
+    )
+
+
+# ---------------------- Incremental Validation ----------------------
+# Validates top-level fields (objects) or items (lists) as soon as they are
+# complete, so an off-schema streamed response can be aborted early.
+class StreamingJSONValidator:
+    def __init__(self, schema):
+        self.schema = schema
+        self.is_list = _is_list_schema(schema)
+        self.root_char = '[' if self.is_list else '{'
+        if self.is_list:
+            self.item_adapter = _item_adapter(schema)
+        else:
+            self.fields = schema.model_fields
+            self.allow_extra = schema.model_config.get('extra') != 'forbid'
+
+        self.text = ''
+        self.pos = 0
+        self.root_start = None
+        self.done = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.expect_key = False
+        self.string_start = None
+        self.current_key = None
+        self.value_start = None
+
+    def feed(self, chunk):
+        self.text += chunk
+        while self.pos < len(self.text) and not self.done:
+            self._step(self.text[self.pos])
+            self.pos += 1
+
+    def _step(self, ch):
+        if self.root_start is None:
+            if ch in '{[':
+                if ch != self.root_char:
+                    raise OffSchemaError(f"expected JSON {'array' if self.is_list else 'object'} at root")
+                self.root_start = self.pos
+                self.depth = 1
+                self.expect_key = not self.is_list
+                self.value_start = self.pos + 1 if self.is_list else None
+            elif self.pos > MAX_PREAMBLE_CHARS:
+                raise OffSchemaError("no JSON found at start of response")
+            return
+
+        if self.in_string:
+            if self.escape:
+                self.escape = False
+            elif ch == '\\':
+                self.escape = True
+            elif ch == '"':
+                self.in_string = False
+                if self.depth == 1 and self.expect_key:
+                    self._check_key(json.loads(self.text[self.string_start:self.pos + 1]))
+            return
+
+        if ch == '"':
+            self.in_string = True
+            self.string_start = self.pos
+        elif ch in '{[':
+            self.depth += 1
+        elif ch in '}]':
+            if self.depth == 1:
+                self._finish_value(self.pos)
+                self.done = True
+            self.depth -= 1
+        elif self.depth == 1:
+            if ch == ':':
+                self.expect_key = False
+                self.value_start = self.pos + 1
+            elif ch == ',':
+                self._finish_value(self.pos)
+                self.expect_key = not self.is_list
+                self.value_start = self.pos + 1 if self.is_list else None
+
+    def _check_key(self, key):
+        if key not in self.fields and not self.allow_extra:
+            raise OffSchemaError(f"unexpected field '{key}'")
+        self.current_key = key
+
+    def _finish_value(self, end):
+        if self.value_start is None:
+            return
+        raw = self.text[self.value_start:end].strip()
+        self.value_start = None
+        if not raw:
+            return  # Empty container or trailing comma, handled by repair
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            return  # Leave malformed fragments to repair_json
+        try:
+            if self.is_list:
+                self.item_adapter.validate_python(value)
+            elif self.current_key in self.fields:
+                TypeAdapter(self.fields[self.current_key].annotation).validate_python(value)
+        except ValidationError as e:
+            where = 'item' if self.is_list else f"field '{self.current_key}'"
+            raise OffSchemaError(f"invalid {where}: {e.errors()[0]['msg']}")
+
+
+# ---------------------- Light Repair ----------------------
+# Fixes trailing commas and closes truncated objects/arrays
+def repair_json(text):
+    starts = [i for i in (text.find('{'), text.find('[')) if i != -1]
+    if not starts:
+        raise ValueError("No valid JSON found")
+    text = text[min(starts):]
+    text = re.sub(r'\s*```\s*$', '', text)
+
+    stack = []
+    in_string = escape = False
+    last_comma = None  # (position, stack snapshot) of the last top-level-safe cut
+    end = None
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+        elif ch in '}]':
+            if stack:
+                stack.pop()
+            if not stack:
+                end = i + 1
+                break
+        elif ch == ',':
+            last_comma = (i, list(stack))
+
+    if end is not None:
+        text = text[:end]
+    elif last_comma is not None:
+        # Truncated: drop the incomplete trailing element and close what is open
+        cut, open_stack = last_comma
+        text = text[:cut] + ''.join(reversed(open_stack))
+    else:
+        raise ValueError("Truncated JSON could not be repaired")
+
+    text = re.sub(r',\s*([}\]])', r'\1', text)
+    return json.loads(text)
+
+
+def extract_root_json(text):
+    # The JSON value at the root the streaming validator saw (the first '{' or
+    # '['). A later candidate could be an inner object of truncated JSON, which
+    # repair_json should close instead.
+    starts = [i for i in (text.find('{'), text.find('[')) if i != -1]
+    if not starts:
+        raise json.JSONDecodeError("No JSON found", text, 0)
+    return json.JSONDecoder().raw_decode(text, min(starts))[0]
+
+
+def parse_structured_response(text, schema):
+    # Return the parsed JSON as-is so stored numbers keep their original types.
+    # Only malformed JSON (e.g. truncated) is repaired; well-formed JSON that
+    # fails validation raises ValidationError so the caller re-asks.
+    try:
+        data = extract_root_json(text)
+    except json.JSONDecodeError:
+        data = repair_json(text)
+        schema.model_validate(data)
+        logging.info(f"Repaired malformed {schema.__name__} JSON without regeneration")
+        return data
+    schema.model_validate(data)
+    return data
+
+
+# ---------------------- Structured LLM Invocation ----------------------
+@retry(
+    retry=retry_if_exception_type(ResourceExhausted),
+    wait=wait_within_deadline(wait_exponential(multiplier=2, min=2, max=60)),
+    stop=stop_any(stop_after_attempt(5), stop_at_deadline)
+)
+def _stream_validated(prompt, schema):
+    def collect():
+        validator = StreamingJSONValidator(schema)
+        try:
+            for chunk in get_structured_llm().stream(prompt):
+                validator.feed(chunk.content)
+                if validator.done:
+                    break  # Stop paying for tokens after the root closes
+        except OffSchemaError as e:
+            e.text = validator.text  # What was received before the abort, for the audit log
+            raise
+        return validator.text
+    # A hedged duplicate, if sent, streams and validates independently
+    return resilient_call('structured', collect)
+
+
+def invoke_structured_with_retry(prompt, schema, max_reasks=MAX_REASKS, responses=None):
+    # responses, if given, gets the raw text of every attempt (for the audit log)
+    prompt = f"{prompt}\n\n{schema_instructions(schema)}"
+    attempt_prompt = prompt
+    for attempt in range(max_reasks + 1):
+        text = None
+        try:
+            text = _stream_validated(attempt_prompt, schema)
+            with timed('json_extraction'):
+                data = parse_structured_response(text, schema)
+            if responses is not None:
+                responses.append(text)
+            return data
+        except (OffSchemaError, ValidationError, ValueError) as e:
+            if responses is not None:
+                responses.append(text if text is not None else getattr(e, 'text', None))
+            logging.warning(f"Off-schema {schema.__name__} output (attempt {attempt + 1}): {e}")
+            if attempt == max_reasks:
+                raise
+            attempt_prompt = (
+                f"{prompt}\n\nYour previous answer was rejected: {e}. "
+                "Return ONLY JSON that matches the schema exactly."
+            )
@@ -0,0 +1,46 @@
+# tests/conftest.py
+# Tests run offline against the benchmarks' fakes (fake LLM, in-memory Firestore)
+import logging
+import os
+import sys
+from datetime import date
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), 'benchmarks'))
+
+import config
+import llm_setup
+import vector_store
+from fakes import FakeFirestore, FakeLLM, synthetic_food_store
+from load_test import USER_PROFILE
+
+USER_ID = 'test-user'
+WEEK_START = date(2025, 1, 6)  # A Monday
+DAY_CALLS = ('meal_day', 'workout_day')
+
+
+class Backend:
+    def __init__(self):
+        self.db = FakeFirestore()
+        self.llm = FakeLLM(seed=1)
+        config.set_db(self.db)
+        llm_setup.set_llms(llm=self.llm, summary_llm=self.llm, structured_llm=self.llm)
+        vector_store.set_food_store(synthetic_food_store())
+        self.db.collection('users').document(USER_ID).set(dict(USER_PROFILE, foodAllergies='None'))
+
+    def day_calls(self):
+        return sum(self.llm.calls_by_kind.get(kind, 0) for kind in DAY_CALLS)
+
+    def reset_calls(self):
+        self.llm.calls_by_kind.clear()
+        self.llm.calls = 0
+
+
+@pytest.fixture
+def backend():
+    logging.disable(logging.WARNING)
+    yield Backend()
+    logging.disable(logging.NOTSET)
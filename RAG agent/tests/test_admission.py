@@ -0,0 +1,116 @@
+# tests/test_admission.py
+import threading
+import time
+
+import pytest
+
+import admission
+import intent
+from admission import AdmissionController, Overloaded
+from fakes import StubIntentClassifier
+from metrics import registry
+
+COALESCED = ('admission_total', (('intent', 'generate meal plan'), ('outcome', 'coalesced')))
+
+
+@pytest.fixture
+def stub_intent():
+    intent.set_intent_classifier(StubIntentClassifier())
+    yield
+    intent.set_intent_classifier(None)
+
+
+def wait_until(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.005)
+
+
+def queue_in_background(controller, user_id, intent, started, is_weekly=False):
+    def run():
+        ticket = controller.admit(user_id, intent, is_weekly)
+        started.append(user_id)
+        controller.release(ticket, 0)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_fair_queue_serves_a_light_user_before_a_heavy_users_backlog():
+    controller = AdmissionController(slots=1, per_user=2, seconds_per_call=0.001,
+                                     deadlines={'generate meal plan': 60, 'general question': 60})
+    blocker = controller.admit('heavy', 'generate meal plan', True)
+    started = []
+    threads = [queue_in_background(controller, 'heavy', 'generate meal plan', started, True) for _ in range(2)]
+    wait_until(lambda: len(controller.waiting) == 2)
+    threads.append(queue_in_background(controller, 'light', 'general question', started))
+    wait_until(lambda: len(controller.waiting) == 3)
+    controller.release(blocker, 0)
+    for thread in threads:
+        thread.join(2)
+    assert started[0] == 'light' and started[1:] == ['heavy', 'heavy']
+
+
+def test_request_that_would_miss_its_deadline_is_rejected_with_retry_after():
+    controller = AdmissionController(slots=1, seconds_per_call=5.0, deadlines={'generate meal plan': 10})
+    ticket = controller.admit('a', 'generate meal plan', True)
+    with pytest.raises(Overloaded) as rejected:
+        controller.admit('b', 'generate meal plan', True)
+    assert rejected.value.retry_after >= 1 and not controller.waiting
+    controller.release(ticket)
+
+
+def test_query_answers_429_with_retry_after(backend, stub_intent, monkeypatch):
+    from app import create_app
+    controller = AdmissionController(slots=1, seconds_per_call=30.0)
+    monkeypatch.setattr(admission, '_controller', controller)
+    ticket = controller.admit('someone', 'generate meal plan', True)
+    client = create_app(warm=False).test_client()
+    response = client.post('/query', json={'query': 'How much protein?', 'user_id': 'test-user'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) == response.get_json()['retry_after'] >= 1
+    controller.release(ticket)
+
+
+def test_requests_without_llm_calls_teach_nothing():
+    controller = AdmissionController(seconds_per_call=4.0)
+    controller.release(controller.admit('a', 'generate meal plan', True), llm_calls=0)
+    assert controller.seconds_per_call == 4.0
+    controller.release(controller.admit('a', 'general question'), llm_calls=1)
+    assert controller.seconds_per_call < 4.0
+
+
+def test_coalesced_request_frees_its_slot_and_costs_nothing():
+    controller = AdmissionController(slots=1, per_user=2)
+    ticket = controller.admit('a', 'generate meal plan', True)
+    controller.coalesced(ticket)
+    assert ticket.cost == 0 and not controller.running and controller.last_finish['a'] == ticket.start_tag
+    other = controller.admit('b', 'general question')  # Runs at once in the freed slot
+    controller.release(ticket, 0)  # No-op: already given back
+    controller.release(other, 1)
+    assert not controller.running
+
+
+def test_duplicate_plan_request_gives_its_slot_back(backend, stub_intent, monkeypatch):
+    from app import create_app
+    from conftest import USER_ID
+    controller = AdmissionController(slots=2, per_user=2)
+    monkeypatch.setattr(admission, '_controller', controller)
+    backend.llm.latency = 0.05
+    client = create_app(warm=False).test_client()
+    body = {'query': 'Generate a meal plan', 'user_id': USER_ID, 'isWeekly': 'true', 'start_date': '2025-01-06'}
+    coalesced = registry.counters.get(COALESCED, 0)
+    responses = []
+    threads = [threading.Thread(target=lambda: responses.append(client.post('/query', json=body)))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.1)
+    # The duplicate waits for the first run without holding the second slot
+    wait_until(lambda: registry.counters.get(COALESCED, 0) == coalesced + 1)
+    assert len(controller.running) == 1
+    for thread in threads:
+        thread.join(10)
+    assert [response.status_code for response in responses] == [200, 200]
+    assert not controller.running and backend.day_calls() == 7
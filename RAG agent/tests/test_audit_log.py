@@ -0,0 +1,63 @@
+# tests/test_audit_log.py
+import gzip
+import json
+import os
+
+import pytest
+
+import audit_log
+from audit_log import AuditLog, finish_audit_request, parse_sample_rates, start_audit_request
+
+
+def read_records(directory):
+    records = []
+    for name in sorted(os.listdir(directory)):
+        with gzip.open(os.path.join(directory, name), 'rt') as f:
+            records += [json.loads(line) for line in f]
+    return records
+
+
+@pytest.fixture
+def sampled_log(tmp_path):
+    log = AuditLog(str(tmp_path), sample_rates={}, default_rate=1.0)
+    audit_log.set_audit_log(log)
+    yield log
+    audit_log.set_audit_log(None)
+
+
+def test_parse_sample_rates_clamps_and_skips_bad_items():
+    assert parse_sample_rates("general=0.5, meal_day=3,bad=x,food_items") == {'general': 0.5, 'meal_day': 1.0}
+
+
+def test_a_request_keeps_all_or_none_of_its_records(tmp_path, monkeypatch):
+    log = AuditLog(str(tmp_path), sample_rates={'meal_day': 0.5, 'general': 0.0})
+    for draw, expected in ((0.2, True), (0.8, False)):
+        monkeypatch.setattr(audit_log.random, 'random', lambda: draw)
+        token = start_audit_request()
+        monkeypatch.setattr(audit_log.random, 'random', lambda: 1 - draw)  # Later draws must not matter
+        assert [log.sampled('meal_day') for _ in range(7)] == [expected] * 7
+        assert not log.sampled('general')
+        finish_audit_request(token)
+
+
+def test_rotation_by_size_keeps_the_newest_files(tmp_path):
+    log = AuditLog(str(tmp_path), sample_rates={}, default_rate=1.0, max_bytes=200, keep_files=2)
+    for i in range(6):
+        log._write(1_700_000_000 + i, 'general', None, {'prompt': f"prompt {i}", 'raw': 'x' * 300})
+    log.file.close()
+    names = os.listdir(tmp_path)
+    assert len(names) == 2
+    # Each file carries its own copy of the prompt texts its records refer to
+    for record in read_records(tmp_path):
+        assert record.get('type') == 'text' or record['prompt_sha256']
+
+
+def test_sampled_plan_steps_record_the_raw_response(backend, sampled_log, tmp_path):
+    from conftest import USER_ID, WEEK_START
+    from qa_agent import generate_plans
+    generate_plans("Generate my meal plan", USER_ID, False, WEEK_START, True, True)
+    sampled_log.close()
+    steps = [record for record in read_records(tmp_path) if 'step' in record]
+    assert {record['step'] for record in steps} >= {'nutrient_targets', 'food_items', 'meal_day', 'workout_day'}
+    for record in steps:
+        assert record['raw'], record['step']
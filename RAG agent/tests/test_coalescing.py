@@ -0,0 +1,43 @@
+# tests/test_coalescing.py
+import fcntl
+import os
+import threading
+import time
+
+from coalescing import RESULT_TTL, SingleFlight
+
+
+def lock_files(path):
+    return [name for name in os.listdir(path) if name.endswith('.lock')]
+
+
+def test_workers_share_one_run_and_leave_no_lock_files(tmp_path):
+    # Two SingleFlight instances stand in for two workers sharing the lock directory
+    workers = [SingleFlight('plan', str(tmp_path)) for _ in range(2)]
+    calls, results = [], []
+
+    def generate():
+        calls.append(1)
+        time.sleep(0.3)
+        return 'plan'
+
+    threads = [threading.Thread(target=lambda w=w: results.append(w.do('key', generate))) for w in workers]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join()
+    assert results == ['plan', 'plan'] and len(calls) == 1
+    assert lock_files(tmp_path) == []
+
+
+def test_cleanup_removes_stale_lock_files_nobody_holds(tmp_path):
+    flight = SingleFlight('plan', str(tmp_path))
+    old = time.time() - RESULT_TTL - 60
+    for name in ('plan-stale.lock', 'plan-held.lock'):
+        (tmp_path / name).touch()
+        os.utime(tmp_path / name, (old, old))
+    with open(tmp_path / 'plan-held.lock', 'a') as held:
+        fcntl.flock(held, fcntl.LOCK_EX)
+        flight.do('other', lambda: 'plan')  # Writing a result runs the cleanup
+        assert lock_files(tmp_path) == ['plan-held.lock']
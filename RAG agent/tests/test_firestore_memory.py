@@ -0,0 +1,48 @@
+# tests/test_firestore_memory.py
+import time
+
+import firestore_memory
+from conftest import USER_ID
+from firestore_memory import RECENT_TURNS, SUMMARY_EVERY_TURNS, FirestoreMemory
+
+
+def add_turns(count, start=0):
+    # One FirestoreMemory per turn, like one per request
+    for i in range(start, start + count):
+        FirestoreMemory(USER_ID).append_to_history(f"question {i}", f"answer {i}")
+
+
+def wait_for_summaries():
+    for _ in range(200):
+        if not firestore_memory._summarizing:
+            return
+        time.sleep(0.01)
+
+
+def test_older_turns_fold_into_the_summary_in_batches(backend):
+    add_turns(RECENT_TURNS + SUMMARY_EVERY_TURNS - 1)
+    wait_for_summaries()
+    memory = FirestoreMemory(USER_ID)
+    assert memory.get_summary() == '' and not any(entry['summarized'] for entry in memory.history)
+    # Below the batch size, older turns are still in prompts verbatim
+    assert 'question 0' in memory.get_recent_history()
+
+    add_turns(1, start=RECENT_TURNS + SUMMARY_EVERY_TURNS - 1)
+    wait_for_summaries()
+    memory = FirestoreMemory(USER_ID)
+    assert memory.get_summary()
+    assert [entry['summarized'] for entry in memory.history].count(True) == SUMMARY_EVERY_TURNS
+    recent = memory.get_recent_history()
+    assert 'question 0' not in recent and f"question {SUMMARY_EVERY_TURNS}" in recent
+
+
+def test_summary_failure_leaves_turns_unsummarized(backend, monkeypatch):
+    def fail(previous_summary, entries):
+        raise RuntimeError('summary LLM down')
+
+    monkeypatch.setattr(firestore_memory, 'summarize_turns', fail)
+    add_turns(RECENT_TURNS + SUMMARY_EVERY_TURNS)
+    wait_for_summaries()
+    memory = FirestoreMemory(USER_ID)
+    assert memory.get_summary() == '' and not any(entry['summarized'] for entry in memory.history)
+    assert 'question 0' in memory.get_recent_history()
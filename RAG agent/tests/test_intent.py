@@ -0,0 +1,59 @@
+# tests/test_intent.py
+import pytest
+
+import intent
+from fakes import StubIntentClassifier
+from intent_service import IntentClient, MicroBatcher
+
+
+@pytest.fixture
+def down_sidecar(tmp_path, monkeypatch):
+    # A client whose socket nobody listens on
+    monkeypatch.setattr(intent, '_client', IntentClient(str(tmp_path / 'missing.sock'), timeout=1))
+    intent.set_intent_classifier(StubIntentClassifier())
+    yield
+    intent.set_intent_classifier(None)
+
+
+def test_down_sidecar_falls_back_to_in_process_classification(down_sidecar, monkeypatch):
+    monkeypatch.setattr(intent, 'INPROCESS_FALLBACK', True)
+    assert intent.classify_intent("Update my meals plan") == "generate meal plan"
+
+
+def test_down_sidecar_without_fallback_fails_visibly(down_sidecar, monkeypatch):
+    monkeypatch.setattr(intent, 'INPROCESS_FALLBACK', False)
+    with pytest.raises(intent.IntentUnavailable):
+        intent.classify_intent("Update my meals plan")
+
+
+def test_query_answers_503_when_the_intent_is_unavailable(down_sidecar, monkeypatch):
+    from app import create_app
+    monkeypatch.setattr(intent, 'INPROCESS_FALLBACK', False)
+    client = create_app(warm=False).test_client()
+    response = client.post('/query', json={'query': "Update my meals plan", 'user_id': 'test-user'})
+    assert response.status_code == 503 and response.headers['Retry-After']
+
+
+def test_micro_batcher_groups_concurrent_queries_and_keeps_their_order():
+    classifier = StubIntentClassifier(latency=0.05)
+    batcher = MicroBatcher(classifier, max_batch_size=8, max_wait_ms=20)
+    queries = [f"{'meal' if i % 2 else 'workout'} question {i}" for i in range(20)]
+    futures = [batcher.submit(query) for query in queries]
+    labels = [future.result(timeout=5)['labels'][0] for future in futures]
+    assert labels == ["generate meal plan" if i % 2 else "generate workout plan" for i in range(20)]
+    assert batcher.items == 20 and batcher.batches <= 4 and classifier.calls == batcher.batches
+
+
+def test_micro_batcher_fails_the_whole_batch_and_keeps_serving():
+    def broken(queries, candidate_labels, **kwargs):
+        return []  # One result short per query
+
+    batcher = MicroBatcher(broken, max_wait_ms=20)
+    futures = [batcher.submit(f"question {i}") for i in range(3)]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
+    batcher.classifier = StubIntentClassifier()
+    cancelled = batcher.submit("meal question")
+    cancelled.cancel()  # A caller that gave up must not stop the batcher thread
+    assert batcher.submit("meal question").result(timeout=5)['labels'][0] == "generate meal plan"
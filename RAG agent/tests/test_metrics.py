@@ -0,0 +1,65 @@
+# tests/test_metrics.py
+import json
+import os
+
+import metrics
+from metrics import MetricsRegistry, finish_request_trace, server_timing_header, start_request_trace, timed
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    for value in (0.004, 0.3, 200):
+        registry.histogram('latency_seconds', (('stage', 'llm'),), 'Latency').observe(value)
+    text = registry.render()
+    assert 'latency_seconds_bucket{stage="llm",le="0.005"} 1' in text
+    assert 'latency_seconds_bucket{stage="llm",le="0.5"} 2' in text
+    assert 'latency_seconds_bucket{stage="llm",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{stage="llm"} 3' in text
+
+
+def test_timed_stages_are_traced_and_summed_in_server_timing():
+    token = start_request_trace()
+    for _ in range(2):
+        with timed('llm_meal_day'):
+            pass
+    with timed('firestore_write'):
+        pass
+    trace = finish_request_trace(token)
+    header = server_timing_header(trace, 0.5)
+    assert [stage for stage, _ in trace] == ['llm_meal_day', 'llm_meal_day', 'firestore_write']
+    assert 'llm_meal_day;dur=' in header and 'desc="x2"' in header and header.endswith('total;dur=500.0')
+
+
+def test_workers_snapshots_are_merged(tmp_path, monkeypatch):
+    # Another worker's snapshot, then this process's own
+    other = MetricsRegistry()
+    other.increment('llm_calls_total', (('kind', 'general'),), 2, 'LLM calls')
+    other.histogram('latency_seconds').observe(0.3)
+    (tmp_path / 'metrics-1.json').write_text(json.dumps(other.snapshot()))
+    monkeypatch.setattr(metrics, 'registry', MetricsRegistry())
+    monkeypatch.setattr(metrics, 'MULTIPROC_DIRECTORY', str(tmp_path))
+    monkeypatch.setattr(metrics, '_snapshot_pid', os.getpid())  # No background writer in tests
+    metrics.registry.increment('llm_calls_total', (('kind', 'general'),), 1, 'LLM calls')
+    metrics.registry.histogram('latency_seconds').observe(0.3)
+
+    text = metrics.render_prometheus()
+    assert 'llm_calls_total{kind="general"} 3' in text
+    assert 'latency_seconds_count 2' in text
+
+
+def test_voice_done_line_carries_the_streamed_stages(backend):
+    import voice
+    from conftest import USER_ID
+    from qa_agent import stream_rag_agent
+    from tts_pipeline import AudioCache
+    voice.set_synthesizer(voice.StubSynthesizer())
+    voice.set_audio_cache(AudioCache())
+    try:
+        pieces = stream_rag_agent("How much protein do I need?", USER_ID, False, intent='general question')
+        lines = [json.loads(line) for line in voice.voice_events("How much protein do I need?", pieces)]
+    finally:
+        voice.set_synthesizer(None)
+        voice.set_audio_cache(None)
+    done = lines[-1]
+    assert done['type'] == 'done'
+    assert 'llm_general;dur=' in done['server_timing'] and 'tts;dur=' in done['server_timing']
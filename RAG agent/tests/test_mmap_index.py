@@ -0,0 +1,44 @@
+# tests/test_mmap_index.py
+import numpy as np
+
+from mmap_index import MmapIndex, _matches, build_index, default_nprobe
+from vector_store import food_filter
+
+
+def test_matches_skips_missing_and_mixed_types():
+    where = food_filter(('contains_tree_nut',), max_calories=200, min_protein_g=10)
+    assert _matches({'contains_tree_nut': False, 'calories': 150.0, 'protein_g': 12}, where)
+    assert not _matches({'contains_tree_nut': False, 'calories': '150', 'protein_g': 12}, where)
+    assert not _matches({'contains_tree_nut': False, 'protein_g': 12}, where)
+    assert not _matches({'contains_tree_nut': False, 'calories': True, 'protein_g': 12}, where)
+    assert not _matches({'contains_tree_nut': True, 'calories': 150.0, 'protein_g': 12}, where)
+
+
+def test_default_nprobe_scales_with_nlist():
+    assert default_nprobe(4) == 4
+    assert default_nprobe(100) > default_nprobe(40) >= 16
+
+
+def test_filtered_search_widens_probes_until_k_match(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(400, 16)).astype(np.float32)
+    # Only a few records far from the query pass the filter
+    rare = set(rng.choice(400, 6, replace=False).tolist())
+    metadatas = [{'name': f'food {i}', 'category': 'Rare' if i in rare else 'Common'} for i in range(400)]
+    build_index(str(tmp_path), [f'food {i}' for i in range(400)], metadatas, vectors, nlist=20)
+    index = MmapIndex(str(tmp_path))
+
+    results = index.search(vectors[0], k=5, nprobe=1, where={'category': 'Rare'})
+    assert len(results) == 5
+    assert all(index.record(row)['metadata']['category'] == 'Rare' for _, row in results)
+    assert [score for score, _ in results] == sorted((score for score, _ in results), reverse=True)
+    assert len(index.search(vectors[0], k=10, nprobe=1, where={'category': 'Rare'})) == 6
+
+
+def test_search_leaves_the_query_vector_unchanged(tmp_path):
+    vectors = np.random.default_rng(1).normal(size=(50, 8)).astype(np.float32)
+    build_index(str(tmp_path), [f'food {i}' for i in range(50)], [{'name': f'food {i}'} for i in range(50)], vectors, nlist=4)
+    query = vectors[3] * 5
+    before = query.copy()
+    MmapIndex(str(tmp_path)).search(query, k=3)
+    assert np.array_equal(query, before)
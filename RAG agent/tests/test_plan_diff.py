@@ -0,0 +1,126 @@
+# tests/test_plan_diff.py
+from datetime import date, timedelta
+
+import pytest
+
+from conftest import USER_ID, WEEK_START
+from plan_diff import allergen_terms, conflicts_with_allergens, is_edit_request, requested_changes
+from qa_agent import generate_plans
+
+
+@pytest.fixture
+def week(backend):
+    # A generated week of meals and workouts; Wednesday and Saturday dinners use salmon
+    generate_plans("Generate my weekly meal plan", USER_ID, True, WEEK_START, True, False)
+    generate_plans("Generate my weekly workout plan", USER_ID, True, WEEK_START, False, True)
+    for path, doc in backend.db.docs.items():
+        if '/meal_plans/' in path:
+            fish = doc['target_date'].weekday() in (2, 5)
+            doc['content']['dinner']['food_items'][0] = 'Salmon, Atlantic, baked' if fish else 'Chicken thigh, roasted'
+            doc['metadata']['ingredients'] = [
+                item for meal in ('breakfast', 'lunch', 'dinner') for item in doc['content'][meal]['food_items']
+            ]
+    backend.reset_calls()
+    return backend
+
+
+def run(backend, query, is_meal, profile_update=None, is_weekly=True):
+    if profile_update:
+        backend.db.collection('users').document(USER_ID).update(profile_update)
+    backend.reset_calls()
+    generate_plans(query, USER_ID, is_weekly, WEEK_START, is_meal, not is_meal)
+    return backend.day_calls()
+
+
+# ---------------------- Request Parsing ----------------------
+@pytest.mark.parametrize('query', [
+    "Swap Tuesday's dinner for something lighter",
+    "Change Monday and Friday's workout",
+    "Replace today's breakfast",
+    "Update my weekly meal plan",
+])
+def test_edit_requests(query):
+    assert is_edit_request(query)
+
+
+@pytest.mark.parametrize('query', [
+    "Make me a weekly plan starting Monday",
+    "Generate a meal plan with a light dinner",
+    "Create a workout plan for tomorrow",
+])
+def test_new_plan_requests(query):
+    assert not is_edit_request(query)
+
+
+def test_named_days_and_meals():
+    days, meals = requested_changes("Swap Tuesday's and Friday's dinner", WEEK_START)
+    assert days == {WEEK_START + timedelta(days=1), WEEK_START + timedelta(days=4)}
+    assert meals == {'dinner'}
+
+
+def test_start_day_is_not_an_edited_day():
+    days, _ = requested_changes("Update my plan starting Monday", WEEK_START)
+    assert days == set()
+    days, _ = requested_changes("Change Wednesday's lunch, starting from tomorrow", WEEK_START)
+    assert days == {WEEK_START + timedelta(days=2)}
+
+
+def test_today_and_tomorrow():
+    days, _ = requested_changes("Change today's and tomorrow's lunch", WEEK_START)
+    assert days == {date.today(), date.today() + timedelta(days=1)}
+
+
+# ---------------------- LLM Calls per Request ----------------------
+def test_repeated_request_regenerates_every_day(week):
+    assert run(week, "Generate my weekly meal plan", True) == 7
+    assert run(week, "Update my meals plan", True) == 7  # What the app's button sends
+
+
+def test_repeated_request_after_profile_change_regenerates(week):
+    assert run(week, "Generate my weekly meal plan", True, {'weight': 95}) == 7
+
+
+def test_different_request_regenerates_every_day(week):
+    assert run(week, "Generate a high protein weekly meal plan", True) == 7
+
+
+def test_weekday_in_new_plan_request_is_not_narrowed(week):
+    assert run(week, "Make me a vegetarian weekly meal plan starting Monday", True) == 7
+
+
+def test_meal_in_new_plan_request_is_not_narrowed(week):
+    assert run(week, "Generate a meal plan with a light dinner", True) == 7
+
+
+def test_swap_one_dinner(week):
+    assert run(week, "Swap Tuesday's dinner for something lighter", True) == 1
+
+
+def test_named_workout_days(week):
+    assert run(week, "Change Monday and Friday's workout to easier ones", False) == 2
+
+
+def test_allergy_without_conflicts(week):
+    assert run(week, "Update my weekly meal plan", True, {'foodAllergies': 'Peanuts'}) == 0
+
+
+def test_allergy_regenerates_conflicting_days(week):
+    assert run(week, "Update my weekly meal plan", True, {'foodAllergies': 'Fish'}) == 2  # Wednesday and Saturday
+
+
+def test_workout_level_change_regenerates_week(week):
+    assert run(week, "Update my weekly workout plan", False, {'workoutLevelString': 'Very mild'}) == 7
+
+
+def test_daily_update_after_profile_change_regenerates_only_that_day(week):
+    assert run(week, "Update my meals plan", True, {'weight': 95}, is_weekly=False) == 1
+    # The rest of the week still has the old fingerprint, so a weekly update catches up
+    assert run(week, "Update my meals plan", True) == 6
+
+
+def test_allergen_terms_come_from_the_food_flags():
+    terms = allergen_terms({'foodAllergies': 'Lactose, Eggs'})
+    assert {'milk', 'cheese', 'egg'} <= set(terms)
+    plan = {'metadata': {'ingredients': ['Eggplant, roasted', 'Rice']}}
+    assert not conflicts_with_allergens(plan, terms)
+    assert conflicts_with_allergens({'metadata': {'ingredients': ['Cheddar cheese']}}, terms)
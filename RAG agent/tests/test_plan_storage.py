@@ -0,0 +1,40 @@
+# tests/test_plan_storage.py
+import json
+
+from conftest import USER_ID, WEEK_START
+from plan_storage import build_plan_document, compute_plan_metadata, get_plans
+
+MEAL_PLAN = {
+    'breakfast': {'food_items': ['oats', 'milk'], 'calories': 400, 'protein_g': 20, 'carbs_g': 60, 'fats_g': 8},
+    'lunch': {'food_items': ['chicken', 'rice'], 'calories': '650.5', 'protein_g': 45, 'carbs_g': 70, 'fats_g': 15},
+    'dinner': {'food_items': ['tofu', 'rice'], 'calories': 550, 'protein_g': 30, 'carbs_g': 'n/a', 'fats_g': 20},
+    'total_daily': {'calories': 9999, 'protein_g': 1, 'carbs_g': 1, 'fats_g': 1},
+}
+WORKOUT_PLAN = [{'exercise': 'Squat', 'duration': 20}, {'exercise': 'Run', 'duration': '15'}, 'rest']
+
+
+def test_meal_metadata_is_recomputed_from_the_meals():
+    metadata = compute_plan_metadata('Meal', MEAL_PLAN)
+    assert metadata['calories'] == 1600.5 and metadata['protein_g'] == 95 and metadata['carbs_g'] == 130
+    assert metadata['ingredients'] == ['oats', 'milk', 'chicken', 'rice', 'tofu']
+
+
+def test_workout_metadata_counts_exercises_and_minutes():
+    metadata = compute_plan_metadata('workout', WORKOUT_PLAN)
+    assert metadata['exercises'] == ['Squat', 'Run']
+    assert metadata['exercise_count'] == 2 and metadata['total_minutes'] == 35
+
+
+def test_views_project_fields_and_legacy_documents_decode(backend):
+    plans = backend.db.collection('users').document(USER_ID).collection('meal_plans')
+    plans.document('new').set(build_plan_document('meal', MEAL_PLAN, str(WEEK_START), 'now'))
+    plans.document('legacy').set({'type': 'meal', 'content': json.dumps(MEAL_PLAN, indent=4),
+                                  'target_date': '2025-01-07'})
+
+    full = get_plans(USER_ID, 'meal', '2025-01-06', '2025-01-12', view='full')
+    assert [plan['id'] for plan in full] == ['new', 'legacy']
+    assert full[1]['content'] == MEAL_PLAN
+
+    summary = get_plans(USER_ID, 'meal', '2025-01-06', '2025-01-06', view='summary')
+    assert summary == [{'id': 'new', 'type': 'meal', 'target_date': '2025-01-06',
+                        'metadata': {'calories': 1600.5, 'protein_g': 95, 'carbs_g': 130, 'fats_g': 43}}]
@@ -0,0 +1,40 @@
+# tests/test_pregenerate.py
+import pytest
+
+from conftest import USER_ID, WEEK_START
+from plan_generation import PLAN_EXISTING, PLAN_GENERATED
+from qa_agent import generate_plan_results
+
+
+def statuses(query, is_meal=True, is_weekly=True, **kwargs):
+    return [result.status for result in generate_plan_results(
+        query, USER_ID, is_weekly, WEEK_START, is_meal, not is_meal, record_history=False, **kwargs
+    )]
+
+
+@pytest.fixture
+def pregenerated(backend):
+    assert statuses("Generate my weekly meal plan for next week", pregenerate=True) == [PLAN_GENERATED]
+    backend.reset_calls()
+    return backend
+
+
+def test_first_app_request_uses_pregenerated_week_then_regenerates(pregenerated):
+    assert statuses("Update my meals plan") == [PLAN_EXISTING]
+    assert pregenerated.llm.calls == 0
+    assert statuses("Update my meals plan") == [PLAN_GENERATED]
+    assert pregenerated.day_calls() == 7
+
+
+def test_daily_request_uses_pregenerated_day(pregenerated):
+    assert statuses("Update my meals plan", is_weekly=False) == [PLAN_EXISTING]
+
+
+def test_profile_change_regenerates(pregenerated):
+    pregenerated.db.collection('users').document(USER_ID).update({'weight': 95})
+    assert statuses("Update my meals plan") != [PLAN_EXISTING]
+    assert pregenerated.day_calls() == 7
+
+
+def test_other_plan_type_is_not_pregenerated(pregenerated):
+    assert statuses("Update my workout plan", is_meal=False) == [PLAN_GENERATED]
@@ -0,0 +1,52 @@
+# tests/test_progress.py
+from datetime import datetime, timedelta
+
+from conftest import USER_ID, WEEK_START
+from progress import bucket_id, compact_user, get_progress, record_day
+
+
+def rollup(backend, granularity, day):
+    return backend.db.collection('users').document(USER_ID).collection('progress_rollups') \
+        .document(bucket_id(granularity, day)).get().to_dict()
+
+
+def test_record_day_merges_into_existing_buckets(backend):
+    record_day(USER_ID, WEEK_START, calories_consumed=1800)
+    record_day(USER_ID, WEEK_START + timedelta(days=1), calories_consumed=2200)
+    # A workout save on a day that already has calories keeps them
+    record_day(USER_ID, WEEK_START, completed_exercises={'Squat': True, 'Run': False})
+
+    for granularity in ('week', 'month'):
+        days = rollup(backend, granularity, WEEK_START)['days']
+        assert days == {
+            WEEK_START.isoformat(): {'calories': 1800.0, 'completed': 1, 'total': 2},
+            (WEEK_START + timedelta(days=1)).isoformat(): {'calories': 2200.0},
+        }
+
+
+def test_progress_points_per_granularity(backend):
+    record_day(USER_ID, WEEK_START, calories_consumed=1800, completed_exercises={'Squat': True, 'Run': False})
+    record_day(USER_ID, WEEK_START + timedelta(days=2), calories_consumed=2200, completed_exercises={'Run': True})
+    end = WEEK_START + timedelta(days=6)
+
+    daily = get_progress(USER_ID, WEEK_START, end, 'day')
+    assert [point['calories_consumed'] for point in daily] == [1800.0, 0.0, 2200.0, 0.0, 0.0, 0.0, 0.0]
+    assert daily[0]['exercise_completion_pct'] == 50.0
+
+    week, = get_progress(USER_ID, WEEK_START, end, 'week')
+    assert week['days_logged'] == 2 and week['avg_daily_calories'] == 2000.0
+    assert week['exercise_completion_pct'] == 75.0
+    # Days outside the requested range don't count towards the month bucket
+    month, = get_progress(USER_ID, WEEK_START + timedelta(days=1), end, 'month')
+    assert month['calories_consumed'] == 2200.0 and month['start'] == '2025-01-01'
+
+
+def test_compaction_folds_events_that_skipped_record_day(backend):
+    user = backend.db.collection('users').document(USER_ID)
+    day = WEEK_START.isoformat()
+    user.collection('calories_consumed').document(day).set(
+        {'date': datetime(2025, 1, 6, 12), 'calories_consumed': 1500})
+    user.collection('exercise_completions').document(day).set(
+        {'date': datetime(2025, 1, 6, 18), 'completed_exercises': {'Squat': True}})
+    assert compact_user(USER_ID, WEEK_START) == 1
+    assert rollup(backend, 'week', WEEK_START)['days'][day] == {'calories': 1500.0, 'completed': 1, 'total': 1}
@@ -0,0 +1,91 @@
+# tests/test_resilience.py
+import threading
+import time
+
+import pytest
+
+import resilience
+from resilience import (BREAKER_FAILURES, CircuitOpenError, DeadlineExceeded, deadline, get_breaker,
+                        resilient_call, resilient_stream)
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers():
+    resilience.reset_breakers()
+    yield
+    resilience.reset_breakers()
+
+
+def fail():
+    raise RuntimeError('upstream 503')
+
+
+def test_breaker_opens_per_kind_and_a_probe_closes_it():
+    for _ in range(BREAKER_FAILURES):
+        with pytest.raises(RuntimeError):
+            resilient_call('general', fail)
+    with pytest.raises(CircuitOpenError):
+        resilient_call('general', lambda: 'never called')
+    # Another kind keeps its own closed circuit
+    assert resilient_call('structured', lambda: 'ok') == 'ok'
+
+    get_breaker('general').opened_at -= resilience.BREAKER_RESET_SECONDS
+    assert resilient_call('general', lambda: 'probe ok') == 'probe ok'
+    assert get_breaker('general').state == 'closed'
+
+
+def test_off_schema_answers_do_not_count_as_upstream_failures():
+    def off_schema():
+        raise ValueError('not JSON')
+
+    for _ in range(BREAKER_FAILURES + 1):
+        with pytest.raises(ValueError):
+            resilient_call('structured', off_schema)
+    assert get_breaker('structured').state == 'closed'
+
+
+def test_calls_and_streams_stop_at_the_request_deadline():
+    release = threading.Event()
+    start = time.monotonic()
+    with deadline(0.1):
+        with deadline(30):  # A nested deadline can't extend the outer one
+            with pytest.raises(DeadlineExceeded):
+                resilient_call('general', lambda: release.wait(5), hedge=False)
+    assert time.monotonic() - start < 1
+
+    class SlowLLM:
+        def stream(self, prompt):
+            yield 'first'
+            release.wait(5)
+            yield 'second'
+
+    chunks = []
+    with deadline(0.1):
+        with pytest.raises(DeadlineExceeded):
+            for chunk in resilient_stream(SlowLLM(), 'prompt'):
+                chunks.append(chunk)
+    assert chunks == ['first']
+    with deadline(0):
+        with pytest.raises(DeadlineExceeded):
+            resilient_call('general', lambda: 'too late')
+    release.set()
+
+
+def test_slow_call_is_hedged_after_the_observed_p95(monkeypatch):
+    monkeypatch.setattr(resilience, 'HEDGE_MIN_DELAY', 0.01)
+    for _ in range(resilience.HEDGE_MIN_SAMPLES + 10):
+        resilient_call('hedge-test', lambda: time.sleep(0.001))
+    attempts = []
+    release = threading.Event()
+
+    def first_attempt_hangs():
+        attempts.append(1)
+        if len(attempts) == 1:
+            release.wait(5)
+            return 'slow'
+        return 'hedge'
+
+    start = time.monotonic()
+    assert resilient_call('hedge-test', first_attempt_hangs) == 'hedge'
+    assert len(attempts) == 2 and time.monotonic() - start < 1
+    release.set()
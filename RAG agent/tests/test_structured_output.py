@@ -0,0 +1,52 @@
+# tests/test_structured_output.py
+import json
+
+import pytest
+from pydantic import ValidationError
+
+import structured_output
+from schemas import WorkoutList
+from structured_output import (
+    OffSchemaError, StreamingJSONValidator, invoke_structured_with_retry, parse_structured_response, repair_json
+)
+
+RUN = {'exercise': 'Run', 'duration': 30, 'intensity': 'moderate'}
+ROW = {'exercise': 'Row', 'duration': 20, 'intensity': 'high'}
+
+
+def test_validator_rejects_an_off_schema_item_before_the_stream_ends():
+    validator = StreamingJSONValidator(WorkoutList)
+    validator.feed('[' + json.dumps(RUN) + ',')
+    with pytest.raises(OffSchemaError):
+        validator.feed('{"exercise": "Row", "duration": "twenty", "intensity": "high"},')
+    assert not validator.done
+
+
+def test_validator_stops_when_the_root_closes():
+    validator = StreamingJSONValidator(WorkoutList)
+    validator.feed('Here you go: ' + json.dumps([RUN]) + '\nEnjoy!')
+    assert validator.done and json.loads(validator.text[validator.root_start:validator.pos]) == [RUN]
+
+
+def test_truncated_json_is_repaired():
+    text = '```json\n[' + json.dumps(RUN) + ', ' + json.dumps(ROW) + ', {"exercise": "Sw'
+    assert repair_json(text) == [RUN, ROW]
+    assert parse_structured_response(text, WorkoutList) == [RUN, ROW]
+
+
+def test_well_formed_off_schema_json_is_not_repaired(monkeypatch):
+    monkeypatch.setattr(structured_output, 'repair_json', lambda text: pytest.fail("repair_json called"))
+    with pytest.raises(ValidationError):
+        parse_structured_response(json.dumps([dict(RUN, duration='long')]), WorkoutList)
+
+
+def test_off_schema_answer_is_asked_again(monkeypatch):
+    answers, prompts = [json.dumps([dict(RUN, pace='fast')]), json.dumps([RUN])], []
+
+    def stream(prompt, schema):
+        prompts.append(prompt)
+        return answers[len(prompts) - 1]
+
+    monkeypatch.setattr(structured_output, '_stream_validated', stream)
+    assert invoke_structured_with_retry("Plan a workout", WorkoutList) == [RUN]
+    assert len(prompts) == 2 and 'rejected' in prompts[1]
@@ -0,0 +1,108 @@
+# tests/test_tts_pipeline.py
+import threading
+import time
+from types import SimpleNamespace
+
+from tts_pipeline import AudioCache, MixerPlayer, sentence_stream, speak, split_sentences, synthesize_stream
+
+END = 1
+
+
+class StubMusic:
+    def __init__(self, events):
+        self.events = events
+        self.loaded = []
+        self.stopped = False
+
+    def set_endevent(self, event_type):
+        self.end_event = event_type
+
+    def load(self, source):
+        self.loaded.append(source.read())
+
+    def play(self):
+        pass
+
+    def stop(self):
+        self.stopped = True
+        self.events.post(self.end_event)
+
+
+class StubEvents:
+    # Clips end when the test posts END; waits time out like pygame.event.wait
+    def __init__(self):
+        self.queue = []
+        self.waits = 0
+        self.posted = threading.Condition()
+
+    def post(self, event_type):
+        with self.posted:
+            self.queue.append(event_type)
+            self.posted.notify()
+
+    def clear(self, event_type):
+        with self.posted:
+            self.queue = [queued for queued in self.queue if queued != event_type]
+
+    def wait(self, timeout_ms):
+        with self.posted:
+            self.waits += 1
+            self.posted.wait_for(lambda: self.queue, timeout_ms / 1000)
+            return SimpleNamespace(type=self.queue.pop(0) if self.queue else 0)
+
+
+def stub_player():
+    events = StubEvents()
+    return MixerPlayer(StubMusic(events), events, END), events
+
+
+def test_split_sentences_drops_markdown_and_keeps_words_whole():
+    chunks = split_sentences("**Protein:** eat 1.6 g/kg.\n- Chicken breast\n- Lentils 🥗", max_chars=20)
+    assert chunks == ['Protein: eat 1.6', 'g/kg. Chicken breast', 'Lentils']
+
+
+def test_sentence_stream_yields_each_sentence_as_it_completes():
+    chunks = list(sentence_stream(iter(["First one. Sec", "ond one. Third"])))
+    assert ' '.join(chunks) == 'First one. Second one. Third'
+
+
+def test_synthesize_stream_uses_the_cache_and_keeps_order():
+    calls = []
+
+    def synthesize(text, lang='en'):
+        calls.append(text)
+        return text.encode()
+
+    cache = AudioCache()
+    for _ in range(2):
+        assert [chunk for chunk, _ in synthesize_stream(iter(['a', 'b', 'c']), synthesize, cache)] == ['a', 'b', 'c']
+    assert calls == ['a', 'b', 'c']
+
+
+def test_player_returns_on_the_end_event_without_polling():
+    player, events = stub_player()
+    threading.Timer(0.05, events.post, args=(END,)).start()
+    player.play(b'audio')
+    assert player.music.loaded == [b'audio'] and events.waits == 1
+
+
+def test_stop_event_stops_the_clip_and_its_end_event_is_not_reused():
+    player, events = stub_player()
+    stop = threading.Event()
+    threading.Timer(0.05, stop.set).start()
+    start = time.perf_counter()
+    player.play(b'long clip', stop)
+    assert player.music.stopped and time.perf_counter() - start < 1
+    # stop() posted an end event; the next clip must still wait for its own
+    threading.Timer(0.05, events.post, args=(END,)).start()
+    start = time.perf_counter()
+    player.play(b'next clip')
+    assert time.perf_counter() - start >= 0.04 and not events.queue
+
+
+def test_speak_plays_every_chunk_in_order():
+    player, events = stub_player()
+    played = []
+    player.play = lambda audio, stop_event=None: played.append(audio)
+    speak("One. Two. Three.", lambda text, lang='en': text.encode(), player, AudioCache())
+    assert b' '.join(played) == b'One. Two. Three.'
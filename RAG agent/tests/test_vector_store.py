@@ -0,0 +1,36 @@
+# tests/test_vector_store.py
+from fakes import HashingEmbeddings
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+import vector_store
+
+
+def test_old_vector_store_is_rebuilt(tmp_path, monkeypatch):
+    path, embeddings = str(tmp_path / 'db'), HashingEmbeddings()
+    Chroma(persist_directory=path, embedding_function=embeddings).add_texts(['Apple, raw'])  # No schema version
+    documents = [Document(page_content='Almonds', metadata={'name': 'Almonds', 'contains_tree_nut': True})]
+    monkeypatch.setattr(vector_store, 'load_all_documents', lambda batch_size: documents)
+
+    _, vectordb = vector_store.get_vector_store(path, embeddings)
+    assert vector_store.stored_schema_version(vectordb) == vector_store.INDEX_SCHEMA_VERSION
+    assert vectordb.get()['documents'] == ['Almonds']
+
+    monkeypatch.setattr(vector_store, 'load_all_documents', lambda batch_size: [])
+    _, vectordb = vector_store.get_vector_store(path, embeddings)  # Current version: loaded, not rebuilt
+    assert vectordb.get()['documents'] == ['Almonds']
+
+
+def test_meal_plan_foods_come_from_the_filtered_store(backend):
+    from conftest import USER_ID, WEEK_START
+    from qa_agent import generate_plans, retrieve_food_items
+    targets = {'calories': 1800, 'protein_g': {'target': 150}}
+    profile = {'foodAllergies': 'Peanuts, shellfish', 'preferenceFood': 'Asian'}
+    foods = retrieve_food_items(profile, targets).split('\n\n')
+    assert foods
+    for food in foods:
+        assert 'peanut' not in food.lower() and 'shrimp' not in food.lower()
+        assert float(food.split('Calories: ')[1].split(' kcal')[0]) <= 600
+
+    generate_plans("Generate my meal plan", USER_ID, False, WEEK_START, True, False)
+    assert 'food_items' not in backend.llm.calls_by_kind
@@ -0,0 +1,89 @@
+# tests/test_voice.py
+import base64
+import json
+import time
+
+import pytest
+
+import intent
+import voice
+from conftest import USER_ID
+from fakes import StubIntentClassifier
+from qa_agent import stream_rag_agent
+from tts_pipeline import AudioCache
+
+
+@pytest.fixture
+def stub_voice():
+    voice.set_synthesizer(voice.StubSynthesizer())
+    voice.set_audio_cache(AudioCache())
+    yield
+    voice.set_synthesizer(None)
+    voice.set_audio_cache(None)
+
+
+def parse_lines(body):
+    # Every event is one JSON object terminated by a newline
+    assert body.endswith('\n')
+    return [json.loads(line) for line in body.split('\n')[:-1]]
+
+
+def test_events_are_newline_delimited_json_in_order(stub_voice):
+    answer = ["Eat more protein. Dri", "nk water.\nSleep ", "well."]
+    events = parse_lines(''.join(voice.voice_events('question', iter(answer))))
+    assert [event['type'] for event in (events[0], events[-1])] == ['transcript', 'done']
+    assert events[0]['text'] == 'question'
+    # Sentences finished by the time a chunk is cut share its audio line
+    audio = events[1:-1]
+    assert {event['type'] for event in audio} == {'audio'}
+    assert ' '.join(event['text'] for event in audio) == 'Eat more protein. Drink water. Sleep well.'
+    assert all(base64.b64decode(event['audio']) == event['text'].encode() for event in audio)
+    assert events[-1]['response'] == ''.join(answer) and 'total;dur=' in events[-1]['server_timing']
+
+
+def test_voice_endpoint_streams_ndjson(backend, stub_voice):
+    from app import create_app
+    voice.set_transcriber(voice.StubTranscriber())
+    intent.set_intent_classifier(StubIntentClassifier())
+    try:
+        client = create_app(warm=False).test_client()
+        response = client.post('/voice', data=b"How much protein do I need?",
+                               query_string={'user_id': USER_ID})
+        assert response.status_code == 200 and response.mimetype == 'application/x-ndjson'
+        events = parse_lines(response.get_data(as_text=True))
+    finally:
+        voice.set_transcriber(None)
+        intent.set_intent_classifier(None)
+    assert events[0] == {'type': 'transcript', 'text': "How much protein do I need?"}
+    assert events[-1]['type'] == 'done' and events[-1]['response']
+    assert {event['type'] for event in events[1:-1]} == {'audio'}
+
+
+def test_closing_the_event_stream_stops_the_answer(stub_voice):
+    read, closed = [], []
+
+    def answer():
+        try:
+            for i in range(1000):
+                time.sleep(0.002)
+                read.append(i)
+                yield f"Sentence {i} ends here. "
+        finally:
+            closed.append(True)
+
+    events = voice.voice_events('question', answer())
+    assert json.loads(next(events))['type'] == 'transcript'
+    assert json.loads(next(events))['type'] == 'audio'
+    events.close()  # What the server does when the client disconnects
+    for _ in range(100):
+        if closed:
+            break
+        time.sleep(0.01)
+    assert closed and len(read) < 1000
+
+
+def test_closed_stream_skips_the_history_write(backend):
+    pieces = stream_rag_agent("How much protein do I need?", USER_ID, False, intent='general question')
+    assert next(pieces)
+    pieces.close()
+    assert not [path for path in backend.db.docs if '/chat_history/' in path]
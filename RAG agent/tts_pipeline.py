@@ -0,0 +1,237 @@
+# tts_pipeline.py
+# Sentence-level text-to-speech: text is split at sentence boundaries and the
+# next chunk is synthesized on a worker thread while the current one plays, so
+# playback has no synthesis gap between chunks. Audio is cached by text hash.
+# The synthesizer (text -> audio bytes) and the player are injectable; gTTS and
+# the pygame mixer are imported only when the defaults are used.
+import contextvars
+import hashlib
+import os
+import queue
+import re
+import textwrap
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+MAX_CHUNK_CHARS = 200  # gTTS requests stay short; sentences are packed up to this
+LOOKAHEAD = 1  # Finished chunks queued ahead of the one playing
+STOP_CHECK_MS = 100  # How often a playing clip wakes to check stop_event
+CACHE_ENTRIES = 256
+_DONE = object()  # End-of-stream marker for the worker queues
+
+
+# ---------------------- Chunking ----------------------
+SENTENCE_END = re.compile(r'(?<=[.!?])(?<!\d\.)\s+|\s*\n\s*')  # Sentence ends and line breaks (list items)
+NOT_SPOKEN = re.compile(r'[*#_`>|~]+|[\u2600-\u27bf\U0001f000-\U0001faff\ufe0f]')
+LIST_MARKER = re.compile(r'^\s*(?:[-•]|\d+\.)\s+')
+
+
+def speakable(text):
+    # Drop markdown markers and emojis the answers are formatted with
+    return re.sub(r'\s+', ' ', NOT_SPOKEN.sub(' ', LIST_MARKER.sub('', text or ''))).strip()
+
+
+def _pack(sentences, max_chars):
+    # Sentences packed into chunks of at most max_chars; a longer sentence is
+    # split at word boundaries instead of mid-word
+    chunks, current = [], ''
+    for sentence in sentences:
+        pieces = textwrap.wrap(sentence, max_chars, break_long_words=False) if len(sentence) > max_chars else [sentence]
+        for piece in pieces:
+            if current and len(current) + 1 + len(piece) > max_chars:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_sentences(text, max_chars=MAX_CHUNK_CHARS):
+    return _pack([speakable(part) for part in SENTENCE_END.split(text or '') if speakable(part)], max_chars)
+
+
+def sentence_stream(deltas, max_chars=MAX_CHUNK_CHARS, stop_event=None):
+    # Chunks from streamed text (e.g. LLM deltas). A reader thread keeps
+    # draining the stream, and each chunk packs every sentence completed so
+    # far: the first chunk is out as soon as the first sentence ends, and
+    # later chunks grow while the previous one is being synthesized.
+    # Closing the generator (or setting stop_event) stops the reader after
+    # the delta it is waiting for, and the reader closes `deltas`.
+    pieces = queue.Queue()
+    stopped = stop_event or threading.Event()
+
+    def read():
+        try:
+            for delta in deltas:
+                if stopped.is_set():
+                    break
+                pieces.put(delta)
+            pieces.put(_DONE)
+        except Exception as e:
+            pieces.put(e)
+        finally:
+            close = getattr(deltas, 'close', None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=contextvars.copy_context().run, args=(read,), daemon=True).start()
+    buffer, finished = '', False
+    try:
+        while not finished:
+            items = [pieces.get()]
+            while not pieces.empty():
+                items.append(pieces.get())
+            for item in items:
+                if item is _DONE:
+                    finished = True
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    buffer += item
+            parts = SENTENCE_END.split(buffer)
+            buffer = parts.pop()
+            yield from _pack([speakable(part) for part in parts if speakable(part)], max_chars)
+        yield from split_sentences(buffer, max_chars)
+    finally:
+        stopped.set()
+
+
+# ---------------------- Cache ----------------------
+def audio_key(text, lang='en'):
+    return hashlib.sha256(f"{lang}\0{text}".encode('utf-8')).hexdigest()
+
+
+class AudioCache:
+    # In-memory LRU of synthesized audio keyed by audio_key
+    def __init__(self, max_entries=CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            audio = self.entries.get(key)
+            if audio is not None:
+                self.entries.move_to_end(key)
+            return audio
+
+    def put(self, key, audio):
+        with self.lock:
+            self.entries[key] = audio
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+_cache = AudioCache()
+
+
+# ---------------------- Synthesis ----------------------
+def gtts_synthesize(text, lang='en'):
+    from gtts import gTTS
+    with BytesIO() as mp3_file:
+        gTTS(text=text, lang=lang).write_to_fp(mp3_file)
+        return mp3_file.getvalue()
+
+
+def cached_synthesize(text, synthesize=gtts_synthesize, cache=_cache, lang='en'):
+    key = audio_key(text, lang)
+    audio = cache.get(key) if cache is not None else None
+    if audio is None:
+        audio = synthesize(text, lang)
+        if cache is not None:
+            cache.put(key, audio)
+    return audio
+
+
+
+def synthesize_stream(chunks, synthesize=gtts_synthesize, cache=_cache, lang='en', lookahead=LOOKAHEAD):
+    # Yields (chunk, audio) in order. A worker thread pulls chunks (which may
+    # come from a streaming LLM) and synthesizes them while the caller handles
+    # the current one; closing the generator stops the worker. The worker runs
+    # in a copy of the caller's context, so request-scoped state follows it.
+    results = queue.Queue(maxsize=lookahead)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if not put((chunk, cached_synthesize(chunk, synthesize, cache, lang))):
+                    return
+            put(_DONE)
+        except Exception as e:
+            put(e)
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=contextvars.copy_context().run, args=(produce,), daemon=True).start()
+    try:
+        while True:
+            item = results.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+
+
+def synthesize_chunks(text, synthesize=gtts_synthesize, cache=_cache, lang='en', lookahead=LOOKAHEAD):
+    return synthesize_stream(iter(split_sentences(text)), synthesize, cache, lang, lookahead)
+
+
+# ---------------------- Playback ----------------------
+class MixerPlayer:
+    # Plays audio bytes through pygame.mixer.music. The mixer posts END_EVENT
+    # when a clip finishes (set_endevent) and play() blocks on the event queue
+    # until it arrives; the wait wakes every STOP_CHECK_MS only to see whether
+    # stop_event was set. music/events default to pygame.mixer.music/pygame.event.
+    def __init__(self, music=None, events=None, end_event=None):
+        if music is None or events is None or end_event is None:
+            import pygame
+            if not pygame.display.get_init():
+                # The event queue needs a video driver; the dummy one opens no window
+                os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+                pygame.display.init()
+            if not pygame.mixer.get_init():
+                pygame.mixer.init()
+            music = music or pygame.mixer.music
+            events = events or pygame.event
+            end_event = end_event or pygame.USEREVENT + 1
+        self.music = music
+        self.events = events
+        self.end_event = end_event
+        self.music.set_endevent(end_event)
+
+    def play(self, audio, stop_event=None):
+        self.events.clear(self.end_event)  # stop() on the previous clip also posts one
+        self.music.load(BytesIO(audio))
+        self.music.play()
+        while self.events.wait(STOP_CHECK_MS).type != self.end_event:
+            if stop_event is not None and stop_event.is_set():
+                self.music.stop()
+                return
+
+
+def speak(text, synthesize=gtts_synthesize, player=None, cache=_cache, lang='en', stop_event=None):
+    # Blocks until the whole text has played, or until stop_event is set
+    player = player or MixerPlayer()
+    for _, audio in synthesize_chunks(text, synthesize, cache, lang):
+        if stop_event is not None and stop_event.is_set():
+            break
+        player.play(audio, stop_event)
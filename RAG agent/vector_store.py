@@ -3,29 +3,120 @@
 
 # vector_store.py
 import os
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+import threading
 from langchain_chroma import Chroma
 from tqdm import tqdm
-from config import PERSIST_DIRECTORY, BATCH_SIZE
-from data_processing import load_all_documents
+from config import PERSIST_DIRECTORY, MMAP_INDEX_DIRECTORY, BATCH_SIZE, configure_genai
+from data_processing import allergen_flags, load_all_documents
 
-# Initialize the embedding function
-embeddings = GoogleGenerativeAIEmbeddings(model='models/embedding-001')
+RETRIEVER_K = 20
+# Version of the document metadata (data_processing.food_metadata), kept in the
+# collection metadata; bump it when the metadata changes so old stores are rebuilt
+INDEX_SCHEMA_VERSION = 2
+SCHEMA_VERSION_KEY = 'index_schema_version'
 
-def get_vector_store():
-    if os.path.exists(PERSIST_DIRECTORY):
+# The embedding function is created on first use (like the LLM clients)
+_lock = threading.Lock()
+_embeddings = None
+
+def get_embeddings():
+    global _embeddings
+    if _embeddings is None:
+        with _lock:
+            if _embeddings is None:
+                from langchain_google_genai import GoogleGenerativeAIEmbeddings
+                configure_genai()
+                _embeddings = GoogleGenerativeAIEmbeddings(model='models/embedding-001')
+    return _embeddings
+
+def get_vector_store(persist_directory=PERSIST_DIRECTORY, embedding_function=None):
+    embeddings = embedding_function or get_embeddings()
+    existed = os.path.exists(persist_directory)
+    # The version is only written when the collection is created, so a store
+    # persisted before it (or with an older one) reads back something else
+    vectordb = Chroma(persist_directory=persist_directory, embedding_function=embeddings,
+                      collection_metadata={SCHEMA_VERSION_KEY: INDEX_SCHEMA_VERSION})
+    version = stored_schema_version(vectordb)
+    if existed and version == INDEX_SCHEMA_VERSION:
         print("Loading existing vector store...")
-        vectordb = Chroma(persist_directory=PERSIST_DIRECTORY, embedding_function=embeddings)
-        retriever = vectordb.as_retriever(search_kwargs={"k": 20})
+        retriever = vectordb.as_retriever(search_kwargs={"k": RETRIEVER_K})
         print("✅ Vector store loaded successfully!")
     else:
-        print("Creating new vector store...")
-        vectordb = Chroma(persist_directory=PERSIST_DIRECTORY, embedding_function=embeddings)
+        if existed:
+            # Its documents lack the metadata food_filter matches on
+            print(f"Vector store schema is {version}, expected {INDEX_SCHEMA_VERSION}; rebuilding...")
+            vectordb.reset_collection()
+        else:
+            print("Creating new vector store...")
         all_documents = load_all_documents(BATCH_SIZE)
         print("\n💾 Adding documents to vector store...")
         for i in tqdm(range(0, len(all_documents), BATCH_SIZE), desc="Embedding"):
             batch = all_documents[i:i + BATCH_SIZE]
             vectordb.add_documents(batch)
         print("\n✅ Vector store creation completed!")
-        retriever = vectordb.as_retriever(search_kwargs={"k": 20})
+        retriever = vectordb.as_retriever(search_kwargs={"k": RETRIEVER_K})
     return retriever, vectordb
+
+def stored_schema_version(vectordb):
+    return (vectordb._collection.metadata or {}).get(SCHEMA_VERSION_KEY)
+
+# ---------------------- Metadata Filters ----------------------
+def food_filter(exclude_allergens=(), category=None, max_calories=None, min_protein_g=None):
+    # Chroma `where` clause over the metadata written by data_processing.food_metadata
+    clauses = [{flag: False} for flag in exclude_allergens]
+    if category:
+        clauses.append({'category': category})
+    if max_calories is not None:
+        clauses.append({'calories': {'$lte': float(max_calories)}})
+    if min_protein_g is not None:
+        clauses.append({'protein_g': {'$gte': float(min_protein_g)}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+
+def get_filtered_retriever(vectordb, where=None, k=5):
+    # The filter runs inside the Chroma query, so k only needs to cover the results actually used
+    search_kwargs = {"k": k}
+    if where:
+        search_kwargs["filter"] = where
+    return vectordb.as_retriever(search_kwargs=search_kwargs)
+
+# The food store used for meal plans, opened (or built) on first use
+_store_lock = threading.Lock()
+_food_store = None
+
+def get_food_store():
+    global _food_store
+    if _food_store is None:
+        with _store_lock:
+            if _food_store is None:
+                _food_store = get_vector_store()[1]
+    return _food_store
+
+def set_food_store(vectordb):
+    # Swap in another store (e.g. the benchmarks' synthetic one)
+    global _food_store
+    with _store_lock:
+        _food_store = vectordb
+
+# ---------------------- Memory-Mapped Index ----------------------
+_mmap_index = None
+
+def get_mmap_retriever(index_directory=MMAP_INDEX_DIRECTORY, embedding_function=None, where=None, k=5, nprobe=None):
+    # Same results shape as get_filtered_retriever, served from the read-only
+    # index that mmap_index.py builds; opened once per process
+    global _mmap_index
+    from mmap_index import MmapIndex, MmapRetriever
+    if _mmap_index is None:
+        with _lock:
+            if _mmap_index is None:
+                index = MmapIndex(index_directory)
+                version = index.info.get('schema_version')
+                if version != INDEX_SCHEMA_VERSION:
+                    raise ValueError(f"{index_directory} was built from a schema {version} store, expected "
+                                     f"{INDEX_SCHEMA_VERSION}; rebuild it with mmap_index.py")
+                _mmap_index = index
+    return MmapRetriever(
+        index=_mmap_index, embeddings=embedding_function or get_embeddings(),
+        k=k, nprobe=nprobe, filter=where,
+    )
@@ -0,0 +1,212 @@
+# voice.py
+# Backends for the /voice endpoint. Speech-to-text and text-to-speech are
+# pluggable, picked with STT_BACKEND / TTS_BACKEND ('google' / 'gtts' by
+# default, 'stub' for local runs and benchmarks), and created on first use
+# like the LLM clients. Synthesized sentences are cached on disk under their
+# content hash, so repeated phrases ("Your meal plan has been saved.") are
+# synthesized once per deployment instead of once per request.
+import base64
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from io import BytesIO
+from metrics import finish_request_trace, registry, server_timing_header, start_request_trace, timed
+from tts_pipeline import AudioCache, audio_key, gtts_synthesize, sentence_stream, synthesize_stream
+
+# Outside the working directory, so a run from the source tree doesn't write audio into it
+TTS_CACHE_DIRECTORY = os.environ.get('TTS_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'rag_tts_cache'))
+MEMORY_CACHE_ENTRIES = 512  # Hot phrases kept in process on top of the disk cache
+
+_lock = threading.Lock()
+_transcriber = None
+_synthesizer = None
+_cache = None
+
+
+# ---------------------- Speech-to-Text ----------------------
+class GoogleTranscriber:
+    # speech_recognition's Google Web Speech API; expects WAV/AIFF/FLAC bytes
+    def __init__(self, language='en-US'):
+        import speech_recognition as sr
+        self.sr = sr
+        self.recognizer = sr.Recognizer()
+        self.language = language
+
+    def __call__(self, audio_bytes):
+        with self.sr.AudioFile(BytesIO(audio_bytes)) as source:
+            audio = self.recognizer.record(source)
+        try:
+            return self.recognizer.recognize_google(audio, language=self.language)
+        except self.sr.UnknownValueError:
+            return ''
+
+
+class StubTranscriber:
+    # The upload is taken to be the transcript itself (UTF-8 text), after an
+    # optional delay standing in for recognition time
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def __call__(self, audio_bytes):
+        time.sleep(self.latency)
+        return audio_bytes.decode('utf-8', errors='ignore').strip()
+
+
+def get_transcriber():
+    global _transcriber
+    if _transcriber is None:
+        with _lock:
+            if _transcriber is None:
+                if os.environ.get('STT_BACKEND', 'google') == 'stub':
+                    _transcriber = StubTranscriber(float(os.environ.get('STT_STUB_LATENCY', '0')))
+                else:
+                    _transcriber = GoogleTranscriber()
+    return _transcriber
+
+
+def set_transcriber(transcriber):
+    global _transcriber
+    _transcriber = transcriber
+
+
+# ---------------------- Text-to-Speech ----------------------
+class StubSynthesizer:
+    # Returns the text as "audio" after a fixed delay plus a per-character delay
+    def __init__(self, latency=0.0, per_char=0.0):
+        self.latency = latency
+        self.per_char = per_char
+
+    def __call__(self, text, lang='en'):
+        time.sleep(self.latency + self.per_char * len(text))
+        return text.encode('utf-8')
+
+
+def get_synthesizer():
+    global _synthesizer
+    if _synthesizer is None:
+        with _lock:
+            if _synthesizer is None:
+                if os.environ.get('TTS_BACKEND', 'gtts') == 'stub':
+                    _synthesizer = StubSynthesizer(float(os.environ.get('TTS_STUB_LATENCY', '0')))
+                else:
+                    _synthesizer = gtts_synthesize
+    return _synthesizer
+
+
+def set_synthesizer(synthesizer):
+    global _synthesizer
+    _synthesizer = synthesizer
+
+
+class DiskAudioCache:
+    # Content-addressed: <directory>/<key[:2]>/<key>.mp3, written atomically so
+    # workers can share the directory. A small in-process LRU sits in front.
+    def __init__(self, directory=TTS_CACHE_DIRECTORY, memory_entries=MEMORY_CACHE_ENTRIES):
+        self.directory = directory
+        self.memory = AudioCache(memory_entries)
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.mp3")
+
+    def get(self, key):
+        audio = self.memory.get(key)
+        if audio is None:
+            try:
+                with open(self.path(key), 'rb') as f:
+                    audio = f.read()
+            except OSError:
+                registry.increment('tts_cache_total', (('result', 'miss'),), help_text='TTS cache lookups')
+                return None
+            self.memory.put(key, audio)
+        registry.increment('tts_cache_total', (('result', 'hit'),), help_text='TTS cache lookups')
+        return audio
+
+    def put(self, key, audio):
+        self.memory.put(key, audio)
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not write TTS cache entry {key}: {e}")
+
+
+def get_audio_cache():
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = DiskAudioCache()
+    return _cache
+
+
+def set_audio_cache(cache):
+    global _cache
+    _cache = cache
+
+
+# ---------------------- Reply Stream ----------------------
+def transcribe(audio_bytes):
+    with timed('stt'):
+        return get_transcriber()(audio_bytes)
+
+
+def voice_events(transcript, answer_pieces, lang='en'):
+    # NDJSON lines for /voice: the transcript, then one line per synthesized
+    # sentence (as soon as the LLM has produced it), then the full answer text.
+    # The response headers (and their Server-Timing) are sent before the
+    # answer is streamed, so the 'done' line carries the streamed stages' timing.
+    start = time.perf_counter()
+    trace_token = start_request_trace()
+    yield json.dumps({'type': 'transcript', 'text': transcript}) + '\n'
+
+    answer = []
+
+    def tracked(pieces):
+        try:
+            for piece in pieces:
+                answer.append(piece)
+                yield piece
+        finally:
+            # Closing the answer generator stops its LLM stream and history write
+            close = getattr(pieces, 'close', None)
+            if close is not None:
+                close()
+
+    # Set when the client goes away (the response iterator is closed), so the
+    # answer stops being read from the LLM instead of running to the end
+    stop = threading.Event()
+    synthesizer = get_synthesizer()
+
+    def synthesize(text, lang):
+        with timed('tts'):  # Cache misses only
+            return synthesizer(text, lang)
+
+    audio_stream = synthesize_stream(sentence_stream(tracked(answer_pieces), stop_event=stop), synthesize,
+                                     get_audio_cache(), lang)
+    first = True
+    try:
+        for sentence, audio in audio_stream:
+            if first:
+                registry.histogram(
+                    'voice_first_audio_seconds', (), 'Time from transcript to the first synthesized sentence'
+                ).observe(time.perf_counter() - start)
+                first = False
+            yield json.dumps({
+                'type': 'audio', 'text': sentence, 'format': 'mp3',
+                'audio': base64.b64encode(audio).decode('ascii'), 'key': audio_key(sentence, lang),
+            }) + '\n'
+    finally:
+        stop.set()
+        audio_stream.close()
+        trace = finish_request_trace(trace_token)
+    yield json.dumps({
+        'type': 'done', 'response': ''.join(answer).rstrip('\n'),
+        'server_timing': server_timing_header(trace, time.perf_counter() - start),
+    }) + '\n'
@@ -1,8 +1,6 @@
 import os
 import google.generativeai as genai
 import speech_recognition as sr
-from gtts import gTTS
-from io import BytesIO
 from pygame import mixer
 from dotenv import load_dotenv
 from datetime import date
@@ -25,6 +23,9 @@ from concurrent.futures import ThreadPoolExecutor
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 from google.api_core.exceptions import ResourceExhausted
 
+# tts_pipeline lives in "RAG agent": run with PYTHONPATH="RAG agent" python nutrition_rag.py
+from tts_pipeline import MixerPlayer, speak
+
 # ---------------------- Firebase & Environment Setup ----------------------
 cred = credentials.Certificate("serviceAccountKey.json")
 firebase_admin.initialize_app(cred)
@@ -161,28 +162,9 @@ qa_chain = RetrievalQA.from_chain_type(
 
 # ---------------------- Helper Functions ----------------------
 def speak_text(text):
+    # Sentence chunks, next chunk synthesized while the current one plays
     try:
-        cleaned_text = text.replace('\n', ' ').strip()
-        if len(cleaned_text) > 200:
-            chunks = [cleaned_text[i:i+200] for i in range(0, len(cleaned_text), 200)]
-            for chunk in chunks:
-                tts = gTTS(text=chunk, lang='en')
-                with BytesIO() as mp3_file:
-                    tts.write_to_fp(mp3_file)
-                    mp3_file.seek(0)
-                    mixer.music.load(mp3_file)
-                    mixer.music.play()
-                    while mixer.music.get_busy():
-                        pass
-        else:
-            tts = gTTS(text=cleaned_text, lang='en')
-            with BytesIO() as mp3_file:
-                tts.write_to_fp(mp3_file)
-                mp3_file.seek(0)
-                mixer.music.load(mp3_file)
-                mixer.music.play()
-                while mixer.music.get_busy():
-                    pass
+        speak(text, player=MixerPlayer(mixer.music))
     except Exception as e:
         print(f"Error speaking text: {e}")
 
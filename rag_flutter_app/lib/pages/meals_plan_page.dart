@@ -277,6 +277,15 @@ class _MealsPlanPageState extends State<MealsPlanPage> {
         });
       } catch (e) {
         print('Error saving calories consumed: $e');
+        return;
+      }
+      // Keep the server-side progress rollups current (best effort: the
+      // compaction job catches up on missed days)
+      try {
+        await apiService.recordProgress(DateFormat('yyyy-MM-dd').format(selectedDate),
+            caloriesConsumed: caloriesConsumed);
+      } catch (e) {
+        print('Error recording progress: $e');
       }
     }
   }
@@ -8,6 +8,7 @@ import 'package:health/health.dart';
 import 'package:permission_handler/permission_handler.dart';
 import 'dart:io';
 import '/services/globals.dart';
+import '/services/api_service.dart';
 
 class ProgressPage extends StatefulWidget {
   const ProgressPage({super.key});
@@ -43,6 +44,8 @@ class _ProgressPageState extends State<ProgressPage> {
     'Be consistent: "Success doesn’t come from what you do occasionally, it comes from what you do consistently."',
   ];
 
+  ApiService apiService = ApiService(baseUrl: 'http://127.0.0.1:5000');
+
   // Initialize HealthFactory for accessing health data
   final health = Health();
 
@@ -86,22 +89,13 @@ class _ProgressPageState extends State<ProgressPage> {
       final now = DateTime.now();
       final startDate = DateTime(now.year, now.month, now.day - 6);
 
-      // Fetch calories consumed data for the last 7 days from Firestore
-      final startTimestamp = Timestamp.fromDate(startDate);
-      final caloriesConsumedData = await FirebaseFirestore.instance
-          .collection('users')
-          .doc(currentUser.uid)
-          .collection('calories_consumed')
-          .where('date', isGreaterThanOrEqualTo: startTimestamp)
-          .orderBy('date', descending: false)
-          .get();
+      // Fetch pre-aggregated progress for the last 7 days (one point per day)
+      final progressPoints = await _fetchProgressPoints(startDate, now);
 
       Map<DateTime, double> caloriesConsumedMap = {};
-      for (var doc in caloriesConsumedData.docs) {
-        DateTime date = (doc.data()['date'] as Timestamp).toDate();
-        date = DateTime(date.year, date.month, date.day); // Normalize to midnight
-        double calories = doc.data()['calories_consumed'].toDouble();
-        caloriesConsumedMap[date] = calories; // Assumes one entry per day; sum if multiple
+      for (var point in progressPoints) {
+        DateTime date = DateTime.parse(point['date']); // Midnight of that day
+        caloriesConsumedMap[date] = (point['calories_consumed'] as num).toDouble();
       }
 
       // Fetch health data for the last 7 days
@@ -118,8 +112,10 @@ class _ProgressPageState extends State<ProgressPage> {
         caloriesBurntSpots.add(FlSpot(i.toDouble(), burnt));
       }
 
-      // Fetch exercise completion data
-      List<double> exerciseCompletionPercentages = await _fetchExerciseCompletionData(startDate, now);
+      // Exercise completion percentages come from the same points
+      List<double> exerciseCompletionPercentages = progressPoints
+          .map((point) => (point['exercise_completion_pct'] as num).toDouble())
+          .toList();
 
       setState(() {
         _caloriesConsumedSpots = caloriesConsumedSpots;
@@ -215,43 +211,59 @@ class _ProgressPageState extends State<ProgressPage> {
     }
   }
 
-  Future<List<double>> _fetchExerciseCompletionData(DateTime startDate, DateTime now) async {
+  // Daily points from the server rollups; if the server can't be reached the
+  // same points are built from the Firestore event collections
+  Future<List<Map<String, dynamic>>> _fetchProgressPoints(DateTime startDate, DateTime now) async {
     try {
-      final currentUser = FirebaseAuth.instance.currentUser;
-      if (currentUser == null) {
-        throw 'No user is logged in';
+      return await apiService.getProgress(
+          DateFormat('yyyy-MM-dd').format(startDate), DateFormat('yyyy-MM-dd').format(now));
+    } catch (e) {
+      debugPrint('Error fetching progress from server, reading Firestore: $e');
+    }
+
+    final userRef = FirebaseFirestore.instance
+        .collection('users')
+        .doc(FirebaseAuth.instance.currentUser!.uid);
+    final startTimestamp = Timestamp.fromDate(startDate);
+    Map<DateTime, double> caloriesMap = {};
+    Map<DateTime, double> completionMap = {};
+    try {
+      final caloriesConsumedData = await userRef
+          .collection('calories_consumed')
+          .where('date', isGreaterThanOrEqualTo: startTimestamp)
+          .orderBy('date', descending: false)
+          .get();
+      for (var doc in caloriesConsumedData.docs) {
+        DateTime date = (doc.data()['date'] as Timestamp).toDate();
+        date = DateTime(date.year, date.month, date.day); // Normalize to midnight
+        caloriesMap[date] = (doc.data()['calories_consumed'] as num? ?? 0).toDouble();
       }
 
-      final exerciseCompletionData = await FirebaseFirestore.instance
-          .collection('users')
-          .doc(currentUser.uid)
+      final exerciseCompletionData = await userRef
           .collection('exercise_completions')
-          .where('date', isGreaterThanOrEqualTo: Timestamp.fromDate(startDate))
+          .where('date', isGreaterThanOrEqualTo: startTimestamp)
           .orderBy('date', descending: false)
           .get();
-
-      Map<DateTime, double> completionMap = {};
       for (var doc in exerciseCompletionData.docs) {
         DateTime date = (doc.data()['date'] as Timestamp).toDate();
         date = DateTime(date.year, date.month, date.day); // Normalize to midnight
         Map<String, dynamic> completedExercises = doc.data()['completed_exercises'] ?? {};
         int totalExercises = completedExercises.length;
         int completedCount = completedExercises.values.where((v) => v == true).length;
-        double completionPercentage = totalExercises > 0 ? (completedCount / totalExercises) * 100 : 0.0;
-        completionMap[date] = completionPercentage;
-      }
-
-      List<double> completionPercentages = [];
-      for (int i = 0; i < 7; i++) {
-        DateTime day = startDate.add(Duration(days: i));
-        completionPercentages.add(completionMap[day] ?? 0.0); // Default to 0% if no data
+        completionMap[date] = totalExercises > 0 ? (completedCount / totalExercises) * 100 : 0.0;
       }
-
-      return completionPercentages;
     } catch (e) {
-      debugPrint('Error fetching exercise completion data: $e');
-      return List.filled(7, 0.0); // Return 0% for all days in case of error
+      debugPrint('Error fetching progress from Firestore: $e');
     }
+
+    return List.generate(7, (i) {
+      DateTime day = startDate.add(Duration(days: i));
+      return {
+        'date': DateFormat('yyyy-MM-dd').format(day),
+        'calories_consumed': caloriesMap[day] ?? 0.0,
+        'exercise_completion_pct': completionMap[day] ?? 0.0,
+      };
+    });
   }
 
   int _dayOfYear(DateTime date) {
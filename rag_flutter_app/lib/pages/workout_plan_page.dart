@@ -555,7 +555,6 @@ class _WorkoutPlanPageState extends State<WorkoutPlanPage> {
         'date': targetDate,
         'completed_exercises': completedExercises,
       });
-
       await FirebaseFirestore.instance.collection('users').doc(userId).update({
         'consistencyStreak': newStreak,
         'lastStreakDate': newLastStreakDate != null 
@@ -566,6 +565,15 @@ class _WorkoutPlanPageState extends State<WorkoutPlanPage> {
             ? Timestamp.fromDate(newHighestStreakDate)
             : null,
       });
+
+      // Keep the server-side progress rollups current (best effort: the
+      // compaction job catches up on missed days)
+      try {
+        await apiService.recordProgress(DateFormat('yyyy-MM-dd').format(targetDate),
+            completedExercises: completedExercises);
+      } catch (e) {
+        print('Error recording progress: $e');
+      }
     } catch (e) {
       print('Error saving exercises: $e');
     }
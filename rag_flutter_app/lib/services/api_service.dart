@@ -27,4 +27,42 @@ class ApiService {
       throw Exception('Failed to get data from API');
     }
   }
+
+  // Pre-aggregated progress points between two dates (yyyy-MM-dd)
+  Future<List<Map<String, dynamic>>> getProgress(String startDate, String endDate,
+      {String granularity = 'day'}) async {
+    final uri = Uri.parse('$baseUrl/progress').replace(queryParameters: {
+      'user_id': FirebaseAuth.instance.currentUser?.uid ?? '',
+      'start_date': startDate,
+      'end_date': endDate,
+      'granularity': granularity,
+    });
+    final response = await http.get(uri);
+
+    if (response.statusCode == 200) {
+      final Map<String, dynamic> data = json.decode(response.body);
+      return List<Map<String, dynamic>>.from(data['points']);
+    } else {
+      throw Exception('Failed to get progress from API');
+    }
+  }
+
+  // Folds a saved day into the server-side progress rollups
+  Future<void> recordProgress(String date,
+      {num? caloriesConsumed, Map<String, dynamic>? completedExercises}) async {
+    final response = await http.post(
+      Uri.parse('$baseUrl/progress/events'),
+      headers: {'Content-Type': 'application/json'},
+      body: jsonEncode({
+        'user_id': FirebaseAuth.instance.currentUser?.uid,
+        'date': date,
+        if (caloriesConsumed != null) 'calories_consumed': caloriesConsumed,
+        if (completedExercises != null) 'completed_exercises': completedExercises,
+      }),
+    );
+
+    if (response.statusCode != 200) {
+      throw Exception('Failed to record progress');
+    }
+  }
 }